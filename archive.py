@@ -0,0 +1,156 @@
+import copy
+import os
+import struct
+from itertools import chain
+from metrics import stage
+from progress import check_cancelled
+from sub_core import SUBTITLE_EXTENSIONS, atomic_open
+
+ARCHIVE_EXTENSIONS = ('.zip',)
+
+# zip 本地文件头：固定 30 字节，其后为文件名与扩展字段
+_LOCAL_HEADER_SIGNATURE = b'PK\x03\x04'
+_LOCAL_HEADER_SIZE = 30
+# 通用标志位 bit 3：CRC 与大小写在数据之后的数据描述符中
+_FLAG_DATA_DESCRIPTOR = 0x08
+# 重新压缩的成员沿用原压缩方式，其余方式（bzip2、lzma 等）改用 deflate
+_REWRITE_METHODS = (0, 8)
+# ZIP64 扩展字段：写出时由 zipfile 按需重新生成，沿用中央目录中的旧字段会在本地文件头中重复
+_EXTRA_ZIP64 = 0x0001
+# _copy_raw 依赖的 ZipFile 内部属性，缺少任何一个时（其他 Python 版本或实现）退回到解压后重新写入
+_RAW_COPY_ATTRIBUTES = ('_lock', 'fp', 'start_dir', '_writecheck', '_didModify', 'filelist', 'NameToInfo')
+
+
+def is_archive(filepath):
+    return filepath.lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def _can_copy_raw(zout):
+    return all(hasattr(zout, name) for name in _RAW_COPY_ATTRIBUTES)
+
+
+def _strip_zip64(extra):
+    fields = []
+    pos = 0
+    while pos + 4 <= len(extra):
+        field_id, size = struct.unpack_from('<HH', extra, pos)
+        if field_id != _EXTRA_ZIP64:
+            fields.append(extra[pos:pos + 4 + size])
+        pos += 4 + size
+    return b''.join(fields)
+
+
+def _copied_info(info):
+    member = copy.copy(info)
+    # CRC 与大小已知，直接写在本地文件头中，不再写数据描述符
+    member.flag_bits &= ~_FLAG_DATA_DESCRIPTOR
+    member.extra = _strip_zip64(info.extra)
+    return member
+
+
+def _copy_member(zin, zout, info):
+    """
+    无法原样复制压缩数据时，解压后按原压缩方式与属性重新写入。
+    """
+    with stage('read'):
+        data = zin.read(info)
+    with stage('write'):
+        zout.writestr(_copied_info(info), data)
+
+
+def _copy_raw(source, zout, info):
+    """
+    按原始压缩数据复制成员，不解压也不重新压缩。source 为以二进制模式打开的源压缩包。
+    """
+    source.seek(info.header_offset)
+    header = source.read(_LOCAL_HEADER_SIZE)
+    if len(header) != _LOCAL_HEADER_SIZE or not header.startswith(_LOCAL_HEADER_SIGNATURE):
+        raise ValueError(f"压缩包已损坏，无法读取 {info.filename}")
+    name_length, extra_length = struct.unpack('<HH', header[26:])
+    source.seek(name_length + extra_length, os.SEEK_CUR)
+
+    member = _copied_info(info)
+    # zipfile 没有原样复制压缩数据的公开接口，以下按 ZipFile.mkdir 写入成员的方式追加文件头与数据
+    with zout._lock:
+        zout.fp.seek(zout.start_dir)
+        member.header_offset = zout.fp.tell()
+        zout._writecheck(member)
+        zout._didModify = True
+        zout.filelist.append(member)
+        zout.NameToInfo[member.filename] = member
+        with stage('write'):
+            zout.fp.write(member.FileHeader())
+            remaining = info.compress_size
+            while remaining > 0:
+                chunk = source.read(min(remaining, 1024 * 1024))
+                if not chunk:
+                    raise ValueError(f"压缩包已损坏，{info.filename} 的数据不完整")
+                zout.fp.write(chunk)
+                remaining -= len(chunk)
+        zout.start_dir = zout.fp.tell()
+
+
+def _write_member(zout, info, name, data):
+    import zipfile
+    member = zipfile.ZipInfo(name, date_time=info.date_time)
+    member.compress_type = info.compress_type if info.compress_type in _REWRITE_METHODS else zipfile.ZIP_DEFLATED
+    member.create_system = info.create_system
+    member.external_attr = info.external_attr
+    member.comment = info.comment
+    with stage('write'):
+        zout.writestr(member, data)
+
+
+def _iter_members(zin, transform, extensions, rename):
+    # 产出 (成员, 输出中的名称, 新内容)；新内容为 None 表示按原始压缩数据复制
+    for info in zin.infolist():
+        check_cancelled()
+        if info.is_dir() or not info.filename.lower().endswith(extensions):
+            yield info, info.filename, None
+            continue
+        with stage('read'):
+            data = zin.read(info)
+        try:
+            result = transform(data, info.filename)
+        except Exception as e:
+            raise ValueError(f"{info.filename}: {e}") from e
+        name = info.filename if rename is None else rename(info.filename)
+        yield info, name, None if name == info.filename and result == data else result
+
+
+def rewrite_archive(src_path, dst_path, transform, extensions=SUBTITLE_EXTENSIONS, rename=None):
+    """
+    不解压到磁盘，直接处理 zip 压缩包中的字幕并写出新的压缩包，返回是否写入了文件。
+
+    - transform(data, name): 处理扩展名匹配 extensions 的成员，data 为解压后的 bytes，返回新内容
+    - rename(name): 返回处理后的成员在新压缩包中的名称（例如 SRT 转 ASS），默认不变
+    - 其余成员以及处理后内容不变的成员按原始压缩数据复制，不解压也不重新压缩
+      （zipfile 缺少所需的内部属性时退回到解压后按原压缩方式重新写入）
+    - 原地处理（dst_path 与 src_path 相同）且没有任何成员发生变化时不写入；
+      与 shift_file 相同，在第一个变化的成员之前不创建临时文件，出错时原压缩包保持不变
+    """
+    import zipfile
+    in_place = os.path.abspath(src_path) == os.path.abspath(dst_path)
+    with zipfile.ZipFile(src_path) as zin, open(src_path, 'rb') as source:
+        members = _iter_members(zin, transform, tuple(ext.lower() for ext in extensions), rename)
+        unchanged = []
+        for member in members:
+            unchanged.append(member)
+            if member[2] is not None:
+                break
+        else:
+            if in_place:
+                return False
+
+        with atomic_open(dst_path, binary=True) as outfile:
+            with zipfile.ZipFile(outfile, 'w') as zout:
+                raw = _can_copy_raw(zout)
+                for info, name, data in chain(unchanged, members):
+                    if data is None and raw:
+                        _copy_raw(source, zout, info)
+                    elif data is None:
+                        _copy_member(zin, zout, info)
+                    else:
+                        _write_member(zout, info, name, data)
+                zout.comment = zin.comment
+    return True
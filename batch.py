@@ -0,0 +1,222 @@
+import os
+from concurrent.futures import FIRST_COMPLETED, as_completed, wait
+from functools import partial
+from metrics import measure, unpack
+from progress import CANCELLED, CANCELLED_REASON, FAILED, FINISHED, STARTED, ProgressEvent, install
+
+# 监视模式下等待文件变化的最长时间（秒）：有处理中的文件时缩短，以便及时收集结果
+_WATCH_IDLE_WAIT = 1.0
+_WATCH_BUSY_WAIT = 0.02
+
+
+def default_jobs():
+    """
+    默认并行进程数：CPU 核心数。
+    """
+    return os.cpu_count() or 1
+
+
+def parse_jobs(value):
+    """
+    解析 --jobs 参数，未提供时使用 CPU 核心数。
+    """
+    if value is None or value == "":
+        return default_jobs()
+    jobs = int(value)
+    if jobs < 1:
+        raise ValueError("--jobs 必须是大于 0 的整数")
+    return jobs
+
+
+def file_size(filepath):
+    try:
+        return os.path.getsize(filepath)
+    except OSError:
+        return 0
+
+
+def largest_first(filepaths):
+    """
+    按文件大小从大到小排序，避免单个大文件在最后才开始处理而拖长整体耗时。
+    """
+    return sorted(filepaths, key=file_size, reverse=True)
+
+
+def _collect(future):
+    try:
+        return future.result()
+    except Exception as e:
+        return False, str(e)
+
+
+def _init_worker(cancel, initializer, initargs):
+    install(cancel)
+    if initializer is not None:
+        initializer(*initargs)
+
+
+def run_jobs(worker, tasks, jobs=None, initializer=None, initargs=(), on_start=None, cancel=None):
+    """
+    在进程池中执行 worker(*task)，按完成顺序产出 (task, result)。
+
+    tasks 可以是惰性的可迭代对象（例如边遍历目录边产出的文件），任务会在产生后立即提交，
+    同时在途任务数限制为进程数的两倍，避免一次性把海量任务堆进队列。
+    jobs 为 1 或只有一个任务时直接在当前进程中执行，省去进程池的启动开销。
+    worker 需为模块级函数；子进程异常退出等进程池错误会以 (False, 原因) 的形式作为结果返回。
+    on_start(task) 在任务提交到进程池（单进程时为开始执行）时调用。
+    cancel 为 progress.CancelToken：取消后不再提交新任务，已提交但未开始的任务直接丢弃（不产出结果），
+    正在执行的任务在处理下一个数据块前中止，以 (False, "已取消") 返回。
+    """
+    jobs = default_jobs() if jobs is None else jobs
+    sized = isinstance(tasks, (list, tuple))
+    if jobs <= 1 or (sized and len(tasks) <= 1):
+        install(cancel)
+        try:
+            for task in tasks:
+                if cancel is not None and cancel.cancelled():
+                    break
+                if on_start is not None:
+                    on_start(task)
+                yield task, worker(*task)
+        finally:
+            install(None)
+        return
+
+    # 进程池相关模块导入较慢，只在确实需要并行时才加载
+    from concurrent.futures import ProcessPoolExecutor
+    max_workers = min(jobs, len(tasks)) if sized else jobs
+    if cancel is not None:
+        # 取消标记只能在创建子进程时传入
+        initializer, initargs = _init_worker, (cancel, initializer, initargs)
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=initializer, initargs=initargs) as pool:
+        pending = {}
+        for task in tasks:
+            if len(pending) >= max_workers * 2:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield pending.pop(future), _collect(future)
+            if cancel is not None and cancel.cancelled():
+                break
+            if on_start is not None:
+                on_start(task)
+            pending[pool.submit(worker, *task)] = task
+        for future in as_completed(pending):
+            if cancel is not None and cancel.cancelled():
+                for other in pending:
+                    other.cancel()
+            if not future.cancelled():
+                yield pending[future], _collect(future)
+
+
+def run_batch(worker, tasks, jobs=None, report=None, progress=None, cancel=None, initializer=None, initargs=()):
+    """
+    批量处理文件：worker 返回 (是否成功, 失败原因)，每个任务的第一项为文件路径。按完成顺序产出 (task, 是否成功, 失败原因)。
+    report 为 metrics.Report，记录每个文件的统计；progress 为回调函数，接收每个文件的 ProgressEvent；
+    cancel 为 progress.CancelToken。三者均为 None 时与直接调用 run_jobs 相同。
+    """
+    measured = report is not None or progress is not None
+    if measured:
+        worker = partial(measure, worker)
+    total = len(tasks) if isinstance(tasks, (list, tuple)) else None
+    done = 0
+
+    on_start = None
+    if progress is not None:
+        def on_start(task):
+            progress(ProgressEvent(STARTED, task[0], done, total))
+
+    for task, result in run_jobs(worker, tasks, jobs, initializer, initargs, on_start, cancel):
+        record = None
+        if measured:
+            result, record = unpack(result)
+            if report is not None and record is not None:
+                report.add(record)
+        success, reason = result
+        done += 1
+        if progress is not None:
+            kind = FINISHED if success else CANCELLED if reason == CANCELLED_REASON else FAILED
+            progress(ProgressEvent(kind, task[0], done, total, record.events if record else 0,
+                                   record.seconds if record else 0.0, reason))
+        yield task, success, reason
+
+
+def run_watch(worker, watcher, make_task, jobs=None, report=None, progress=None, cancel=None, initializer=None,
+              initargs=(), on_idle=None):
+    """
+    监视模式：将 watcher（watch.Watcher）报告的新增或修改文件交给 worker(*make_task(文件路径)) 处理，
+    按完成顺序产出 (task, 是否成功, 失败原因)，直到 cancel 被取消或调用方停止迭代。
+    report、progress、cancel 的含义同 run_batch（进度事件中的文件总数为 None）。
+
+    同时处理的文件数不超过 jobs，其余文件排队等待，jobs 为 1 时在当前进程中处理；
+    处理中的文件再次变化时推迟到处理完成之后检查，处理时写回的文件不会被再次处理（见 Watcher.processed）。
+    on_idle() 在一批文件处理完成、没有排队和处理中的文件时调用（例如 batch 落盘策略下统一 fsync）。
+    """
+    from collections import deque
+    jobs = default_jobs() if jobs is None else jobs
+    measured = report is not None or progress is not None
+    if measured:
+        worker = partial(measure, worker)
+    queued = deque()
+    running = {}
+    pool = None
+    done = 0
+    dirty = False
+    if jobs <= 1:
+        install(cancel)
+    try:
+        while cancel is None or not cancel.cancelled():
+            busy = {running_path for running_path, _task in running.values()}
+            for path in watcher.changes(_WATCH_BUSY_WAIT if running else _WATCH_IDLE_WAIT):
+                if path in busy or path in queued:
+                    watcher.defer(path)
+                else:
+                    queued.append(path)
+
+            results = []
+            while queued and len(running) < jobs:
+                path = queued.popleft()
+                task = make_task(path)
+                if progress is not None:
+                    progress(ProgressEvent(STARTED, path, done, None))
+                if jobs <= 1:
+                    results.append((path, task, worker(*task)))
+                    break
+                if pool is None:
+                    # 进程池相关模块导入较慢，第一个文件到达时才创建
+                    from concurrent.futures import ProcessPoolExecutor
+                    pool_initializer, pool_initargs = initializer, initargs
+                    if cancel is not None:
+                        pool_initializer, pool_initargs = _init_worker, (cancel, initializer, initargs)
+                    pool = ProcessPoolExecutor(max_workers=jobs, initializer=pool_initializer,
+                                               initargs=pool_initargs)
+                running[pool.submit(worker, *task)] = (path, task)
+            if running:
+                finished, _ = wait(running, timeout=0)
+                for future in finished:
+                    path, task = running.pop(future)
+                    results.append((path, task, _collect(future)))
+
+            for path, task, result in results:
+                watcher.processed(path)
+                record = None
+                if measured:
+                    result, record = unpack(result)
+                    if report is not None and record is not None:
+                        report.add(record)
+                success, reason = result
+                done += 1
+                dirty = True
+                if progress is not None:
+                    kind = FINISHED if success else CANCELLED if reason == CANCELLED_REASON else FAILED
+                    progress(ProgressEvent(kind, path, done, None, record.events if record else 0,
+                                           record.seconds if record else 0.0, reason))
+                yield task, success, reason
+            if dirty and not running and not queued:
+                dirty = False
+                if on_idle is not None:
+                    on_idle()
+    finally:
+        if jobs <= 1:
+            install(None)
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
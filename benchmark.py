@@ -0,0 +1,399 @@
+"""
+性能基准测试工具（开发用，不随发布包分发）。
+
+以仓库中的 example.ass / example.ssa / example.srt 为样本生成 1k ~ 1M 事件的合成字幕，
+分别测量各项公开操作的耗时，输出 事件数/秒、MB/秒 与峰值内存，结果保存为 JSON，
+并可与已保存的基线结果对比，发现性能回退时以非零状态码退出。
+"""
+import json
+import os
+import platform
+import queue
+import random
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+from docopt import docopt
+
+__version__ = 'benchmark v0.1.0'
+
+# 命令行工具的导入耗时上限（毫秒），tests/test_importtime.py 按此检查
+IMPORT_BUDGET_MS = 200
+
+USAGE = f"""
+{__version__}
+Usage:
+  benchmark.py run [--sizes <list>] [--ops <list>] [--repeat <n>] [--files <n>] [--output <file>] [--baseline <file>] [--threshold <percent>] [--workdir <dir>]
+  benchmark.py compare <baseline> <current> [--threshold <percent>]
+  benchmark.py generate <format> <events> <output> [--seed <n>]
+  benchmark.py importtime [--budget <ms>] [--repeat <n>]
+  benchmark.py (-h | --help)
+
+Options:
+  --sizes <list>           逗号分隔的事件数列表 [default: 1000,10000,100000]
+  --ops <list>             逗号分隔的操作列表，默认全部。可选: {{ops}}
+  --repeat <n>             每项操作重复次数，取最快的一次 [default: 3]
+  --files <n>              目录批处理测试使用的文件数 [default: 8]
+  --output <file>          结果保存路径 [default: bench_output.json]
+  --baseline <file>        运行结束后与该基线结果对比
+  --threshold <percent>    吞吐量下降超过该百分比即视为回退 [default: 10]
+  --workdir <dir>          生成测试文件的目录，默认使用临时目录并在结束后删除
+  --seed <n>               随机种子 [default: 0]
+  --budget <ms>            命令行工具的导入耗时上限（毫秒） [default: {IMPORT_BUDGET_MS}]
+  -h --help                显示帮助信息
+
+Examples:
+  # 默认规模测试并保存为基线
+  python benchmark.py run --output baseline.json
+
+  # 包含 100 万事件的测试，并与基线对比
+  python benchmark.py run --sizes 1000,100000,1000000 --baseline baseline.json
+
+  # 生成一个 10 万事件的 ASS 测试文件
+  python benchmark.py generate ass 100000 huge.ass
+
+  # 检查命令行工具的导入耗时，并确认没有加载 GUI 与平台相关模块
+  python benchmark.py importtime --budget 150
+"""
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 模拟常见的特效/排版行：定位、淡入淡出、模糊、卡拉OK等覆盖标签
+_OVERRIDE_SHAPES = (
+    "{{\\pos({x},{y})}}{text}",
+    "{{\\fad(200,200)\\blur2}}{text}",
+    "{{\\an8\\fs36\\c&H00FFFF&}}{text}",
+    "{{\\move({x},{y},{y},{x})\\t(0,500,\\frz{x})}}{text}",
+    "{{\\k20}}{text}{{\\k35}}{text}",
+)
+
+
+def _read_sample(name):
+    with open(os.path.join(REPO_DIR, name), 'r', encoding='utf-8-sig') as f:
+        return f.read()
+
+
+def _sample_texts():
+    """
+    从示例字幕中收集正文，作为合成字幕的对白文本。
+    """
+    import sub_core
+    texts = []
+    for name, fmt in (('example.ass', sub_core.FORMAT_ASS), ('example.ssa', sub_core.FORMAT_ASS),
+                      ('example.srt', sub_core.FORMAT_SRT)):
+        store = sub_core.EventStore.parse(_read_sample(name), fmt)
+        texts.extend(store.event_text(i) for i in range(len(store)))
+    return [text for text in texts if text] or ["字幕"]
+
+
+def _ass_header(name):
+    sample = _read_sample(name)
+    return sample[:sample.index("[Events]")] + "[Events]\n" + next(
+        line for line in sample[sample.index("[Events]"):].splitlines() if line.startswith("Format:")) + "\n"
+
+
+def generate(fmt, events, output, seed=0):
+    """
+    生成合成字幕。fmt 为 ass、ssa 或 srt；约 20% 的行带有特效覆盖标签。
+    时间轴递增，超过 9 小时后从头开始（相当于多集合并的字幕），避免小时位数变化影响原地改写的测试。
+    """
+    import sub_core
+    rng = random.Random(seed)
+    texts = _sample_texts()
+    with open(output, 'w', encoding='utf-8') as f:
+        if fmt == 'ass':
+            f.write(_ass_header('example.ass'))
+        elif fmt == 'ssa':
+            f.write(_ass_header('example.ssa'))
+        start = 0
+        for i in range(events):
+            start = (start + rng.randrange(100, 3000)) % (9 * 3600000)
+            end = start + rng.randrange(500, 6000)
+            text = rng.choice(texts)
+            if rng.random() < 0.2:
+                text = rng.choice(_OVERRIDE_SHAPES).format(text=text, x=rng.randrange(1280), y=rng.randrange(720))
+            if fmt == 'srt':
+                text = text.replace("\\N", "\n")
+                f.write(f"{i + 1}\n{sub_core.ms_to_srt_time(start)} --> {sub_core.ms_to_srt_time(end)}\n{text}\n\n")
+            elif fmt == 'ssa':
+                f.write(f"Dialogue: Marked=0,{sub_core.ms_to_time(start)},{sub_core.ms_to_time(end)},"
+                        f"Default,,0000,0000,0000,,{text}\n")
+            else:
+                f.write(f"Dialogue: {rng.randrange(3)},{sub_core.ms_to_time(start)},{sub_core.ms_to_time(end)},"
+                        f"Default,,0,0,0,,{text}\n")
+
+
+# ---- 各项被测操作：参数为准备好的输入路径与输出目录 ----
+
+def op_shift(path, outdir):
+    import sub_core
+    sub_core.shift_file(path, 2500)
+
+
+def op_shift_numpy(path, outdir):
+    import sub_vector
+    store = sub_vector.load_events(path)
+    sub_vector.shift_store(store, 2500)
+    sub_vector.write_events(store, path)
+
+
+def op_shift_mmap(path, outdir):
+    import sub_core
+    if sub_core.patch_file_in_place(path, 2500) is None:
+        sub_core.shift_file(path, 2500)
+
+
+def op_shift_unchanged(path, outdir):
+    # 偏移量为 0，输出与原文件相同，只扫描不写入
+    import sub_core
+    sub_core.shift_file(path, 0)
+
+
+def op_retime(path, outdir):
+    import sub_core
+    store = sub_core.load_events(path)
+    store.retime(25 / 23.976)
+    sub_core.write_events(store, os.path.join(outdir, os.path.basename(path)))
+
+
+def op_srt_to_ass(path, outdir):
+    import sub_core
+    store = sub_core.load_events(path, encoding=None, fmt=sub_core.FORMAT_SRT)
+    sub_core.write_srt_as_ass(store, os.path.join(outdir, "converted.ass"),
+                              sub_core.DEFAULT_ASS_TEMPLATE.format(filename="converted"))
+
+
+def op_batch_directory(path, outdir):
+    import sub_adjust
+    sub_adjust.shift_times_in_directory(path, 2500, None, None, queue.Queue())
+
+
+# 操作名 -> (函数, 适用的格式, 是否为目录批处理)
+OPERATIONS = {
+    'shift_ass': (op_shift, 'ass', False),
+    'shift_ssa': (op_shift, 'ssa', False),
+    'shift_srt': (op_shift, 'srt', False),
+    'shift_ass_numpy': (op_shift_numpy, 'ass', False),
+    'shift_ass_mmap': (op_shift_mmap, 'ass', False),
+    'shift_srt_mmap': (op_shift_mmap, 'srt', False),
+    'shift_ass_unchanged': (op_shift_unchanged, 'ass', False),
+    'retime_ass': (op_retime, 'ass', False),
+    'retime_srt': (op_retime, 'srt', False),
+    'srt_to_ass': (op_srt_to_ass, 'srt', False),
+    'batch_directory': (op_batch_directory, 'ass', True),
+}
+
+
+def _prepare(source, workdir, is_directory, files):
+    target = tempfile.mkdtemp(dir=workdir)
+    if not is_directory:
+        path = os.path.join(target, os.path.basename(source))
+        shutil.copyfile(source, path)
+        return path
+    for i in range(files):
+        shutil.copyfile(source, os.path.join(target, f"{i:03}{os.path.splitext(source)[1]}"))
+    return target
+
+
+def measure(op_name, source, workdir, repeat, files):
+    """
+    在独立子进程中执行，使峰值内存只反映该项操作。返回最快一次的耗时（秒）与峰值内存（MB）。
+    """
+    sys.path.insert(0, REPO_DIR)
+    from metrics import peak_rss_kb
+    func, _fmt, is_directory = OPERATIONS[op_name]
+    best = None
+    for _ in range(repeat):
+        path = _prepare(source, workdir, is_directory, files)
+        outdir = tempfile.mkdtemp(dir=workdir)
+        started = time.perf_counter()
+        func(path, outdir)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+        shutil.rmtree(os.path.dirname(path) if not is_directory else path, ignore_errors=True)
+        shutil.rmtree(outdir, ignore_errors=True)
+    peak = peak_rss_kb()
+    return best, peak / 1024 if peak is not None else None
+
+
+def run(sizes, ops, repeat, files, workdir):
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for events in sizes:
+        sources = {}
+        for op_name in ops:
+            _func, fmt, is_directory = OPERATIONS[op_name]
+            if fmt not in sources:
+                sources[fmt] = os.path.join(workdir, f"synthetic_{events}.{fmt}")
+                generate(fmt, events, sources[fmt])
+            source = sources[fmt]
+            size = os.path.getsize(source) * (files if is_directory else 1)
+            total_events = events * (files if is_directory else 1)
+
+            result = {'op': op_name, 'format': fmt, 'events': total_events, 'bytes': size}
+            try:
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                    seconds, peak = pool.submit(measure, op_name, source, workdir, repeat, files).result()
+                result.update({
+                    'seconds': round(seconds, 6),
+                    'events_per_sec': round(total_events / seconds, 1) if seconds else None,
+                    'mb_per_sec': round(size / (1024 * 1024) / seconds, 3) if seconds else None,
+                    'peak_rss_mb': round(peak, 1) if peak is not None else None,
+                })
+            except Exception as e:
+                result['error'] = f"{type(e).__name__}: {e}"
+            results.append(result)
+            print(_format_result(result), flush=True)
+    return results
+
+
+def _format_result(result):
+    label = f"{result['op']:<18} {result['events']:>9} events"
+    if 'error' in result:
+        return f"{label}  失败: {result['error']}"
+    peak = f"{result['peak_rss_mb']:.1f} MB" if result['peak_rss_mb'] is not None else "n/a"
+    return (f"{label}  {result['seconds']:.4f}s  {result['events_per_sec']:>12.0f} events/s  "
+            f"{result['mb_per_sec']:>8.2f} MB/s  peak {peak}")
+
+
+def compare(baseline, current, threshold):
+    """
+    按 (操作, 事件数) 对比吞吐量，返回回退项列表。
+    """
+    baseline_index = {(r['op'], r['events']): r for r in baseline['results'] if 'error' not in r}
+    regressions = []
+    for result in current['results']:
+        base = baseline_index.get((result['op'], result['events']))
+        if base is None or 'error' in result:
+            continue
+        change = (result['events_per_sec'] - base['events_per_sec']) / base['events_per_sec'] * 100
+        marker = "回退" if change < -threshold else "正常"
+        print(f"{result['op']:<18} {result['events']:>9} events  {base['events_per_sec']:>12.0f} -> "
+              f"{result['events_per_sec']:>12.0f} events/s  {change:+7.1f}%  {marker}")
+        if change < -threshold:
+            regressions.append(result)
+    return regressions
+
+
+# 命令行入口模块，以及它们在导入时不允许加载的 GUI / 平台相关模块
+CLI_MODULES = ('sub_adjust', 'sub_converter', 'sub_pipeline', 'timecode_converter')
+FORBIDDEN_IMPORTS = ('tkinter', '_tkinter', 'webbrowser', 'winsound', 'utils', 'concurrent.futures.process')
+
+
+def import_profile(module):
+    """
+    使用 -X importtime 在新的解释器中导入 module，返回 (累计耗时毫秒, 被导入的模块集合)。
+    """
+    import subprocess
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                               cwd=REPO_DIR, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1])
+    cumulative = None
+    imported = set()
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line.split('|')
+        name = fields[-1].strip()
+        if name == 'package':  # 表头
+            continue
+        imported.add(name)
+        if name == module:
+            cumulative = int(fields[1]) / 1000
+    return cumulative, imported
+
+
+def measure_import(module, repeat):
+    """
+    导入 module repeat 次，返回 (最快一次的耗时毫秒, 导入时加载的禁止模块列表)。
+    """
+    best = None
+    forbidden = set()
+    for _ in range(repeat):
+        elapsed, imported = import_profile(module)
+        best = elapsed if best is None else min(best, elapsed)
+        forbidden.update(imported.intersection(FORBIDDEN_IMPORTS))
+    return best, sorted(forbidden)
+
+
+def check_import_budget(budget_ms, repeat):
+    """
+    逐个检查命令行入口的导入耗时（取多次中最快的一次）与导入的模块，返回不满足要求的描述列表。
+    """
+    problems = []
+    for module in CLI_MODULES:
+        best, forbidden = measure_import(module, repeat)
+        status = "正常" if best <= budget_ms and not forbidden else "超出"
+        print(f"{module:<18} {best:8.1f} ms  (上限 {budget_ms:.0f} ms)  {status}")
+        if best > budget_ms:
+            problems.append(f"{module} 导入耗时 {best:.1f} ms，超过上限 {budget_ms:.0f} ms")
+        if forbidden:
+            problems.append(f"{module} 导入时加载了 {', '.join(forbidden)}")
+    return problems
+
+
+def main():
+    args = docopt(USAGE.replace('{ops}', ','.join(OPERATIONS)))
+    sys.path.insert(0, REPO_DIR)
+    threshold = float(args["--threshold"])
+
+    if args["generate"]:
+        generate(args["<format>"], int(args["<events>"]), args["<output>"], int(args["--seed"]))
+        return 0
+
+    if args["importtime"]:
+        problems = check_import_budget(float(args["--budget"]), int(args["--repeat"]))
+        for problem in problems:
+            print(problem, file=sys.stderr)
+        return 1 if problems else 0
+
+    if args["compare"]:
+        with open(args["<baseline>"], 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        with open(args["<current>"], 'r', encoding='utf-8') as f:
+            current = json.load(f)
+        return 1 if compare(baseline, current, threshold) else 0
+
+    sizes = [int(size) for size in args["--sizes"].split(',')]
+    ops = args["--ops"].split(',') if args["--ops"] else list(OPERATIONS)
+    unknown = [op for op in ops if op not in OPERATIONS]
+    if unknown:
+        print(f"未知的操作: {', '.join(unknown)}", file=sys.stderr)
+        return 2
+
+    workdir = args["--workdir"] or tempfile.mkdtemp(prefix="sub_adjust_bench_")
+    os.makedirs(workdir, exist_ok=True)
+    try:
+        results = run(sizes, ops, int(args["--repeat"]), int(args["--files"]), workdir)
+    finally:
+        if not args["--workdir"]:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'meta': {
+            'version': __version__,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+    }
+    with open(args["--output"], 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已保存到 {args['--output']}")
+
+    if args["--baseline"]:
+        with open(args["--baseline"], 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if compare(baseline, report, threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
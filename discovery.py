@@ -0,0 +1,137 @@
+import os
+from fnmatch import fnmatch
+
+from sub_core import SUBTITLE_EXTENSIONS
+
+# 各工具自己生成的输出文件（sub_converter、sub_pipeline 的 .converted.ass，timecode_converter 的 -converted.），
+# 展开目录与监视目录时均不再处理，避免重复运行时把上次的输出当作输入再转换一次
+OUTPUT_MARKERS = ('.converted.', '-converted.')
+
+
+def is_output(filepath):
+    name = os.path.basename(filepath).lower()
+    return any(marker in name for marker in OUTPUT_MARKERS)
+
+
+def _matches(patterns, name, relpath):
+    """
+    不含 "/" 的模式匹配文件（目录）名，含 "/" 的模式匹配相对于起始目录的路径。
+    """
+    for pattern in patterns:
+        if fnmatch(relpath if '/' in pattern else name, pattern):
+            return True
+    return False
+
+
+def is_excluded(relpath, exclude):
+    """
+    相对于起始目录的路径（以 "/" 分隔）本身或其所在的任一目录匹配 exclude 中的模式时返回 True。
+    """
+    parts = relpath.split('/')
+    return any(_matches(exclude, part, '/'.join(parts[:i + 1])) for i, part in enumerate(parts))
+
+
+def is_selected(relpath, extensions=SUBTITLE_EXTENSIONS, include=None, exclude=None):
+    """
+    按 iter_subtitle_files 的规则判断相对于起始目录的文件路径是否会被选中，用于判断遍历之后新出现的文件。
+    """
+    name = relpath.rsplit('/', 1)[-1]
+    if not name.lower().endswith(tuple(ext.lower() for ext in extensions)):
+        return False
+    if include and not _matches(include, name, relpath):
+        return False
+    return not (exclude and is_excluded(relpath, exclude))
+
+
+def _dir_key(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_dev, st.st_ino
+
+
+def iter_subtitle_files(directory, extensions=SUBTITLE_EXTENSIONS, recursive=False, include=None, exclude=None):
+    """
+    基于 os.scandir 惰性遍历目录，边遍历边产出匹配的字幕文件路径，调用方无需等待遍历结束即可开始处理。
+
+    - recursive: 是否进入子目录（跟随符号链接，已访问过的目录按 (st_dev, st_ino) 去重，避免链接成环）
+    - include: 文件需匹配其中任一 glob 模式才会产出（为空时不限制）
+    - exclude: 匹配任一 glob 模式的文件或目录会被跳过，目录被排除时不再进入
+    """
+    include = list(include or [])
+    exclude = list(exclude or [])
+    extensions = tuple(ext.lower() for ext in extensions)
+    visited = set()
+    root_key = _dir_key(directory)
+    if root_key is not None:
+        visited.add(root_key)
+
+    stack = [(directory, '')]
+    while stack:
+        current, prefix = stack.pop()
+        try:
+            with os.scandir(current) as entries:
+                subdirs = []
+                for entry in entries:
+                    relpath = f"{prefix}{entry.name}"
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        continue
+                    if is_dir:
+                        if recursive and not _matches(exclude, entry.name, relpath):
+                            subdirs.append((entry.path, relpath))
+                        continue
+                    if not entry.name.lower().endswith(extensions):
+                        continue
+                    if include and not _matches(include, entry.name, relpath):
+                        continue
+                    if exclude and _matches(exclude, entry.name, relpath):
+                        continue
+                    yield entry.path
+        except OSError:
+            continue
+
+        # 逆序压栈，使子目录按扫描顺序依次处理
+        for path, relpath in reversed(subdirs):
+            key = _dir_key(path)
+            if key is None or key in visited:
+                continue
+            visited.add(key)
+            stack.append((path, f"{relpath}/"))
+
+
+def expand_inputs(inputs, extensions=SUBTITLE_EXTENSIONS, recursive=False, include=None, exclude=None):
+    """
+    展开命令行输入：文件原样产出，目录按 iter_subtitle_files 的规则展开，并跳过 OUTPUT_MARKERS 标记的输出文件。
+    """
+    for path in inputs:
+        if os.path.isdir(path):
+            for filepath in iter_subtitle_files(path, extensions, recursive, include, exclude):
+                if not is_output(filepath):
+                    yield filepath
+        else:
+            yield path
+
+
+def output_directory(filepath, output_dir, roots=()):
+    """
+    指定输出目录时文件的实际输出目录：位于 roots 中某个输入目录之下的文件保留相对于该目录的子目录结构，
+    避免递归处理时不同子目录中的同名文件输出到同一位置而互相覆盖；其余文件直接输出到 output_dir。
+    output_dir 为空时原样返回（即输出到源文件所在目录）。
+    """
+    if not output_dir:
+        return output_dir
+    parent = os.path.dirname(os.path.abspath(filepath))
+    for root in roots:
+        try:
+            relative = os.path.relpath(parent, os.path.abspath(root))
+        except ValueError:
+            # Windows 下位于不同驱动器
+            continue
+        if relative == os.curdir:
+            return output_dir
+        if relative != os.pardir and not relative.startswith(os.pardir + os.sep):
+            return os.path.join(output_dir, relative)
+    return output_dir
@@ -0,0 +1,250 @@
+import re
+
+# 事件过滤表达式：编译一次，得到按事件逐个调用的判断函数。
+#
+#   layer=0-2,5            层为 0、1、2 或 5
+#   style="Sign","Title"   样式为 Sign 或 Title（值含空格、逗号等字符时用引号）
+#   actor!=旁白            说话人（Name 字段）不是 旁白
+#   effect~^Banner         特效字段匹配正则
+#   text!~"\{\\an8\}"      正文不匹配正则
+#
+# 条件之间可以用 and、or、not 与括号组合，例如：style=Sign or (layer=1 and not text~^♪)
+# SRT 事件的 layer 视为 0，style、actor、effect 视为空字符串。
+
+FIELDS = ('layer', 'style', 'actor', 'effect', 'text')
+# 字段在 EventStore.event_fields() 返回值中的位置
+_FIELD_INDEX = {'style': 0, 'actor': 1, 'effect': 2, 'text': 3}
+_FIELD_ALIASES = {'name': 'actor'}
+
+_TOKEN_RE = re.compile(r'''
+    \s*(?:
+        (?P<lparen>\() | (?P<rparen>\)) | (?P<comma>,)
+      | (?P<op>==|!=|!~|=|~)
+      | "(?P<dquoted>(?:[^"\\]|\\.)*)" | '(?P<squoted>(?:[^'\\]|\\.)*)'
+      | (?P<word>[^\s()",'=!~]+)
+    )''', re.X)
+# 引号内只需转义引号本身，反斜杠原样保留给正则使用
+_ESCAPE_RE = re.compile(r'\\(["\'])')
+_LAYER_RANGE_RE = re.compile(r'([0-9]+)(?:-([0-9]+))?')
+
+# 判断的相对开销：只看层号的比较最便宜，其次是字段的集合查找，正则最贵
+_COST_LAYER = 0
+_COST_LOOKUP = 1
+_COST_REGEX = 2
+
+
+def _tokenize(expression):
+    tokens = []
+    pos = 0
+    expression = expression.rstrip()
+    while pos < len(expression):
+        match = _TOKEN_RE.match(expression, pos)
+        if match is None:
+            raise ValueError(f"过滤表达式第 {pos + 1} 个字符处无法解析: {expression[pos:]}")
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind in ('dquoted', 'squoted'):
+            kind, value = 'string', _ESCAPE_RE.sub(r'\1', value)
+        elif kind == 'word' and value.lower() in ('and', 'or', 'not'):
+            kind, value = value.lower(), value.lower()
+        tokens.append((kind, value))
+        pos = match.end()
+    return tokens
+
+
+class _Parser:
+    """
+    递归下降解析：or 的优先级最低，其次是 and，not 最高。
+    """
+
+    def __init__(self, expression):
+        self.expression = expression
+        self.tokens = _tokenize(expression)
+        self.pos = 0
+
+    def peek(self):
+        return self.tokens[self.pos][0] if self.pos < len(self.tokens) else None
+
+    def take(self, kind):
+        if self.peek() != kind:
+            found = self.tokens[self.pos][1] if self.pos < len(self.tokens) else '表达式结尾'
+            raise ValueError(f"过滤表达式 {self.expression!r} 中 {found!r} 处语法错误")
+        self.pos += 1
+        return self.tokens[self.pos - 1][1]
+
+    def parse(self):
+        node = self.parse_or()
+        if self.pos != len(self.tokens):
+            self.take(None)
+        return node
+
+    def parse_or(self):
+        children = [self.parse_and()]
+        while self.peek() == 'or':
+            self.pos += 1
+            children.append(self.parse_and())
+        return children[0] if len(children) == 1 else ('or', children)
+
+    def parse_and(self):
+        children = [self.parse_not()]
+        while self.peek() == 'and':
+            self.pos += 1
+            children.append(self.parse_not())
+        return children[0] if len(children) == 1 else ('and', children)
+
+    def parse_not(self):
+        if self.peek() == 'not':
+            self.pos += 1
+            return ('not', self.parse_not())
+        if self.peek() == 'lparen':
+            self.pos += 1
+            node = self.parse_or()
+            self.take('rparen')
+            return node
+        return self.parse_condition()
+
+    def parse_condition(self):
+        field = self.take('word').lower()
+        field = _FIELD_ALIASES.get(field, field)
+        if field not in FIELDS:
+            raise ValueError(f"过滤表达式中未知的字段: {field}，可选值为 {', '.join(FIELDS)}")
+        op = self.take('op')
+        values = [self.take_value()]
+        if op in ('=', '==', '!='):
+            while self.peek() == 'comma':
+                self.pos += 1
+                values.append(self.take_value())
+        return ('cond', field, op, values)
+
+    def take_value(self):
+        if self.peek() == 'string':
+            return self.take('string')
+        return self.take('word')
+
+
+def _compile_condition(field, op, values):
+    negate = op.startswith('!')
+    if op in ('~', '!~'):
+        try:
+            search = re.compile(values[0]).search
+        except re.error as e:
+            raise ValueError(f"过滤表达式中的正则表达式 {values[0]!r} 无效: {e}") from None
+        if field == 'layer':
+            def test(layer, fields):
+                return (search(str(layer)) is None) is negate
+            return test, _COST_REGEX
+        index = _FIELD_INDEX[field]
+
+        def test(layer, fields):
+            return (search(fields[index]) is None) is negate
+        return test, _COST_REGEX
+
+    if field == 'layer':
+        numbers = set()
+        ranges = []
+        for value in values:
+            match = _LAYER_RANGE_RE.fullmatch(value)
+            if match is None:
+                raise ValueError(f"过滤表达式中无效的层号: {value}")
+            first, last = match.groups()
+            if last is None:
+                numbers.add(int(first))
+            else:
+                # range 的 in 判断为常数时间，范围很大时也无需展开
+                ranges.append(range(int(first), int(last) + 1))
+        numbers = frozenset(numbers)
+        if not ranges:
+            def test(layer, fields):
+                return (layer in numbers) is not negate
+        else:
+            def test(layer, fields):
+                return (layer in numbers or any(layer in r for r in ranges)) is not negate
+        return test, _COST_LAYER
+
+    index = _FIELD_INDEX[field]
+    choices = frozenset(values)
+
+    def test(layer, fields):
+        return (fields[index] in choices) is not negate
+    return test, _COST_LOOKUP
+
+
+def _compile(node):
+    """
+    返回 (判断函数, 开销)。and/or 的子条件按开销从低到高排列，短路时尽量跳过昂贵的判断。
+    """
+    kind = node[0]
+    if kind == 'cond':
+        return _compile_condition(*node[1:])
+    if kind == 'not':
+        inner, cost = _compile(node[1])
+        return (lambda layer, fields: not inner(layer, fields)), cost
+
+    compiled = sorted((_compile(child) for child in node[1]), key=lambda item: item[1])
+    tests = tuple(test for test, _cost in compiled)
+    cost = compiled[-1][1]
+    if kind == 'and':
+        return _combine_and(tests), cost
+
+    def test(layer, fields):
+        for child in tests:
+            if child(layer, fields):
+                return True
+        return False
+    return test, cost
+
+
+def _combine_and(tests):
+    if len(tests) == 1:
+        return tests[0]
+
+    def test(layer, fields):
+        for child in tests:
+            if not child(layer, fields):
+                return False
+        return True
+    return test
+
+
+class EventFilter:
+    """
+    编译后的事件过滤器。
+
+    最外层 and 中只涉及层号的条件单独编译为 layer_test，调用方可以先用层号筛掉事件，
+    再为剩余事件提取 style/actor/effect/text 字段交给 test。两者为 None 时表示无需判断。
+    """
+    __slots__ = ('expression', 'layer_test', 'test')
+
+    def __init__(self, expression, layer_test, test):
+        self.expression = expression
+        self.layer_test = layer_test
+        self.test = test
+
+    def __repr__(self):
+        return f"EventFilter({self.expression!r})"
+
+    def __reduce__(self):
+        # 编译结果是闭包，无法直接 pickle；传给工作进程时只传递表达式，在子进程中重新编译
+        return compile_filter, (self.expression,)
+
+
+def compile_filter(expression):
+    """
+    将过滤表达式编译为 EventFilter，表达式有误时抛出 ValueError。
+    """
+    if not expression or not expression.strip():
+        raise ValueError("过滤表达式为空")
+    node = _Parser(expression).parse()
+    conjuncts = node[1] if node[0] == 'and' else [node]
+    compiled = sorted((_compile(child) for child in conjuncts), key=lambda item: item[1])
+    layer_tests = [test for test, cost in compiled if cost == _COST_LAYER]
+    other_tests = [test for test, cost in compiled if cost != _COST_LAYER]
+
+    layer_test = None
+    if layer_tests:
+        combined = _combine_and(layer_tests)
+
+        def layer_test(layer):
+            return combined(layer, None)
+    test = _combine_and(other_tests) if other_tests else None
+    return EventFilter(expression, layer_test, test)
@@ -0,0 +1,1052 @@
+import os
+import struct
+import zlib
+from bisect import bisect_right
+import metrics
+from metrics import stage
+from progress import check_cancelled
+from sub_core import FORMAT_ASS, FORMAT_SRT, FSYNC_FILE, atomic_open, fsync_policy
+
+# Matroska 文件中的文本字幕轨道：直接改写字幕块的时间戳，不提取字幕，也不重新封装整个文件
+MATROSKA_EXTENSIONS = ('.mks', '.mkv')
+# 字幕轨道的 CodecID -> 块内容的格式
+SUBTITLE_CODECS = {'S_TEXT/ASS': FORMAT_ASS, 'S_TEXT/SSA': FORMAT_ASS, 'S_TEXT/UTF8': FORMAT_SRT}
+
+# EBML 元素 ID（保留长度标记位）
+_ID_EBML = 0x1A45DFA3
+_ID_DOC_TYPE = 0x4282
+_ID_SEGMENT = 0x18538067
+_ID_SEEK_HEAD = 0x114D9B74
+_ID_SEEK = 0x4DBB
+_ID_SEEK_ID = 0x53AB
+_ID_SEEK_POSITION = 0x53AC
+_ID_INFO = 0x1549A966
+_ID_TIMESTAMP_SCALE = 0x2AD7B1
+_ID_TRACKS = 0x1654AE6B
+_ID_TRACK_ENTRY = 0xAE
+_ID_TRACK_NUMBER = 0xD7
+_ID_CODEC_ID = 0x86
+_ID_CLUSTER = 0x1F43B675
+_ID_TIMESTAMP = 0xE7
+_ID_PREV_SIZE = 0xAB
+_ID_SIMPLE_BLOCK = 0xA3
+_ID_BLOCK_GROUP = 0xA0
+_ID_BLOCK = 0xA1
+_ID_BLOCK_DURATION = 0x9B
+_ID_CUES = 0x1C53BB6B
+_ID_CUE_POINT = 0xBB
+_ID_CUE_TIME = 0xB3
+_ID_CUE_TRACK_POSITIONS = 0xB7
+_ID_CUE_TRACK = 0xF7
+_ID_CUE_CLUSTER_POSITION = 0xF1
+_ID_CUE_RELATIVE_POSITION = 0xF0
+_ID_CUE_DURATION = 0xB2
+_ID_CUE_BLOCK_NUMBER = 0x5378
+_ID_CUE_CODEC_STATE = 0xEA
+_ID_CRC32 = 0xBF
+
+# CueTrackPositions 中按无符号整数解析的字段，其余字段原样保留
+_CUE_UINT_FIELDS = (_ID_CUE_TRACK, _ID_CUE_CLUSTER_POSITION, _ID_CUE_RELATIVE_POSITION, _ID_CUE_DURATION,
+                    _ID_CUE_BLOCK_NUMBER, _ID_CUE_CODEC_STATE)
+# CueTrackPositions 中表示 Segment 内位置的字段
+_CUE_POSITION_FIELDS = (_ID_CUE_CLUSTER_POSITION, _ID_CUE_RELATIVE_POSITION, _ID_CUE_CODEC_STATE)
+# 位置字段最长 8 字节：重新生成 Cues、SeekHead 时先按 8 字节估算 Segment 大小的上限，
+# 再按上限确定位置字段的宽度，元素大小与最终布局无关，无需反复计算
+_POSITION_WIDTH = 8
+_DEFAULT_TIMESTAMP_SCALE = 1000000
+# 块内时间戳是相对于所在 Cluster 的 16 位有符号整数
+_INT16 = struct.Struct('>h')
+_INT16_MAX = 32767
+# 元素头最长为 4 字节 ID + 8 字节大小
+_HEADER_READ_SIZE = 12
+# 块头：轨道号（最长 8 字节）+ 相对时间戳 + 标志
+_BLOCK_HEADER_READ_SIZE = 11
+_COPY_BLOCK_SIZE = 1024 * 1024
+
+
+def is_matroska(filepath):
+    return filepath.lower().endswith(MATROSKA_EXTENSIONS)
+
+
+def _vint_length(data, pos):
+    if pos >= len(data) or data[pos] == 0:
+        raise ValueError("无效的 EBML 数据")
+    length = 9 - data[pos].bit_length()
+    if pos + length > len(data):
+        raise ValueError("EBML 数据不完整")
+    return length
+
+
+def _read_size(data, pos):
+    """
+    读取变长整数（元素大小、轨道号），返回 (值, 字节数)。值的各位全为 1 表示大小未知，返回 None。
+    """
+    length = _vint_length(data, pos)
+    mask = (1 << (7 * length)) - 1
+    value = int.from_bytes(data[pos:pos + length], 'big') & mask
+    return (None if value == mask else value), length
+
+
+def _read_header(data, pos):
+    """
+    读取元素头，返回 (元素 ID, 元素头字节数, 内容大小)。
+    """
+    id_length = _vint_length(data, pos)
+    if id_length > 4:
+        raise ValueError("无效的 EBML 元素 ID")
+    size, size_length = _read_size(data, pos + id_length)
+    return int.from_bytes(data[pos:pos + id_length], 'big'), id_length + size_length, size
+
+
+def _encode_size(size, width=None):
+    if width is None:
+        width = 1
+        # 各位全为 1 的值保留给“大小未知”
+        while size >= (1 << (7 * width)) - 1:
+            width += 1
+    return (size | (1 << (7 * width))).to_bytes(width, 'big')
+
+
+def _element(element_id, payload):
+    return element_id.to_bytes((element_id.bit_length() + 7) // 8, 'big') + _encode_size(len(payload)) + payload
+
+
+def _uint_width(value):
+    return max(1, (value.bit_length() + 7) // 8)
+
+
+def _uint_element(element_id, value, width=None):
+    if width is None:
+        width = _uint_width(value)
+    return _element(element_id, value.to_bytes(width, 'big'))
+
+
+def _iter_children(data, start, end):
+    """
+    遍历内存中的子元素，产出 (元素 ID, 元素起始位置, 元素头字节数, 内容大小)。
+    """
+    pos = start
+    while pos < end:
+        element_id, header_size, size = _read_header(data, pos)
+        if size is None or pos + header_size + size > end:
+            raise ValueError("EBML 元素大小无效")
+        yield element_id, pos, header_size, size
+        pos += header_size + size
+
+
+class _Element:
+    """
+    文件中的一个元素：offset 为元素头在文件中的位置。
+    """
+    __slots__ = ('id', 'offset', 'header_size', 'size')
+
+    def __init__(self, element_id, offset, header_size, size):
+        self.id = element_id
+        self.offset = offset
+        self.header_size = header_size
+        self.size = size
+
+    @property
+    def data_offset(self):
+        return self.offset + self.header_size
+
+    @property
+    def end(self):
+        return self.offset + self.header_size + self.size
+
+
+def _read_element(f, offset):
+    f.seek(offset)
+    data = f.read(_HEADER_READ_SIZE)
+    if not data:
+        return None
+    element_id, header_size, size = _read_header(data, 0)
+    return _Element(element_id, offset, header_size, size)
+
+
+def _iter_file_children(f, start, end):
+    """
+    只读取元素头，遍历文件中 [start, end) 范围内的子元素；end 为 None 时遍历到文件末尾。
+    """
+    pos = start
+    while end is None or pos < end:
+        element = _read_element(f, pos)
+        if element is None:
+            return
+        if element.size is None:
+            raise ValueError("不支持大小未知的元素（例如直播录制时未完成封装的文件）")
+        yield element
+        pos = element.end
+
+
+def _read_data(f, element):
+    f.seek(element.data_offset)
+    data = f.read(element.size)
+    if len(data) != element.size:
+        raise ValueError("文件不完整")
+    return data
+
+
+def _read_uint(f, element):
+    return int.from_bytes(_read_data(f, element), 'big')
+
+
+class _Cluster:
+    __slots__ = ('element', 'timestamp', 'next_timestamp', 'prev_size', 'crc', 'blocks')
+
+    def __init__(self, element, timestamp=None):
+        self.element = element
+        self.timestamp = timestamp
+        # 下一个 Cluster 的 Timestamp，Cluster 覆盖 [timestamp, next_timestamp) 范围内的块；最后一个 Cluster 为 None
+        self.next_timestamp = None
+        # (PrevSize 的值, 值在 Cluster 内容中的偏移, 宽度)
+        self.prev_size = None
+        self.crc = False
+        self.blocks = []
+
+
+class _Block:
+    """
+    字幕轨道中的一个块。offset、size 为 SimpleBlock 或 BlockGroup 元素（含元素头）在文件中的位置与大小，
+    start、duration 以 TimestampScale 为单位。
+    """
+    __slots__ = ('cluster', 'offset', 'size', 'track', 'timecode_offset', 'rel', 'payload_offset', 'payload_size',
+                 'duration', 'duration_offset', 'duration_width', 'start', 'new_start', 'new_duration', 'target',
+                 'new_relative')
+
+    def __init__(self, track, timecode_offset, rel, payload_offset, payload_size):
+        self.track = track
+        self.timecode_offset = timecode_offset
+        self.rel = rel
+        self.payload_offset = payload_offset
+        self.payload_size = payload_size
+        self.duration = None
+        self.duration_offset = None
+        self.duration_width = 0
+        self.target = None
+        self.new_relative = None
+
+    @property
+    def changed(self):
+        return self.new_start != self.start or self.new_duration != self.duration
+
+
+def _read_block(f, element, tracks):
+    f.seek(element.data_offset)
+    head = f.read(min(element.size, _BLOCK_HEADER_READ_SIZE))
+    track, length = _read_size(head, 0)
+    if track not in tracks:
+        return None
+    if len(head) < length + 3:
+        raise ValueError("字幕块不完整")
+    if head[length + 2] & 0x06:
+        raise ValueError(f"字幕轨道 {track} 的块使用了 lacing，无法处理")
+    rel = _INT16.unpack_from(head, length)[0]
+    payload_offset = element.data_offset + length + 3
+    return _Block(track, element.data_offset + length, rel, payload_offset, element.end - payload_offset)
+
+
+def _scan_cluster(f, element, tracks):
+    """
+    只读取元素头与字幕块的块头，找出 Cluster 中的字幕块。
+    """
+    cluster = _Cluster(element)
+    for child in _iter_file_children(f, element.data_offset, element.end):
+        block = None
+        if child.id == _ID_TIMESTAMP:
+            cluster.timestamp = _read_uint(f, child)
+        elif child.id == _ID_PREV_SIZE:
+            cluster.prev_size = (_read_uint(f, child), child.data_offset - element.data_offset, child.size)
+        elif child.id == _ID_CRC32:
+            cluster.crc = True
+        elif child.id == _ID_SIMPLE_BLOCK:
+            block = _read_block(f, child, tracks)
+        elif child.id == _ID_BLOCK_GROUP:
+            duration = None
+            for grandchild in _iter_file_children(f, child.data_offset, child.end):
+                if grandchild.id == _ID_BLOCK:
+                    block = _read_block(f, grandchild, tracks)
+                elif grandchild.id == _ID_BLOCK_DURATION:
+                    duration = grandchild
+            if block is not None and duration is not None:
+                block.duration = _read_uint(f, duration)
+                block.duration_offset = duration.data_offset
+                block.duration_width = duration.size
+        if block is not None:
+            block.cluster = cluster
+            block.offset = child.offset
+            block.size = child.end - child.offset
+            cluster.blocks.append(block)
+    if cluster.timestamp is None:
+        raise ValueError("Cluster 缺少 Timestamp")
+    for block in cluster.blocks:
+        block.start = cluster.timestamp + block.rel
+    return cluster
+
+
+def _parse_tracks(data):
+    # 轨道号 -> 字幕格式，只包含文本字幕轨道
+    tracks = {}
+    for element_id, pos, header_size, size in _iter_children(data, 0, len(data)):
+        if element_id != _ID_TRACK_ENTRY:
+            continue
+        number = codec = None
+        for child_id, child_pos, child_header, child_size in _iter_children(data, pos + header_size,
+                                                                             pos + header_size + size):
+            value = data[child_pos + child_header:child_pos + child_header + child_size]
+            if child_id == _ID_TRACK_NUMBER:
+                number = int.from_bytes(value, 'big')
+            elif child_id == _ID_CODEC_ID:
+                codec = value.rstrip(b'\0').decode('ascii', 'replace')
+        if number is not None and codec in SUBTITLE_CODECS:
+            tracks[number] = SUBTITLE_CODECS[codec]
+    return tracks
+
+
+def _parse_timestamp_scale(data):
+    for element_id, pos, header_size, size in _iter_children(data, 0, len(data)):
+        if element_id == _ID_TIMESTAMP_SCALE:
+            return int.from_bytes(data[pos + header_size:pos + header_size + size], 'big')
+    return _DEFAULT_TIMESTAMP_SCALE
+
+
+class _CuePoint:
+    """
+    Cues 中的一个 CuePoint。positions 为各个 CueTrackPositions 的字段列表，
+    每个字段为 [元素 ID, 值, 值在文件中的位置, 宽度]，非整数字段的值为原始元素字节、位置为 None。
+    """
+    __slots__ = ('time', 'time_offset', 'time_width', 'positions')
+
+    def __init__(self):
+        self.time = 0
+        self.time_offset = None
+        self.time_width = 0
+        self.positions = []
+
+
+def _field(fields, element_id):
+    for field in fields:
+        if field[0] == element_id:
+            return field
+    return None
+
+
+def _parse_cues(data, base):
+    points = []
+    for element_id, pos, header_size, size in _iter_children(data, 0, len(data)):
+        if element_id != _ID_CUE_POINT:
+            continue
+        point = _CuePoint()
+        for child_id, child_pos, child_header, child_size in _iter_children(data, pos + header_size,
+                                                                             pos + header_size + size):
+            value_pos = child_pos + child_header
+            if child_id == _ID_CUE_TIME:
+                point.time = int.from_bytes(data[value_pos:value_pos + child_size], 'big')
+                point.time_offset, point.time_width = base + value_pos, child_size
+            elif child_id == _ID_CUE_TRACK_POSITIONS:
+                fields = []
+                for field_id, field_pos, field_header, field_size in _iter_children(data, value_pos,
+                                                                                     value_pos + child_size):
+                    field_value_pos = field_pos + field_header
+                    if field_id in _CUE_UINT_FIELDS:
+                        fields.append([field_id, int.from_bytes(data[field_value_pos:field_value_pos + field_size],
+                                                                'big'), base + field_value_pos, field_size])
+                    elif field_id != _ID_CRC32:
+                        fields.append([field_id, data[field_pos:field_value_pos + field_size], None, 0])
+                point.positions.append(fields)
+        points.append(point)
+    return points
+
+
+def _serialize_cues(points, position_width):
+    """
+    各字段保留原来的宽度（放不下新值时加宽），位置字段至少为 position_width 字节。
+    """
+    payload = []
+    for point in points:
+        children = [_uint_element(_ID_CUE_TIME, point.time, max(point.time_width, _uint_width(point.time)))]
+        for fields in point.positions:
+            encoded = []
+            for element_id, value, _offset, width in fields:
+                if isinstance(value, bytes):
+                    encoded.append(value)
+                elif element_id in _CUE_POSITION_FIELDS:
+                    encoded.append(_uint_element(element_id, value, max(width, position_width)))
+                else:
+                    encoded.append(_uint_element(element_id, value, max(width, _uint_width(value))))
+            children.append(_element(_ID_CUE_TRACK_POSITIONS, b''.join(encoded)))
+        payload.append(_element(_ID_CUE_POINT, b''.join(children)))
+    return _element(_ID_CUES, b''.join(payload))
+
+
+def _parse_seek_head(data):
+    # [(SeekID 的原始字节, SeekPosition, SeekPosition 的宽度)]
+    entries = []
+    for element_id, pos, header_size, size in _iter_children(data, 0, len(data)):
+        if element_id != _ID_SEEK:
+            continue
+        seek_id = position = None
+        width = 0
+        for child_id, child_pos, child_header, child_size in _iter_children(data, pos + header_size,
+                                                                             pos + header_size + size):
+            value = data[child_pos + child_header:child_pos + child_header + child_size]
+            if child_id == _ID_SEEK_ID:
+                seek_id = bytes(value)
+            elif child_id == _ID_SEEK_POSITION:
+                position, width = int.from_bytes(value, 'big'), child_size
+        if seek_id is not None and position is not None:
+            entries.append((seek_id, position, width))
+    return entries
+
+
+def _serialize_seek_head(entries, position_width):
+    return _element(_ID_SEEK_HEAD, b''.join(
+        _element(_ID_SEEK, _element(_ID_SEEK_ID, seek_id) +
+                 _uint_element(_ID_SEEK_POSITION, position, max(width, position_width)))
+        for seek_id, position, width in entries))
+
+
+def _fits(value, width):
+    return value < 1 << (8 * width)
+
+
+class _Timing:
+    """
+    以 TimestampScale 为单位的时间映射，取值与截断规则同 EventStore.shift / apply_sync_map。
+    """
+
+    def __init__(self, scale, offset_ms, sync_map):
+        self.scale = scale
+        self.sync_map = sync_map
+        self.offset = self.to_ticks(int(round(offset_ms or 0)))
+
+    def to_ms(self, ticks):
+        return ticks * self.scale // 1000000
+
+    def to_ticks(self, ms):
+        return (2 * ms * 1000000 + self.scale) // (2 * self.scale)
+
+    def apply(self, start, end):
+        sync_map = self.sync_map
+        if sync_map is None:
+            offset = self.offset
+        elif sync_map.interpolate:
+            return (max(0, self.to_ticks(sync_map.map_time(self.to_ms(start)))),
+                    None if end is None else max(0, self.to_ticks(sync_map.map_time(self.to_ms(end)))))
+        else:
+            offset = self.to_ticks(sync_map.offset_at(self.to_ms(start)))
+        return max(0, start + offset), None if end is None else max(0, end + offset)
+
+
+def _event_fields(payload, fmt):
+    """
+    从块内容中取出 (层, (Style, Name, Effect, Text))。ASS/SSA 块的内容为
+    ReadOrder, Layer, Style, Name, MarginL, MarginR, MarginV, Effect, Text。
+    """
+    text = payload.decode('utf-8', 'replace')
+    if fmt != FORMAT_ASS:
+        return 0, ('', '', '', text)
+    parts = text.split(',', 8)
+    parts += [''] * (9 - len(parts))
+    layer = parts[1].strip().removeprefix('Marked=')
+    return (int(layer) if layer.isdigit() else 0), (parts[2].strip(), parts[3].strip(), parts[7].strip(), parts[8])
+
+
+def _selected(f, block, fmt, timing, layers, window, event_filter):
+    if window is not None:
+        start_ms = timing.to_ms(block.start)
+        if (window[0] is not None and start_ms < window[0]) or (window[1] is not None and start_ms >= window[1]):
+            return False
+    if not layers and event_filter is None:
+        return True
+    f.seek(block.payload_offset)
+    layer, fields = _event_fields(f.read(block.payload_size), fmt)
+    if layers and fmt == FORMAT_ASS and layer not in layers:
+        return False
+    if event_filter is not None:
+        if event_filter.layer_test is not None and not event_filter.layer_test(layer):
+            return False
+        if event_filter.test is not None and not event_filter.test(layer, fields):
+            return False
+    return True
+
+
+def _stays(block):
+    """
+    块的新时间仍在所在 Cluster 的范围 [Timestamp, 下一个 Cluster 的 Timestamp) 内、且相对时间戳放得下时不需要移动。
+    """
+    if block.new_start == block.start:
+        return True
+    cluster = block.cluster
+    return cluster.timestamp <= block.new_start <= cluster.timestamp + _INT16_MAX and (
+        cluster.next_timestamp is None or block.new_start < cluster.next_timestamp)
+
+
+def _place_blocks(clusters, blocks):
+    """
+    为需要移动的块选择目标 Cluster：范围包含新时间的 Cluster（开始时间不晚于它的最后一个）；
+    相对时间戳放不下（例如附近很长时间没有其他轨道的数据）或早于第一个 Cluster 时新建只含字幕的 Cluster。
+    返回 {插入位置（原 Cluster 下标）: [新建的 Cluster]}，新建的 Cluster 位于该下标的 Cluster 之后。
+    """
+    timestamps = [cluster.timestamp for cluster in clusters]
+    created = {}
+    for block in sorted(blocks, key=lambda b: b.new_start):
+        i = bisect_right(timestamps, block.new_start) - 1
+        if i >= 0 and block.new_start - clusters[i].timestamp <= _INT16_MAX:
+            block.target = clusters[i]
+        else:
+            pending = created.setdefault(i, [])
+            if not pending or block.new_start - pending[-1].timestamp > _INT16_MAX:
+                pending.append(_Cluster(None, block.new_start))
+            block.target = pending[-1]
+        block.target.blocks.append(block)
+    return created
+
+
+def _block_bytes(data, block, timestamp):
+    """
+    返回字幕块元素（SimpleBlock 或 BlockGroup）以 timestamp 为所在 Cluster 时间戳、写入新时间后的字节。
+    """
+    data = bytearray(data)
+    _INT16.pack_into(data, block.timecode_offset - block.offset, block.new_start - timestamp)
+    if block.new_duration == block.duration:
+        return bytes(data)
+    pos = block.duration_offset - block.offset
+    if _fits(block.new_duration, block.duration_width):
+        data[pos:pos + block.duration_width] = block.new_duration.to_bytes(block.duration_width, 'big')
+        return bytes(data)
+    # 原宽度放不下新的持续时间，重新生成 BlockGroup
+    _element_id, header_size, size = _read_header(data, 0)
+    children = []
+    for child_id, child_pos, child_header, child_size in _iter_children(data, header_size, header_size + size):
+        if child_id == _ID_BLOCK_DURATION:
+            children.append(_uint_element(_ID_BLOCK_DURATION, block.new_duration))
+        else:
+            children.append(bytes(data[child_pos:child_pos + child_header + child_size]))
+    return _element(_ID_BLOCK_GROUP, b''.join(children))
+
+
+def _crc_fixed(data, header_size):
+    # CRC-32 元素必须是第一个子元素，校验其后的全部内容
+    element_id, pos, crc_header, crc_size = next(_iter_children(data, header_size, len(data)))
+    if element_id == _ID_CRC32 and crc_size == 4:
+        start = pos + crc_header
+        data[start:start + 4] = struct.pack('<I', zlib.crc32(data[start + 4:]))
+    return data
+
+
+class _Output:
+    """
+    重写时的一个顶层元素：data 为 None 时从原文件按原样复制。
+    offsets 为重新生成的 Cluster 中 {原子元素相对位置: 新的相对位置}，None 表示位置不变。
+    """
+    __slots__ = ('element', 'data', 'size', 'offsets')
+
+    def __init__(self, element, data=None, offsets=None):
+        self.element = element
+        self.data = data
+        self.size = len(data) if data is not None else element.end - element.offset
+        self.offsets = offsets
+
+
+def _rebuild_cluster(f, cluster, prev_size):
+    """
+    重新生成 Cluster：移出的字幕块删除，移入以及开始时间改变的字幕块按时间插入，PrevSize 更新为 prev_size，
+    并重新计算 CRC-32。返回 (元素字节, {原子元素相对位置: 新的相对位置})；
+    字幕块移出后 Cluster 中不再有任何块时返回 (None, None)，该 Cluster 不再写出。
+    """
+    own = {block.offset: block for block in cluster.blocks if block.cluster is cluster}
+    removed = {block.offset for block in own.values() if block.target is not None or block.new_start != block.start}
+    inserted = sorted((block for block in cluster.blocks if block.cluster is not cluster or
+                       (block.target is None and block.offset in removed)), key=lambda b: b.new_start)
+    pieces = []
+    offsets = {}
+    size = 0
+    count = 0
+
+    def emit(piece):
+        nonlocal size
+        pieces.append(piece)
+        size += len(piece)
+
+    def emit_inserted(until):
+        nonlocal count
+        while inserted and (until is None or inserted[0].new_start < until):
+            block = inserted.pop(0)
+            block.new_relative = size
+            f.seek(block.offset)
+            emit(_block_bytes(f.read(block.size), block, cluster.timestamp))
+            count += 1
+
+    if cluster.element is None:
+        emit(_uint_element(_ID_TIMESTAMP, cluster.timestamp))
+        emit_inserted(None)
+        return _element(_ID_CLUSTER, b''.join(pieces)), offsets
+
+    data = _read_data(f, cluster.element)
+    base = cluster.element.data_offset
+    for element_id, pos, header_size, child_size in _iter_children(data, 0, len(data)):
+        piece = data[pos:pos + header_size + child_size]
+        if element_id == _ID_PREV_SIZE and prev_size is not None:
+            piece = _uint_element(_ID_PREV_SIZE, prev_size, max(cluster.prev_size[2], _uint_width(prev_size)))
+        elif element_id in (_ID_SIMPLE_BLOCK, _ID_BLOCK_GROUP):
+            if base + pos in removed:
+                continue
+            emit_inserted(cluster.timestamp + _child_rel(data, pos, header_size, element_id))
+            block = own.get(base + pos)
+            if block is not None:
+                block.new_relative = size
+                piece = _block_bytes(piece, block, cluster.timestamp)
+            count += 1
+        offsets[pos] = size
+        emit(piece)
+    emit_inserted(None)
+    if not count and removed:
+        return None, None
+    data = bytearray(_element(_ID_CLUSTER, b''.join(pieces)))
+    return bytes(_crc_fixed(data, len(data) - size) if cluster.crc else data), offsets
+
+
+def _child_rel(data, pos, header_size, element_id):
+    # 子元素（SimpleBlock 或 BlockGroup）中块的相对时间戳
+    start = pos + header_size
+    if element_id == _ID_BLOCK_GROUP:
+        _end = start + _read_header(data, pos)[2]
+        for child_id, child_pos, child_header, _child_size in _iter_children(data, start, _end):
+            if child_id == _ID_BLOCK:
+                start = child_pos + child_header
+                break
+        else:
+            return 0
+    _track, length = _read_size(data, start)
+    return _INT16.unpack_from(data, start + length)[0]
+
+
+def _patched_cluster(f, cluster, prev_size):
+    """
+    大小不变时直接修改 Cluster 的字节：写入新的相对时间戳、持续时间与 PrevSize，并更新 CRC-32。
+    """
+    element = cluster.element
+    f.seek(element.offset)
+    data = bytearray(f.read(element.end - element.offset))
+    for block in cluster.blocks:
+        if block.changed:
+            data[block.offset - element.offset:block.offset - element.offset + block.size] = \
+                _block_bytes(data[block.offset - element.offset:block.offset - element.offset + block.size], block,
+                             cluster.timestamp)
+            block.new_relative = block.offset - element.data_offset
+    if prev_size is not None:
+        _value, pos, width = cluster.prev_size
+        pos += element.header_size
+        data[pos:pos + width] = prev_size.to_bytes(width, 'big')
+    return bytes(_crc_fixed(data, element.header_size) if cluster.crc else data)
+
+
+class _Matroska:
+    """
+    一次扫描得到的文件结构：Segment 的顶层元素、字幕轨道、Cluster 与其中的字幕块、Cues 与 SeekHead。
+    """
+
+    def __init__(self, f):
+        header = _read_element(f, 0)
+        if header is None or header.id != _ID_EBML:
+            raise ValueError("不是 Matroska 文件")
+        doc_type = b''
+        data = _read_data(f, header)
+        for element_id, pos, header_size, size in _iter_children(data, 0, len(data)):
+            if element_id == _ID_DOC_TYPE:
+                doc_type = data[pos + header_size:pos + header_size + size].rstrip(b'\0')
+        if doc_type not in (b'matroska', b'webm'):
+            raise ValueError(f"不支持的文档类型: {doc_type.decode('ascii', 'replace')}")
+
+        self.segment = _read_element(f, header.end)
+        if self.segment is None or self.segment.id != _ID_SEGMENT:
+            raise ValueError("Matroska 文件缺少 Segment")
+        f.seek(0, os.SEEK_END)
+        self.file_size = f.tell()
+        self.segment_end = self.file_size if self.segment.size is None else self.segment.end
+
+        self.elements = list(_iter_file_children(f, self.segment.data_offset, self.segment_end))
+        self.timestamp_scale = _DEFAULT_TIMESTAMP_SCALE
+        self.tracks = {}
+        for element in self.elements:
+            if element.id == _ID_INFO:
+                self.timestamp_scale = _parse_timestamp_scale(_read_data(f, element))
+            elif element.id == _ID_TRACKS:
+                self.tracks.update(_parse_tracks(_read_data(f, element)))
+
+        self.clusters = []
+        self.cues = []
+        self.seek_heads = {}
+        if not self.tracks:
+            return
+        for element in self.elements:
+            if element.id == _ID_CLUSTER:
+                check_cancelled()
+                cluster = _scan_cluster(f, element, self.tracks)
+                if self.clusters:
+                    self.clusters[-1].next_timestamp = cluster.timestamp
+                self.clusters.append(cluster)
+            elif element.id == _ID_CUES:
+                self.cues.append((element, _parse_cues(_read_data(f, element), element.data_offset)))
+            elif element.id == _ID_SEEK_HEAD:
+                self.seek_heads[element.offset] = _parse_seek_head(_read_data(f, element))
+
+    def blocks(self):
+        for cluster in self.clusters:
+            yield from cluster.blocks
+
+
+def _cue_updates(mkv, changed):
+    """
+    字幕轨道的 CuePoint 需要随字幕块一起更新：返回 ({(轨道, Cluster 位置, 相对位置): 字幕块}, {(轨道, 原时间): 字幕块})，
+    由 _cue_block 查找。同一轨道中可能有开始时间相同的块，只按时间对应时 CuePoint 可能跟随错误的块。
+    """
+    base = mkv.segment.data_offset
+    by_position = {}
+    by_time = {}
+    for block in changed:
+        element = block.cluster.element
+        by_position[(block.track, element.offset - base, block.offset - element.data_offset)] = block
+        by_time.setdefault((block.track, block.start), block)
+    return by_position, by_time
+
+
+def _cue_block(updates, fields, time):
+    """
+    CueTrackPositions 指向的需要更新的字幕块，没有时返回 None。
+    有 CueClusterPosition 与 CueRelativePosition 时按块的位置对应，否则退回到按轨道与时间对应。
+    """
+    by_position, by_time = updates
+    track = _field(fields, _ID_CUE_TRACK)
+    if track is None:
+        return None
+    cluster_field = _field(fields, _ID_CUE_CLUSTER_POSITION)
+    relative = _field(fields, _ID_CUE_RELATIVE_POSITION)
+    if cluster_field is not None and relative is not None:
+        return by_position.get((track[1], cluster_field[1], relative[1]))
+    return by_time.get((track[1], time))
+
+
+def _cue_in_place(mkv, updates):
+    """
+    所有需要更新的 CuePoint 都能在原位置改写时，返回 [(文件位置, 宽度, 新值)]，否则返回 None。
+    """
+    patches = []
+    for _cues, points in mkv.cues:
+        for point in points:
+            blocks = [_cue_block(updates, fields, point.time) for fields in point.positions]
+            if not any(blocks):
+                continue
+            new_times = {block.new_start for block in blocks if block is not None}
+            # 同一个 CuePoint 中还有其他轨道或时间不同的字幕块，需要拆分
+            if None in blocks or len(new_times) != 1:
+                return None
+            new_time = new_times.pop()
+            if not _fits(new_time, point.time_width):
+                return None
+            patches.append((point.time_offset, point.time_width, new_time))
+            for fields, block in zip(point.positions, blocks):
+                duration = _field(fields, _ID_CUE_DURATION)
+                if duration is not None and block.new_duration is not None and block.new_duration != duration[1]:
+                    if not _fits(block.new_duration, duration[3]):
+                        return None
+                    patches.append((duration[2], duration[3], block.new_duration))
+    return patches
+
+
+def _sorted_cues(data, header_size):
+    """
+    改写 CueTime 后按时间重新排列 Cues 元素中的 CuePoint，各 CuePoint 的字节不变，元素大小也不变。
+    """
+    pieces = []
+    points = []
+    for element_id, pos, child_header, size in _iter_children(data, header_size, len(data)):
+        piece = data[pos:pos + child_header + size]
+        if element_id == _ID_CUE_POINT:
+            time = 0
+            for child_id, child_pos, time_header, time_size in _iter_children(piece, child_header, len(piece)):
+                if child_id == _ID_CUE_TIME:
+                    time = int.from_bytes(piece[child_pos + time_header:child_pos + time_header + time_size], 'big')
+            points.append((time, len(points), piece))
+            piece = None
+        pieces.append(piece)
+    points = iter(sorted(points))
+    data[header_size:] = b''.join(piece if piece is not None else next(points)[2] for piece in pieces)
+    if next(_iter_children(data, header_size, len(data)), (None,))[0] == _ID_CRC32:
+        _crc_fixed(data, header_size)
+    return data
+
+
+def _patch_file(filepath, mkv, changed, cue_patches):
+    with open(filepath, 'r+b') as f:
+        for cluster in {id(block.cluster): block.cluster for block in changed}.values():
+            check_cancelled()
+            data = _patched_cluster(f, cluster, None)
+            f.seek(cluster.element.offset)
+            f.write(data)
+        if cue_patches:
+            for element, _points in mkv.cues:
+                f.seek(element.offset)
+                data = bytearray(f.read(element.end - element.offset))
+                for offset, width, value in cue_patches:
+                    if element.offset <= offset < element.end:
+                        data[offset - element.offset:offset - element.offset + width] = value.to_bytes(width, 'big')
+                f.seek(element.offset)
+                f.write(_sorted_cues(data, element.header_size))
+        if fsync_policy() == FSYNC_FILE:
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def _rebuilt_cues(mkv, updates, cluster_positions, outputs_by_offset):
+    """
+    重新生成 Cues：字幕轨道的 CuePoint 使用新的时间与位置，与其他轨道共用的 CuePoint 拆分，Cluster 位置按新布局换算。
+    """
+    points = []
+    for _cues, old_points in mkv.cues:
+        for point in old_points:
+            moved = {}
+            kept = []
+            for fields in point.positions:
+                fields = [list(field) for field in fields]
+                block = _cue_block(updates, fields, point.time)
+                cluster_field = _field(fields, _ID_CUE_CLUSTER_POSITION)
+                relative = _field(fields, _ID_CUE_RELATIVE_POSITION)
+                if block is not None:
+                    target = block.target or block.cluster
+                    if cluster_field is not None:
+                        cluster_field[1] = cluster_positions[id(target)]
+                    if relative is not None:
+                        relative[1] = block.new_relative
+                    duration = _field(fields, _ID_CUE_DURATION)
+                    if duration is not None and block.new_duration is not None:
+                        duration[1] = block.new_duration
+                    fields = [field for field in fields if field[0] != _ID_CUE_BLOCK_NUMBER]
+                    moved.setdefault(block.new_start, []).append(fields)
+                    continue
+                if cluster_field is not None:
+                    output = outputs_by_offset.get(cluster_field[1])
+                    if output is not None:
+                        cluster_field[1] = cluster_positions[id(output)]
+                        if output.offsets is not None:
+                            if relative is not None:
+                                relative[1] = output.offsets.get(relative[1], relative[1])
+                            # 重新生成的 Cluster 中块的序号可能变化，去掉可选的 CueBlockNumber
+                            fields = [field for field in fields if field[0] != _ID_CUE_BLOCK_NUMBER]
+                kept.append(fields)
+            # 会生成两次（先计算大小、再写入位置），不修改原来的 CuePoint
+            if kept:
+                points.append(_new_cue_point(point.time, point.time_width, kept))
+            for new_time, positions in moved.items():
+                points.append(_new_cue_point(new_time, point.time_width, positions))
+    points.sort(key=lambda p: p.time)
+    return points
+
+
+def _new_cue_point(time, time_width, positions):
+    point = _CuePoint()
+    point.time = time
+    point.time_width = time_width
+    point.positions = positions
+    return point
+
+
+def _rewrite_file(filepath, mkv, changed, updates):
+    """
+    重写文件：受影响的 Cluster 重新生成（字幕块全部移出后不再有块的 Cluster 删除），Cues 与 SeekHead 按新布局生成，
+    其余顶层元素按原样复制，完成后原子替换原文件。
+    """
+    moved = [block for block in changed if not _stays(block)]
+    created = _place_blocks(mkv.clusters, moved)
+    # 文件总要重写，开始时间改变的块所在的 Cluster 都重新生成，使块保持时间顺序
+    rebuild = {id(block.cluster) for block in changed if block.new_start != block.start or (
+        block.new_duration != block.duration and not _fits(block.new_duration, block.duration_width))}
+    rebuild.update(id(block.target) for block in moved)
+    patch = {id(block.cluster) for block in changed}
+
+    with open(filepath, 'rb') as f:
+        outputs = []
+        cluster_outputs = {}
+        # 删除的 Cluster 在 Segment 中的原位置
+        dropped = set()
+        base = mkv.segment.data_offset
+        prev_size = None
+
+        def add_cluster(cluster):
+            nonlocal prev_size
+            check_cancelled()
+            fix_prev = None
+            if cluster.prev_size is not None and prev_size is not None and cluster.prev_size[0] != prev_size:
+                fix_prev = prev_size
+            if id(cluster) in rebuild or cluster.element is None or (
+                    fix_prev is not None and not _fits(fix_prev, cluster.prev_size[2])):
+                data, offsets = _rebuild_cluster(f, cluster, fix_prev)
+                if data is None:
+                    dropped.add(cluster.element.offset - base)
+                    return
+                output = _Output(cluster.element, data, offsets)
+            elif id(cluster) in patch or fix_prev is not None:
+                output = _Output(cluster.element, _patched_cluster(f, cluster, fix_prev))
+            else:
+                output = _Output(cluster.element)
+            outputs.append(output)
+            cluster_outputs[id(cluster)] = output
+            prev_size = output.size
+
+        clusters = iter(mkv.clusters)
+        cluster_index = -1
+        for new_cluster in created.get(-1, ()):
+            add_cluster(new_cluster)
+        for element in mkv.elements:
+            if element.id == _ID_CLUSTER:
+                cluster_index += 1
+                add_cluster(next(clusters))
+                for new_cluster in created.get(cluster_index, ()):
+                    add_cluster(new_cluster)
+            elif element.id in (_ID_CUES, _ID_SEEK_HEAD):
+                # 大小与位置无关，先占位，布局确定后再生成
+                outputs.append(_Output(element, b''))
+            else:
+                outputs.append(_Output(element))
+
+        outputs_by_offset = {output.element.offset - base: output for output in outputs
+                             if output.element is not None}
+        seek_heads = {}
+        for output in outputs:
+            if output.element is not None and output.element.id == _ID_SEEK_HEAD:
+                seek_heads[id(output)] = [entry for entry in mkv.seek_heads[output.element.offset]
+                                          if entry[1] not in dropped]
+        cues_outputs = [output for output in outputs if output.element is not None and output.element.id == _ID_CUES]
+        cues = None
+        if cues_outputs:
+            # Cues 只保留一份：全部 CuePoint 合并后写在第一个 Cues 的位置
+            cues = cues_outputs[0]
+            for output in cues_outputs[1:]:
+                outputs.remove(output)
+                outputs_by_offset[output.element.offset - base] = cues
+
+        def serialize(cluster_positions, position_width):
+            for output in outputs:
+                if id(output) in seek_heads:
+                    entries = [(seek_id, cluster_positions[id(outputs_by_offset[position])]
+                                if position in outputs_by_offset else position, width)
+                               for seek_id, position, width in seek_heads[id(output)]]
+                    output.data = _serialize_seek_head(entries, position_width)
+                    output.size = len(output.data)
+            if cues is not None:
+                cues.data = _serialize_cues(_rebuilt_cues(mkv, updates, cluster_positions, outputs_by_offset),
+                                            position_width)
+                cues.size = len(cues.data)
+
+        def layout():
+            positions = {}
+            pos = 0
+            for output in outputs:
+                positions[id(output)] = pos
+                pos += output.size
+            positions.update((key, positions[id(output)]) for key, output in cluster_outputs.items())
+            return positions, pos
+
+        # 位置字段按 8 字节生成时 Segment 最大，以此确定位置字段实际需要的宽度
+        dummy = dict.fromkeys(map(id, outputs), 0)
+        dummy.update((id(cluster), 0) for cluster in _all_clusters(mkv, created))
+        serialize(dummy, _POSITION_WIDTH)
+        position_width = min(_POSITION_WIDTH, _uint_width(layout()[1]))
+        serialize(dummy, position_width)
+        positions, segment_size = layout()
+        serialize(positions, position_width)
+
+        segment = mkv.segment
+        f.seek(0)
+        with atomic_open(filepath, binary=True) as outfile:
+            with stage('write'):
+                _copy_range(f, outfile, 0, segment.offset)
+                f.seek(segment.offset)
+                header = f.read(segment.header_size)
+                if segment.size is not None:
+                    id_length = _vint_length(header, 0)
+                    width = segment.header_size - id_length
+                    width = width if segment_size < (1 << (7 * width)) - 1 else None
+                    header = header[:id_length] + _encode_size(segment_size, width)
+                outfile.write(header)
+                for output in outputs:
+                    check_cancelled()
+                    if output.data is None:
+                        _copy_range(f, outfile, output.element.offset, output.size)
+                    else:
+                        outfile.write(output.data)
+                _copy_range(f, outfile, mkv.segment_end, mkv.file_size - mkv.segment_end)
+            record = metrics.current()
+            if record is not None:
+                record.bytes_out += outfile.tell()
+
+
+def _all_clusters(mkv, created):
+    yield from mkv.clusters
+    for clusters in created.values():
+        yield from clusters
+
+
+def _copy_range(infile, outfile, offset, size):
+    infile.seek(offset)
+    while size > 0:
+        chunk = infile.read(min(size, _COPY_BLOCK_SIZE))
+        if not chunk:
+            raise ValueError("文件不完整")
+        outfile.write(chunk)
+        size -= len(chunk)
+
+
+def shift_matroska(filepath, offset_ms, layers=None, window=None, sync_map=None, event_filter=None):
+    """
+    调整 Matroska 文件（.mks/.mkv）中所有文本字幕轨道（ASS/SSA/SRT）的时间轴，返回是否写入了文件。
+    只改写字幕块的相对时间戳、BlockDuration 以及对应的 Cues，音视频数据不变，也不需要重新封装：
+
+    - 新的时间仍在所在 Cluster 的时间范围（到下一个 Cluster 的 Timestamp 为止）内时，直接在原文件中改写
+      （与 mmap 引擎相同，写入过程中断可能留下部分修改的文件）
+    - 否则将字幕块按时间顺序移到范围包含新时间的 Cluster，重新生成受影响的 Cluster、Cues 与 SeekHead 后
+      原子替换原文件，其余 Cluster 按原样复制；字幕块移出后变空的 Cluster 删除，反向调整可以还原原文件
+
+    offset_ms、layers、window、sync_map、event_filter 的含义同 sub_adjust；layers 只对 ASS/SSA 轨道生效。
+    """
+    with open(filepath, 'rb') as f:
+        with stage('parse'):
+            mkv = _Matroska(f)
+        if not mkv.tracks:
+            raise ValueError("没有找到文本字幕轨道（ASS/SSA/SRT）")
+        layers = set(layers) if layers else None
+        timing = _Timing(mkv.timestamp_scale, offset_ms, sync_map)
+        changed = []
+        count = 0
+        with stage('transform'):
+            for block in mkv.blocks():
+                count += 1
+                block.new_start, block.new_duration = block.start, block.duration
+                if not _selected(f, block, mkv.tracks[block.track], timing, layers, window, event_filter):
+                    continue
+                new_start, new_end = timing.apply(block.start, None if block.duration is None
+                                                  else block.start + block.duration)
+                block.new_start = new_start
+                if new_end is not None:
+                    block.new_duration = new_end - new_start
+                if block.changed:
+                    changed.append(block)
+    record = metrics.current()
+    if record is not None:
+        record.events += count
+        record.bytes_in += mkv.file_size
+    if not changed:
+        return False
+
+    updates = _cue_updates(mkv, changed)
+    in_place = all(_stays(block) and
+                   (block.new_duration == block.duration or _fits(block.new_duration, block.duration_width))
+                   for block in changed)
+    cue_patches = _cue_in_place(mkv, updates) if in_place else None
+    if cue_patches is not None:
+        with stage('write'):
+            _patch_file(filepath, mkv, changed, cue_patches)
+    else:
+        _rewrite_file(filepath, mkv, changed, updates)
+    return True
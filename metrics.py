@@ -0,0 +1,200 @@
+import json
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+
+# 处理阶段：读取文件、解码、解析事件、调整时间、格式化输出、写入文件
+STAGES = ('read', 'decode', 'parse', 'transform', 'format', 'write')
+METRICS_FORMATS = ('text', 'json')
+
+# 当前进程中正在记录的文件，未启用统计时为 None，各处理阶段只需判断一次 None
+_current = None
+_NULL_STAGE = nullcontext()
+
+
+class FileMetrics:
+    """
+    单个文件的统计：总耗时与各阶段耗时（秒）、事件数、输入/输出字节数以及处理完成时的进程峰值内存。
+    """
+    __slots__ = ('path', 'ok', 'seconds', 'stages', 'events', 'bytes_in', 'bytes_out', 'peak_rss_kb')
+
+    def __init__(self, path):
+        self.path = path
+        self.ok = True
+        self.seconds = 0.0
+        self.stages = dict.fromkeys(STAGES, 0.0)
+        self.events = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.peak_rss_kb = None
+
+    def as_dict(self):
+        return {
+            'path': self.path,
+            'ok': self.ok,
+            'seconds': round(self.seconds, 6),
+            'stages': {name: round(seconds, 6) for name, seconds in self.stages.items()},
+            'events': self.events,
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'events_per_sec': round(self.events / self.seconds) if self.seconds else None,
+            'peak_rss_kb': self.peak_rss_kb,
+        }
+
+
+class _Stage:
+    __slots__ = ('record', 'name', 'begin')
+
+    def __init__(self, record, name):
+        self.record = record
+        self.name = name
+
+    def __enter__(self):
+        self.begin = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.record.stages[self.name] += time.perf_counter() - self.begin
+
+
+def current():
+    """
+    返回正在记录的 FileMetrics，未启用统计时返回 None。
+    """
+    return _current
+
+
+def stage(name):
+    """
+    计时一个处理阶段：with stage('parse'): ...。未启用统计时返回共享的空上下文，不做任何计时。
+    """
+    if _current is None:
+        return _NULL_STAGE
+    return _Stage(_current, name)
+
+
+def peak_rss_kb():
+    """
+    当前进程的峰值内存（KB）。Windows 上没有 resource 模块，返回 None。
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 的单位为字节，Linux 为 KB
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+@contextmanager
+def recording(path):
+    """
+    在 with 块内记录一个文件的统计，产出 FileMetrics。
+    """
+    global _current
+    record = FileMetrics(path)
+    _current = record
+    begin = time.perf_counter()
+    try:
+        yield record
+    finally:
+        _current = None
+        record.seconds = time.perf_counter() - begin
+        record.peak_rss_kb = peak_rss_kb()
+
+
+def measure(worker, *args):
+    """
+    执行 worker(*args) 并记录统计，返回 ((是否成功, 失败原因), FileMetrics)。args 的第一项为文件路径。
+    与 functools.partial 组合后可直接交给 batch.run_jobs，在工作进程中记录后随结果一起返回。
+    """
+    with recording(args[0]) as record:
+        result = worker(*args)
+    record.ok = bool(result[0])
+    return result, record
+
+
+def unpack(result):
+    """
+    拆开 measure 的返回值，返回 (worker 的结果, FileMetrics)。进程池错误时结果中没有统计，返回 (原结果, None)。
+    """
+    if len(result) == 2 and isinstance(result[1], FileMetrics):
+        return result
+    return result, None
+
+
+@contextmanager
+def profiling(path):
+    """
+    path 不为空时在 with 块内启用 cProfile，结束后将结果保存为 pstats 文件。
+    """
+    if not path:
+        yield
+        return
+    import cProfile
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+
+
+class Report:
+    """
+    汇总多个文件的统计。
+    """
+
+    def __init__(self):
+        self.files = []
+        self.begin = time.perf_counter()
+
+    def add(self, record):
+        self.files.append(record)
+
+    def summary(self):
+        wall = time.perf_counter() - self.begin
+        events = sum(record.events for record in self.files)
+        peaks = [record.peak_rss_kb for record in self.files if record.peak_rss_kb is not None]
+        main_peak = peak_rss_kb()
+        if main_peak is not None:
+            peaks.append(main_peak)
+        return {
+            'files': len(self.files),
+            'failed': sum(not record.ok for record in self.files),
+            'wall_seconds': round(wall, 6),
+            'cpu_seconds': round(sum(record.seconds for record in self.files), 6),
+            'stages': {name: round(sum(record.stages[name] for record in self.files), 6) for name in STAGES},
+            'events': events,
+            'bytes_in': sum(record.bytes_in for record in self.files),
+            'bytes_out': sum(record.bytes_out for record in self.files),
+            'events_per_sec': round(events / wall) if wall else None,
+            'peak_rss_kb': max(peaks) if peaks else None,
+        }
+
+    def to_json(self):
+        return json.dumps({'files': [record.as_dict() for record in self.files], 'total': self.summary()},
+                          ensure_ascii=False, indent=2)
+
+    def format_text(self):
+        total = self.summary()
+        lines = [f"性能统计：共 {total['files']} 个文件，总耗时 {total['wall_seconds'] * 1000:.1f} ms，"
+                 f"各文件累计 {total['cpu_seconds'] * 1000:.1f} ms"]
+        for name in STAGES:
+            lines.append(f"  {name:<10}{total['stages'][name] * 1000:10.1f} ms")
+        peak = '未知' if total['peak_rss_kb'] is None else f"{total['peak_rss_kb'] / 1024:.1f} MB"
+        lines.append(f"  事件数 {total['events']}，输入 {total['bytes_in']} 字节，输出 {total['bytes_out']} 字节，"
+                     f"每秒 {total['events_per_sec']} 个事件，峰值内存 {peak}")
+        return '\n'.join(lines)
+
+
+def emit(report, fmt, log, stream=None):
+    """
+    输出统计：json 写到 stream（默认为标准输出），text 交给 log（例如 logger.info）。
+    """
+    if fmt == 'json':
+        stream = stream or sys.stdout
+        stream.write(report.to_json() + '\n')
+        stream.flush()
+    else:
+        log(f"\n{report.format_text()}")
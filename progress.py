@@ -0,0 +1,154 @@
+import sys
+import time
+
+# 进度事件类型：开始处理（并行时为提交到进程池）、处理成功、处理失败、被取消
+STARTED = 'started'
+FINISHED = 'finished'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+CANCELLED_REASON = "已取消"
+
+# 当前进程中生效的取消标记，由 install 设置；未设置时 check_cancelled 只做一次 None 判断
+_token = None
+
+
+class Cancelled(Exception):
+    """
+    处理过程中检测到取消请求。
+    """
+
+    def __init__(self):
+        super().__init__(CANCELLED_REASON)
+
+
+class CancelToken:
+    """
+    可跨进程共享的取消标记：主进程调用 cancel()，工作进程在文件之间及数据块之间检查。
+    只能在创建进程池时（通过 initializer 参数）传给子进程。
+    """
+
+    def __init__(self):
+        import multiprocessing
+        self._event = multiprocessing.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    def cancelled(self):
+        return self._event.is_set()
+
+
+def install(token):
+    """
+    设置当前进程的取消标记，传入 None 时取消设置。
+    """
+    global _token
+    _token = token
+
+
+def check_cancelled():
+    """
+    已请求取消时抛出 Cancelled。处理大文件时在数据块之间调用。
+    """
+    if _token is not None and _token.cancelled():
+        raise Cancelled()
+
+
+class ProgressEvent:
+    """
+    单个文件的进度：done 为已完成的文件数，total 为文件总数（边遍历边处理时为 None），
+    events、seconds 为该文件处理的事件数与耗时（仅完成时有效），reason 为失败原因。
+    """
+    __slots__ = ('kind', 'path', 'done', 'total', 'events', 'seconds', 'reason')
+
+    def __init__(self, kind, path, done, total, events=0, seconds=0.0, reason=None):
+        self.kind = kind
+        self.path = path
+        self.done = done
+        self.total = total
+        self.events = events
+        self.seconds = seconds
+        self.reason = reason
+
+
+class ProgressTracker:
+    """
+    汇总进度事件，供进度条与界面显示。
+    """
+
+    def __init__(self):
+        self.begin = time.perf_counter()
+        self.done = 0
+        self.failed = 0
+        self.total = None
+        self.events = 0
+        self.current = None
+
+    def update(self, event):
+        self.total = event.total
+        if event.kind == STARTED:
+            self.current = event.path
+            return
+        self.done = event.done
+        self.events += event.events
+        if event.kind != FINISHED:
+            self.failed += 1
+
+    def elapsed(self):
+        return time.perf_counter() - self.begin
+
+    def fraction(self):
+        return self.done / self.total if self.total else None
+
+    def describe(self):
+        elapsed = self.elapsed()
+        files = f"{self.done}/{self.total}" if self.total is not None else f"{self.done}"
+        text = f"已处理 {files} 个文件"
+        if self.failed:
+            text += f"（失败 {self.failed} 个）"
+        rate = self.events / elapsed if elapsed else 0
+        return f"{text}，{self.events} 个事件，每秒 {rate:.0f} 个事件，已用 {elapsed:.1f} 秒"
+
+
+class ProgressBar:
+    """
+    命令行进度条，作为进度回调使用：ProgressBar()(event)。每秒最多刷新 10 次，结束时调用 close()。
+    输出被重定向到文件或管道时不逐次刷新，只在结束时写一行汇总。
+    """
+    WIDTH = 24
+    INTERVAL = 0.1
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stderr
+        self.tracker = ProgressTracker()
+        self.last_draw = 0.0
+        self.last_width = 0
+        self.interactive = self.stream.isatty()
+
+    def __call__(self, event):
+        self.tracker.update(event)
+        if not self.interactive:
+            return
+        now = time.perf_counter()
+        if now - self.last_draw >= self.INTERVAL:
+            self.last_draw = now
+            self.draw()
+
+    def draw(self):
+        fraction = self.tracker.fraction()
+        if fraction is None:
+            bar = ''
+        else:
+            filled = int(fraction * self.WIDTH)
+            bar = f"[{'#' * filled}{'.' * (self.WIDTH - filled)}] {fraction:4.0%} "
+        line = f"{bar}{self.tracker.describe()}"
+        # 用空格覆盖上一次输出的剩余部分，不依赖终端控制序列（Windows 控制台默认不支持）
+        self.stream.write(f"\r{line.ljust(self.last_width)}")
+        self.stream.flush()
+        self.last_width = len(line)
+
+    def close(self):
+        self.draw()
+        self.stream.write('\n')
+        self.stream.flush()
@@ -1,13 +1,20 @@
 import os
-import re
-import threading
-import tkinter as tk
-from tkinter import (messagebox, scrolledtext)
-from typing import List, Optional
-import webbrowser
+import sys
+from typing import Iterable, Optional
 from docopt import docopt
 from loguru import logger
-from utils import center_window, custom_messagebox, display_errors, hide_console
+# GUI 与平台相关模块（tkinter、webbrowser、utils 等）只在启动 GUI 时导入，命令行模式只加载处理核心
+from sub_core import (FORMAT_ASS, FORMAT_SRT, FSYNC_BATCH, FSYNC_FILE, UNCHANGED, EventIndex, SyncMap,
+                      format_for_path, fsync_policy, load_events, parse_data, parse_layers, parse_timestamp,
+                      patch_file_in_place, set_fsync_policy, shift_file, shift_stream, shift_text, sync_files,
+                      write_events)
+from archive import is_archive, rewrite_archive
+from matroska import is_matroska, shift_matroska
+from batch import largest_first, parse_jobs, run_batch, run_watch
+from discovery import expand_inputs, iter_subtitle_files
+from event_filter import compile_filter
+from metrics import METRICS_FORMATS, Report, current, emit, profiling, recording, stage
+from progress import CancelToken, ProgressBar
 import queue
 
 __version__ = 'sub_adjust v1.2.0'
@@ -15,17 +22,47 @@ __version__ = 'sub_adjust v1.2.0'
 USAGE = f"""
 {__version__}
 Usage:
-  sub_adjust --offset <subtitle_shift_seconds> [--layers <layer_numbers>] [INPUTS...]
+  sub_adjust --offset <subtitle_shift_seconds> [--layers <layer_numbers>] [--jobs <n>] [--engine <name>] [--from <time>] [--to <time>] [--filter <expr>] [--metrics <format>] [--profile <file>] [--progress] [--fsync <policy>] [--watch] [-r] [--include <glob>]... [--exclude <glob>]... [--format <name>] [INPUTS...]
+  sub_adjust --sync-map <file> [--layers <layer_numbers>] [--jobs <n>] [--engine <name>] [--from <time>] [--to <time>] [--filter <expr>] [--metrics <format>] [--profile <file>] [--progress] [--fsync <policy>] [--watch] [-r] [--include <glob>]... [--exclude <glob>]... [--format <name>] [INPUTS...]
   sub_adjust --version
   sub_adjust (-h | --help)
   sub_adjust
 
 Options:
   -t --offset <subtitle_shift_seconds>    字幕偏移量（单位：秒，1s = 1000ms），支持小数、负数、正数，负数为提前，正数为延后。
+  --sync-map <file>                       同步映射文件（UTF-8），代替 --offset 一次完成多段不同偏移量的调整。每行一条，# 开头为注释：
+                                          “时间点 偏移秒数”（例如 0:12:34 +2.0）表示该时间点起开始的事件偏移对应的量，直到下一个时间点；
+                                          “原时间 -> 目标时间”（例如 0:12:34 -> 0:12:36.5）表示锚点，锚点之间线性插值
   --layers <layer_numbers>                可选参数，将时间调整仅应用到此处设置的Layer中。默认为 all
+  -j --jobs <n>                           可选参数，并行处理文件的进程数。默认为 CPU 核心数
+  -r --recursive                          可选参数，处理目录时包含所有子目录
+  -w --watch                              可选参数，监视模式：持续处理 INPUTS 目录（默认为程序当前目录）中新增或修改的字幕文件，
+                                          直到按 Ctrl+C 停止。启动时已存在的文件不处理，仍在写入的文件等写入完成后再处理
+  --include <glob>                        可选参数，只处理匹配该模式的文件，可重复指定。不含 / 的模式匹配文件名，含 / 的模式匹配相对路径
+  --exclude <glob>                        可选参数，跳过匹配该模式的文件或目录，可重复指定。匹配规则同 --include
+  --engine <name>                         可选参数，时间轴处理引擎：stream（逐行流式处理，内存占用恒定）、numpy（整文件向量化处理，需安装 numpy）
+                                          或 mmap（时间戳宽度不变时直接在原文件中改写，不重写整个文件，但写入过程中断可能留下部分修改的文件）。默认为 stream
+  --from <time>                           可选参数，只调整开始时间不早于该时间点的事件，格式为 h:mm:ss[.ff] 或秒数
+  --to <time>                             可选参数，只调整开始时间早于该时间点的事件，格式同 --from
+  --filter <expr>                         可选参数，只调整匹配过滤表达式的事件，可按 layer、style、actor、effect、text 筛选，例如
+                                          "style=Sign,Title"、"layer=0-2 and not text~^♪"、"actor!=旁白 or effect~Banner"。
+                                          = / != 后可跟逗号分隔的多个值，~ / !~ 为正则匹配，含空格等字符的值用引号括起
+  --metrics <format>                      可选参数，处理完成后输出性能统计：text（写入日志）或 json（写到标准输出，管道模式下写到标准错误）。
+                                          包含每个文件及汇总的 read、decode、parse、transform、format、write 各阶段耗时，
+                                          以及事件数、字节数、每秒事件数与峰值内存。不指定时不做任何统计
+  --profile <file>                        可选参数，使用 cProfile 记录性能分析数据并保存到该文件（pstats 格式）。启用时在单进程中处理
+  --progress                              可选参数，在标准错误上显示进度条（已处理文件数、事件数与每秒处理的事件数）
+  --fsync <policy>                        可选参数，写入的落盘策略：file（每个文件写完立即落盘）、batch（全部处理完成后统一落盘）
+                                          或 none（交给操作系统）。默认为 file。处理结果与原文件相同时不会重写文件
+  --format <name>                         可选参数，标准输入的字幕格式（ass 或 srt）。默认根据内容判断
   --version                               显示版本信息
   -h --help                               显示帮助信息
 
+INPUTS 为 - 时从标准输入读取，结果写到标准输出（日志输出到标准错误），可用于管道。此时固定使用 stream 引擎。
+INPUTS 可以是 zip 压缩包：直接处理其中的字幕并替换压缩包，无需解压，其余文件按原始压缩数据复制。压缩包中的字幕在内存中处理，不使用 mmap 与 numpy 引擎。
+INPUTS 可以是 Matroska 文件（.mks/.mkv）：直接调整其中所有文本字幕轨道（ASS/SSA/SRT）的时间戳，无需提取与重新封装，音视频数据不变。
+新的时间戳仍能放入原位置时直接改写原文件，否则只重新生成受影响的部分后替换原文件。
+
 Examples (二进制版本，需自行编译):
   # 将字幕提前2.5秒
   sub_adjust --offset -2.5 example.ass
@@ -35,7 +72,37 @@ Examples (二进制版本，需自行编译):
  
   # 将多个字幕文件延后3秒
   sub_adjust --offset 3 example.ass example.srt
+
+  # 使用4个进程并行处理当前目录下的字幕文件
+  sub_adjust --offset 3 --jobs 4
+
+  # 处理 Season1 目录及其子目录下除 NCOP/NCED 以外的所有 ass 字幕
+  sub_adjust --offset 3 --recursive --include "*.ass" --exclude "NC*" Season1
+
+  # 广告切除导致的错位：将 00:12:34 之后开始的字幕延后2秒
+  sub_adjust --offset 2 --from 0:12:34 example.ass
+
+  # 只调整特效字幕（样式为 Sign 或 Title），对白保持不变
+  sub_adjust --offset 0.5 --filter "style=Sign,Title" example.ass
+
+  # 按同步映射文件一次完成多段调整
+  sub_adjust --sync-map sync.txt example.ass
+
+  # 使用 numpy 引擎处理事件数很多的字幕文件
+  sub_adjust --offset 3 --engine numpy huge.ass
+
+  # 直接处理字幕包中的所有字幕
+  sub_adjust --offset -1 subs.zip
+
+  # 直接调整视频文件中内封的文本字幕
+  sub_adjust --offset -1 example.mkv
  
+  # 监视下载目录及其子目录，新放入的字幕自动延后1秒
+  sub_adjust --offset 1 --watch --recursive downloads
+
+  # 在管道中使用
+  cat example.ass | sub_adjust --offset 3 - > shifted.ass
+
   # 显示版本信息
   sub_adjust --version
 
@@ -53,214 +120,335 @@ Examples (Python运行源码):
 # 全局变量用于判断是否为命令行模式
 is_cmd_mode = False
 
-# 时间和文件处理函数
-def time_to_ms(h, m, s, cs):
-    return max(0, (int(h) * 3600 + int(m) * 60 + int(s)) * 1000 + int(cs) * 10)
-
-def ms_to_time(ms):
-    h = ms // 3600000
-    m = (ms % 3600000) // 60000
-    s = (ms % 60000) // 1000
-    cs = (ms % 1000) // 10
-    return f"{int(h)}:{int(m):02}:{int(s):02}.{int(cs):02}"
-
-def srt_time_to_ms(h, m, s, ms):
-    return max(0, (int(h) * 3600 + int(m) * 60 + int(s)) * 1000 + int(ms))
-
-def ms_to_srt_time(ms):
-    h = int(ms // 3600000)
-    m = int((ms % 3600000) // 60000)
-    s = int((ms % 60000) // 1000)
-    ms = int(ms % 1000)
-    return f"{h:02}:{m:02}:{s:02},{ms:03}"
-
-def process_srt_file(filepath, adjusted_shift_value):
-    try:
-        with open(filepath, 'r', encoding='utf-8') as infile:
-            lines = infile.readlines()
-
-        new_lines = []
-        for line in lines:
-            if " --> " in line:
-                start_time, end_time = line.split(" --> ")
-                h1, m1, s1, ms1 = start_time.replace(',', ':').split(':')
-                h2, m2, s2, ms2 = end_time.replace(',', ':').split(':')
-
-                start_ms = srt_time_to_ms(h1, m1, s1, ms1) + adjusted_shift_value
-                end_ms = srt_time_to_ms(h2, m2, s2, ms2) + adjusted_shift_value
-
-                start_ms = max(0, start_ms)
-                end_ms = max(0, end_ms)
-
-                new_start_time = ms_to_srt_time(start_ms)
-                new_end_time = ms_to_srt_time(end_ms)
+ENGINE_STREAM = "stream"
+ENGINE_NUMPY = "numpy"
+ENGINE_MMAP = "mmap"
+ENGINES = (ENGINE_STREAM, ENGINE_NUMPY, ENGINE_MMAP)
 
-                line = f"{new_start_time} --> {new_end_time}\n"
-            new_lines.append(line)
-
-        with open(filepath, 'w', encoding='utf-8') as outfile:
-            outfile.writelines(new_lines)
+# 时间和文件处理函数
+def log_parse_errors(errors):
+    if is_cmd_mode:
+        for error in errors:
+            logger.error(error)
+
+def parse_window(start=None, end=None):
+    """
+    解析 --from/--to，返回 (开始毫秒, 结束毫秒)，未指定的一端为 None；两端都未指定时返回 None。
+    """
+    if start is None and end is None:
+        return None
+    return (None if start is None else parse_timestamp(start),
+            None if end is None else parse_timestamp(end))
+
+def select_window(store, window):
+    # 通过开始时间索引选出时间窗口内的事件，无需逐个比较
+    if window is None:
+        return None
+    return EventIndex(store).starting_in(*window)
+
+def select_events(store, window=None, event_filter=None):
+    """
+    先按时间窗口、再按过滤表达式选出需要调整的事件下标，两者都未指定时返回 None（全部事件）。
+    """
+    indices = select_window(store, window)
+    if event_filter is not None:
+        indices = store.select(event_filter, indices)
+    return indices
+
+def shift_subtitle(filepath, adjusted_shift_value, layers, fmt, engine, errors, window=None, sync_map=None,
+                   event_filter=None):
+    if engine == ENGINE_NUMPY:
+        import sub_vector
+        store = sub_vector.load_events(filepath, fmt=fmt)
+        errors.extend(store.errors)
+        with stage('transform'):
+            if sync_map is not None:
+                sub_vector.sync_store(store, sync_map, layers, select_events(store, window, event_filter))
+            else:
+                sub_vector.shift_store(store, adjusted_shift_value, layers,
+                                       select_events(store, window, event_filter))
+        return sub_vector.write_events(store, filepath)
+    elif window is not None or sync_map is not None or event_filter is not None:
+        # 时间窗口需要按开始时间查询事件，同步映射需要按事件时间查找分段，过滤需要读取事件字段，先整体解析再写出
+        store = load_events(filepath, fmt=fmt)
+        errors.extend(store.errors)
+        with stage('transform'):
+            if sync_map is not None:
+                store.apply_sync_map(sync_map, layers, select_events(store, window, event_filter))
+            else:
+                store.shift(adjusted_shift_value, layers, select_events(store, window, event_filter))
+        return write_events(store, filepath)
+    elif engine == ENGINE_MMAP:
+        # 时间戳宽度会改变（例如跨越 10 小时）时退回到流式重写
+        patched = patch_file_in_place(filepath, adjusted_shift_value, layers, fmt=fmt, errors=errors)
+        if patched is not None:
+            return patched > 0
+    return shift_file(filepath, adjusted_shift_value, layers, fmt=fmt, errors=errors)
+
+def log_success(filepath, written):
+    if is_cmd_mode:
+        logger.info(f"成功处理文件: {filepath}" if written else f"文件内容未变化，跳过写入: {filepath}")
+    return True, None if written else UNCHANGED
 
+def process_srt_file(filepath, adjusted_shift_value, engine=ENGINE_STREAM, window=None, sync_map=None,
+                     event_filter=None):
+    try:
+        written = shift_subtitle(filepath, adjusted_shift_value, None, FORMAT_SRT, engine, [], window, sync_map,
+                                 event_filter)
+        return log_success(filepath, written)
+    except Exception as e:
         if is_cmd_mode:
-            logger.info(f"成功处理文件: {filepath}")
-        return True, None
+            logger.error(f"错误处理文件 {filepath}: {str(e)}")
+        return False, str(e)
+
+def process_ass_ssa_file(filepath, adjusted_shift_value, layers, engine=ENGINE_STREAM, window=None, sync_map=None,
+                         event_filter=None):
+    try:
+        errors = []
+        # 仅调整处理范围内的层，其余事件原样输出
+        written = shift_subtitle(filepath, adjusted_shift_value, layers, FORMAT_ASS, engine, errors, window, sync_map,
+                                 event_filter)
+        log_parse_errors(errors)
+        return log_success(filepath, written)
     except Exception as e:
         if is_cmd_mode:
             logger.error(f"错误处理文件 {filepath}: {str(e)}")
         return False, str(e)
+    
+def process_archive(filepath, adjusted_shift_value, layers, window=None, sync_map=None, event_filter=None):
+    """
+    调整 zip 压缩包中所有字幕的时间轴并原子替换压缩包，其余文件按原始压缩数据复制（见 archive.rewrite_archive）。
+    """
+    try:
+        errors = []
 
-def parse_layers(layer_numbers):
-    if not layer_numbers or layer_numbers.lower() == "all":
-        return []
-    return [int(layer) for layer in layer_numbers.split(',')]
+        def shift_member(data, name):
+            fmt = format_for_path(name)
+            return shift_data(data, adjusted_shift_value, layers if fmt == FORMAT_ASS else None, fmt, window,
+                              sync_map, event_filter, errors)
 
-def is_layer_included(layer, layers):
-    if not layers:
-        return True
-    return layer in layers
+        written = rewrite_archive(filepath, filepath, shift_member)
+        log_parse_errors(errors)
+        return log_success(filepath, written)
+    except Exception as e:
+        if is_cmd_mode:
+            logger.error(f"错误处理文件 {filepath}: {str(e)}")
+        return False, str(e)
 
-def process_ass_ssa_file(filepath, adjusted_shift_value, layers):
+def process_matroska(filepath, adjusted_shift_value, layers, window=None, sync_map=None, event_filter=None):
+    """
+    调整 Matroska 文件中所有文本字幕轨道的时间轴，只改写字幕块的时间戳（见 matroska.shift_matroska）。
+    """
     try:
-        with open(filepath, 'r', encoding='utf-8') as infile:
-            lines = infile.readlines()
-
-        new_lines = []
-        for line in lines:
-            if line.startswith("Dialogue: "):
-                parts = line.split(",", 9)
-                
-                # 使用正则表达式处理SSA和ASS的layer部分
-                layer_match = re.match(r"Dialogue: (Marked=)?(\d+)", parts[0])
-                if layer_match:
-                    layer = int(layer_match.group(2))
-                else:
-                    if is_cmd_mode:
-                        logger.error(f"错误解析行的层级: {line}")
-                    continue
-                
-                # 判断当前层是否在处理范围内
-                if is_layer_included(layer, layers):
-                    start_time = parts[1]
-                    end_time = parts[2]
-
-                    try:
-                        h1, m1, s1_cs1 = start_time.split(":")
-                        s1, cs1 = s1_cs1.split(".")
-                        h2, m2, s2_cs2 = end_time.split(":")
-                        s2, cs2 = s2_cs2.split(".")
-                    except ValueError:
-                        if is_cmd_mode:
-                            logger.error(f"错误解析时间: {start_time} 或 {end_time}")
-                        continue
-
-                    start_ms = time_to_ms(h1, m1, s1, cs1) + adjusted_shift_value
-                    end_ms = time_to_ms(h2, m2, s2, cs2) + adjusted_shift_value
-
-                    start_ms = max(0, start_ms)
-                    end_ms = max(0, end_ms)
-
-                    parts[1] = ms_to_time(start_ms)
-                    parts[2] = ms_to_time(end_ms)
-
-                line = ",".join(parts)
-            new_lines.append(line)
-
-        with open(filepath, 'w', encoding='utf-8') as outfile:
-            outfile.writelines(new_lines)
-
-        if is_cmd_mode:
-            logger.info(f"成功处理文件: {filepath}")
-        return True, None
+        written = shift_matroska(filepath, adjusted_shift_value, layers, window, sync_map, event_filter)
+        return log_success(filepath, written)
     except Exception as e:
         if is_cmd_mode:
             logger.error(f"错误处理文件 {filepath}: {str(e)}")
         return False, str(e)
-    
-def shift_times_in_filelist(filelist: Optional[List[str]], shift_value: float, layers, queue):
-    total_files = len(filelist)
-    success_count = 0
-    failure_count = 0
-    failure_reasons = []
-
-    for filepath in filelist:
-        if filepath.endswith(".ass") or filepath.endswith(".ssa"):
-            success, reason = process_ass_ssa_file(filepath, shift_value, layers)
-        elif filepath.endswith(".srt"):
-            success, reason = process_srt_file(filepath, shift_value)
-        
-        if success:
-            success_count += 1
-        else:
-            failure_count += 1
-            failure_reasons.append(f"{filepath}: {reason}")
 
+def process_subtitle_file(filepath, adjusted_shift_value, layers, engine=ENGINE_STREAM, window=None, sync_map=None,
+                          event_filter=None):
+    if is_archive(filepath):
+        return process_archive(filepath, adjusted_shift_value, layers, window, sync_map, event_filter)
+    if is_matroska(filepath):
+        return process_matroska(filepath, adjusted_shift_value, layers, window, sync_map, event_filter)
+    # 扩展名不区分大小写，与目录遍历（discovery）的选择规则一致
+    try:
+        fmt = format_for_path(filepath)
+    except ValueError:
+        return False, "不支持的字幕格式"
+    if fmt == FORMAT_ASS:
+        return process_ass_ssa_file(filepath, adjusted_shift_value, layers, engine, window, sync_map, event_filter)
+    return process_srt_file(filepath, adjusted_shift_value, engine, window, sync_map, event_filter)
+
+def init_worker(cmd_mode, policy=FSYNC_FILE):
+    # 子进程（Windows 下为 spawn）不会继承主进程中修改过的全局变量
+    global is_cmd_mode
+    is_cmd_mode = cmd_mode
+    set_fsync_policy(policy)
+
+def shift_files(filepaths, adjusted_shift_value, layers, jobs=None, engine=ENGINE_STREAM, window=None, sync_map=None,
+                event_filter=None, report=None, progress=None, cancel=None):
+    """
+    使用进程池并行处理多个字幕文件。filepaths 为列表时大文件优先调度；
+    为惰性迭代器（例如递归遍历目录）时边遍历边处理。report、progress、cancel 的含义见 batch.run_batch。
+    返回 (文件总数, 成功数, 失败数, 按输入顺序排列的 [(文件, 失败原因)], 内容未变化而未重写的文件数)。
+    落盘策略为 batch 时，全部处理完成后统一 fsync 写入过的文件。
+    """
+    order = {}
+    if isinstance(filepaths, list):
+        order.update((filepath, index) for index, filepath in enumerate(filepaths))
+        tasks = [(filepath, adjusted_shift_value, layers, engine, window, sync_map, event_filter)
+                 for filepath in largest_first(filepaths)]
+    else:
+        def iter_tasks():
+            for filepath in filepaths:
+                order.setdefault(filepath, len(order))
+                yield filepath, adjusted_shift_value, layers, engine, window, sync_map, event_filter
+        tasks = iter_tasks()
+
+    failures = []
+    written = []
+    success_count = skipped_count = 0
+    for (filepath, *_), success, reason in run_batch(process_subtitle_file, tasks, jobs, report, progress, cancel,
+                                                      initializer=init_worker,
+                                                      initargs=(is_cmd_mode, fsync_policy())):
+        if not success:
+            failures.append((filepath, reason))
+            continue
+        success_count += 1
+        if reason == UNCHANGED:
+            skipped_count += 1
+        else:
+            written.append(filepath)
+    if fsync_policy() == FSYNC_BATCH:
+        sync_files(written)
+    failures.sort(key=lambda failure: order[failure[0]])
+    return len(order), success_count, len(failures), failures, skipped_count
+
+def report_result(total_files, success_count, failure_count, failure_reasons, queue, cancelled=False,
+                  skipped_count=0):
     result_message = (
         f"运行完毕。\n"
         f"共处理 {total_files} 个文件。\n"
         f"成功处理 {success_count} 个文件。\n"
         f"失败处理 {failure_count} 个文件。\n"
     )
+    if skipped_count:
+        result_message += f"其中 {skipped_count} 个文件内容未变化，未重写。\n"
+    if cancelled:
+        result_message += "处理已取消，其余文件未处理。\n"
 
     if failure_count > 0:
         result_message += "\n失败原因:\n" + "\n".join(failure_reasons)
-        queue.put(result_message)
-    else:
-        queue.put(result_message)
+
+    queue.put(result_message)
 
     if is_cmd_mode:
         log_result_fn = logger.info if success_count > 0 else logger.error
         log_result_fn(f"\n\n{result_message}")
 
-    
-def shift_times_in_directory(directory, shift_value, shift_direction, layer_numbers, queue):
+def watch_directories(directories, adjusted_shift_value, layers, jobs=None, engine=ENGINE_STREAM, window=None,
+                      sync_map=None, event_filter=None, recursive=False, include=None, exclude=None, report=None,
+                      progress=None):
+    """
+    监视模式：持续处理 directories 中新增或修改的字幕文件，直到按 Ctrl+C 停止（见 batch.run_watch）。
+    处理时写回的文件不会被再次处理。落盘策略为 batch 时，每批文件处理完成后统一 fsync。
+    """
+    from watch import Watcher
+    try:
+        watcher = Watcher(directories, recursive=recursive, include=include, exclude=exclude)
+    except ValueError as e:
+        logger.error(str(e))
+        return
+    written = []
+
+    def on_idle():
+        sync_files(written)
+        written.clear()
+
+    logger.info(f"正在监视（{watcher.backend}）: {', '.join(watcher.roots)}，按 Ctrl+C 停止")
+    results = run_watch(process_subtitle_file, watcher,
+                        lambda filepath: (filepath, adjusted_shift_value, layers, engine, window, sync_map,
+                                          event_filter),
+                        jobs, report, progress, initializer=init_worker, initargs=(is_cmd_mode, fsync_policy()),
+                        on_idle=on_idle if fsync_policy() == FSYNC_BATCH else None)
+    try:
+        for (filepath, *_), success, reason in results:
+            if success and reason != UNCHANGED:
+                written.append(filepath)
+    except KeyboardInterrupt:
+        logger.info("已停止监视")
+    finally:
+        results.close()
+        watcher.close()
+        if fsync_policy() == FSYNC_BATCH:
+            sync_files(written)
+
+def shift_times_in_filelist(filelist: Iterable[str], shift_value: float, layers, queue, jobs=None,
+                            engine=ENGINE_STREAM, window=None, sync_map=None, event_filter=None, report=None,
+                            progress=None, cancel=None):
+    total_files, success_count, failure_count, failures, skipped_count = shift_files(
+        filelist, shift_value, layers, jobs, engine, window, sync_map, event_filter, report, progress, cancel)
+    failure_reasons = [f"{filepath}: {reason}" for filepath, reason in failures]
+    report_result(total_files, success_count, failure_count, failure_reasons, queue,
+                  cancel is not None and cancel.cancelled(), skipped_count)
+
+def shift_times_in_directory(directory, shift_value, shift_direction, layer_numbers, queue, jobs=None,
+                             engine=ENGINE_STREAM, recursive=False, include=None, exclude=None, window=None,
+                             sync_map=None, event_filter=None, report=None, progress=None, cancel=None):
     if shift_direction is None:
         shift_direction = "delay"
     adjusted_shift_value = -shift_value if shift_direction == "advance" else shift_value
     layers = parse_layers(layer_numbers)
 
-    subtitle_files = [f for f in os.listdir(directory) if f.endswith((".ass", ".ssa", ".srt"))]
-    if not subtitle_files:
+    subtitle_files = iter_subtitle_files(directory, recursive=recursive, include=include, exclude=exclude)
+    if not recursive:
+        # 单层目录遍历开销很小，先列出全部文件以便大文件优先调度
+        subtitle_files = list(subtitle_files)
+    total_files, success_count, failure_count, failures, skipped_count = shift_files(
+        subtitle_files, adjusted_shift_value, layers, jobs, engine, window, sync_map, event_filter, report, progress,
+        cancel)
+    if total_files == 0:
         queue.put("目录中没有找到字幕文件。")
         return
 
-    total_files = len(subtitle_files)
-    success_count = 0
-    failure_count = 0
-    failure_reasons = []
-
-    for file in subtitle_files:
-        filepath = os.path.join(directory, file)
-        if file.endswith(".ass") or file.endswith(".ssa"):
-            success, reason = process_ass_ssa_file(filepath, adjusted_shift_value, layers)
-        elif file.endswith(".srt"):
-            success, reason = process_srt_file(filepath, adjusted_shift_value)
-        
-        if success:
-            success_count += 1
+    failure_reasons = [f"{os.path.relpath(filepath, directory)}: {reason}" for filepath, reason in failures]
+    report_result(total_files, success_count, failure_count, failure_reasons, queue,
+                  cancel is not None and cancel.cancelled(), skipped_count)
+
+def shift_data(data, shift_value, layers, fmt=None, window=None, sync_map=None, event_filter=None, errors=None):
+    """
+    在内存中调整字幕数据（str、UTF-8 bytes 或可读取的流）的时间轴，返回与输入同类型的结果（同 shift_text）。
+    无法解析的事件行记录到 errors。
+    """
+    if window is None and sync_map is None and event_filter is None:
+        return shift_text(data, shift_value, layers, fmt, errors)
+    store, is_text = parse_data(data, fmt)
+    if errors is not None:
+        errors.extend(store.errors)
+    with stage('transform'):
+        if sync_map is not None:
+            store.apply_sync_map(sync_map, layers, select_events(store, window, event_filter))
         else:
-            failure_count += 1
-            failure_reasons.append(f"{file}: {reason}")
-
-    result_message = (
-        f"运行完毕。\n"
-        f"共处理 {total_files} 个文件。\n"
-        f"成功处理 {success_count} 个文件。\n"
-        f"失败处理 {failure_count} 个文件。\n"
-    )
-
-    if failure_count > 0:
-        result_message += "\n失败原因:\n" + "\n".join(failure_reasons)
-
-    queue.put(result_message)
-
-    if is_cmd_mode:
-        log_result_fn = logger.info if success_count > 0 else logger.error
-        log_result_fn(f"\n\n{result_message}")
+            store.shift(shift_value, layers, select_events(store, window, event_filter))
+    with stage('format'):
+        result = store.render()
+        return result if is_text else result.encode('utf-8')
+
+def shift_stdio(shift_value, layers, fmt=None, window=None, sync_map=None, event_filter=None):
+    """
+    从标准输入读取字幕、平移时间轴后写到标准输出，不经过文件系统。返回是否成功。
+    """
+    errors = []
+    try:
+        if window is None and sync_map is None and event_filter is None:
+            shift_stream(sys.stdin.buffer, sys.stdout.buffer, shift_value, layers, fmt, errors)
+        else:
+            data = shift_data(sys.stdin.buffer, shift_value, layers, fmt, window, sync_map, event_filter, errors)
+            with stage('write'):
+                sys.stdout.buffer.write(data)
+            record = current()
+            if record is not None:
+                record.bytes_out += len(data)
+        sys.stdout.buffer.flush()
+        success = True
+    except Exception as e:
+        logger.error(f"错误处理标准输入: {str(e)}")
+        success = False
+    log_parse_errors(errors)
+    return success
 
 def open_mail(event=None):
+    import webbrowser
     webbrowser.open("https://github.com/thelastfantasy/sub-adjust/issues")
 
 def show_usage(root):
+    import tkinter as tk
+    from tkinter import scrolledtext
+    from utils import center_window
+
     usage_window = tk.Toplevel(root)
     usage_window.title("命令行帮助")
 
@@ -278,6 +466,12 @@ def show_usage(root):
 
 # GUI部分
 def start_ui():
+    import threading
+    import tkinter as tk
+    from tkinter import messagebox
+    from utils import (PROGRESS_BATCH_SIZE, PROGRESS_QUEUE_SIZE, ProgressPanel, center_window, custom_messagebox,
+                       display_errors, drain_queue)
+
     global root
     root = tk.Tk()
     root.title(f"{__version__} - 字幕时间轴调整")
@@ -315,7 +509,16 @@ def start_ui():
     layer_entry.grid(row=4, column=1, padx=10, pady=5)
     layer_entry.insert(0, "all")
 
+    # 是否包含子目录
+    recursive = tk.BooleanVar(value=False)
+    tk.Checkbutton(root, text="包含子目录", variable=recursive).grid(row=5, column=1, sticky=tk.W)
+
+    # 一次处理中的进度事件队列与取消标记
+    running = {}
+
     def on_submit():
+        if running:
+            return  # 上一次处理尚未结束
         # 获取和处理时间偏移量输入
         shift_value_str = shift_value_entry.get().strip()
         if not shift_value_str:
@@ -327,38 +530,68 @@ def start_ui():
             return
 
         layer_numbers = layer_entry.get()
+        include_subdirs = recursive.get()
         result_queue = queue.Queue()
+        # 有界队列：界面来不及显示时工作线程在 put 处等待，避免事件无限堆积
+        events = queue.Queue(maxsize=PROGRESS_QUEUE_SIZE)
+        cancel = CancelToken()
+        running.update(events=events, cancel=cancel)
+        submit_button.config(state=tk.DISABLED)
+        cancel_button.config(state=tk.NORMAL)
+        progress_panel.start()
 
         # 将 shift_times_in_directory 的调用放到一个新线程中
         def process_files():
-            shift_times_in_directory(os.getcwd(), shift_value * 1000, direction.get(), layer_numbers, result_queue)
+            shift_times_in_directory(os.getcwd(), shift_value * 1000, direction.get(), layer_numbers, result_queue,
+                                     recursive=include_subdirs, progress=events.put, cancel=cancel)
 
         def check_queue():
+            # 每次只取一批进度事件，大批量处理时不会占满界面线程
+            progress_panel.update(drain_queue(events, PROGRESS_BATCH_SIZE))
+            if not events.empty():
+                root.after(100, check_queue)
+                return
             try:
                 result_message = result_queue.get_nowait()
-                if result_message:
-                    if "失败原因" in result_message:
-                        display_errors(root, result_message)
-                    else:
-                        custom_messagebox(root, result_message)
             except queue.Empty:
                 root.after(100, check_queue)
+                return
+            running.clear()
+            submit_button.config(state=tk.NORMAL)
+            cancel_button.config(state=tk.DISABLED)
+            progress_panel.finish("已取消" if cancel.cancelled() else None)
+            if result_message:
+                if "失败原因" in result_message:
+                    display_errors(root, result_message)
+                else:
+                    custom_messagebox(root, result_message)
 
         threading.Thread(target=process_files, daemon=True).start()
         root.after(100, check_queue)
 
-    tk.Button(root, text="处理", command=on_submit).grid(row=5, columnspan=3, pady=10)
+    def on_cancel():
+        if running:
+            running['cancel'].cancel()
+            cancel_button.config(state=tk.DISABLED)
+
+    button_frame = tk.Frame(root)
+    button_frame.grid(row=6, columnspan=3, pady=10)
+    submit_button = tk.Button(button_frame, text="处理", command=on_submit)
+    submit_button.pack(side=tk.LEFT, padx=5)
+    cancel_button = tk.Button(button_frame, text="取消", command=on_cancel, state=tk.DISABLED)
+    cancel_button.pack(side=tk.LEFT, padx=5)
+    progress_panel = ProgressPanel(root, row=7, columnspan=3)
 
     # 联系作者
     contact_label = tk.Label(root, text="反馈", fg="blue", cursor="hand2")
-    contact_label.grid(row=6, column=0, columnspan=3, padx=10, pady=10, sticky=tk.W)
+    contact_label.grid(row=9, column=0, columnspan=3, padx=10, pady=10, sticky=tk.W)
     contact_label.bind("<Button-1>", open_mail)
     contact_label.bind("<Enter>", lambda e: contact_label.config(fg="red"))
     contact_label.bind("<Leave>", lambda e: contact_label.config(fg="blue"))
 
     # 添加按钮，显示USAGE
     usage_button = tk.Button(root, text="命令行帮助", command=lambda: show_usage(root))
-    usage_button.grid(row=6, column=2, padx=10, pady=10, sticky=tk.E)
+    usage_button.grid(row=9, column=2, padx=10, pady=10, sticky=tk.E)
 
     center_window(root)  # 将主窗口置于屏幕中央
     root.mainloop()
@@ -367,7 +600,7 @@ def main():
     # 使用 options_first=True 确保没有参数时不会直接触发 Usage 输出
     args = docopt(USAGE, version=__version__, options_first=True)
 
-    input_files: Optional[List[str]] = args["INPUTS"]
+    input_files: Optional[Iterable[str]] = args["INPUTS"]
 
     # 如果用户请求版本信息，显示版本信息
     if args["--version"]:
@@ -376,21 +609,101 @@ def main():
 
     global is_cmd_mode
     # 如果有 --offset 参数，则执行命令行模式逻辑
-    if args["--offset"]:
+    if args["--offset"] or args["--sync-map"]:
         is_cmd_mode = True
         logger.info("进入命令行模式...")
-        shift_value = float(args["--offset"]) * 1000
+        shift_value = float(args["--offset"]) * 1000 if args["--offset"] else 0
+        sync_map = None
+        if args["--sync-map"]:
+            try:
+                sync_map = SyncMap.load(args["--sync-map"])
+            except (OSError, ValueError) as e:
+                logger.error(f"无法读取同步映射文件: {e}")
+                return
         layer_numbers = parse_layers(args["--layers"])
-        if input_files:
-            shift_times_in_filelist(input_files, shift_value, layer_numbers, queue.Queue())
-        else:
-            shift_times_in_directory(os.getcwd(), shift_value, None, layer_numbers, queue.Queue())
+        jobs = parse_jobs(args["--jobs"])
+        engine = args["--engine"] or ENGINE_STREAM
+        if engine not in ENGINES:
+            logger.error(f"未知的处理引擎: {engine}，可选值为 {', '.join(ENGINES)}")
+            return
+        if engine == ENGINE_NUMPY:
+            import sub_vector
+            if not sub_vector.available():
+                logger.error("未安装 numpy，无法使用 numpy 引擎。请先执行 pip install numpy")
+                return
+        fmt = args["--format"]
+        if fmt not in (None, FORMAT_ASS, FORMAT_SRT):
+            logger.error(f"未知的字幕格式: {fmt}，可选值为 {FORMAT_ASS}, {FORMAT_SRT}")
+            return
+        try:
+            window = parse_window(args["--from"], args["--to"])
+        except ValueError as e:
+            logger.error(f"无效的时间点: {e}")
+            return
+        event_filter = None
+        if args["--filter"]:
+            try:
+                event_filter = compile_filter(args["--filter"])
+            except ValueError as e:
+                logger.error(str(e))
+                return
+        metrics_format = args["--metrics"]
+        if metrics_format not in (None, *METRICS_FORMATS):
+            logger.error(f"未知的统计输出格式: {metrics_format}，可选值为 {', '.join(METRICS_FORMATS)}")
+            return
+        try:
+            set_fsync_policy(args["--fsync"] or FSYNC_FILE)
+        except ValueError as e:
+            logger.error(str(e))
+            return
+        report = Report() if metrics_format else None
+        if args["--profile"]:
+            # 工作进程中的调用无法被主进程的 cProfile 记录，分析时在当前进程中逐个处理
+            jobs = 1
+        recursive = args["--recursive"]
+        include, exclude = args["--include"], args["--exclude"]
+        is_stdio = bool(input_files) and '-' in input_files
+        progress = ProgressBar() if args["--progress"] and not is_stdio else None
+        with profiling(args["--profile"]):
+            if is_stdio:
+                if len(input_files) > 1 or args["--watch"]:
+                    logger.error("- 表示标准输入/输出，只能单独使用")
+                    return
+                if report is None:
+                    shift_stdio(shift_value, layer_numbers, fmt, window, sync_map, event_filter)
+                else:
+                    with recording('-') as record:
+                        record.ok = shift_stdio(shift_value, layer_numbers, fmt, window, sync_map, event_filter)
+                    report.add(record)
+            elif args["--watch"]:
+                watch_directories(input_files or [os.getcwd()], shift_value, layer_numbers, jobs, engine, window,
+                                  sync_map, event_filter, recursive, include, exclude, report, progress)
+            elif input_files:
+                if any(os.path.isdir(path) for path in input_files):
+                    input_files = expand_inputs(input_files, recursive=recursive, include=include, exclude=exclude)
+                shift_times_in_filelist(input_files, shift_value, layer_numbers, queue.Queue(), jobs, engine, window,
+                                        sync_map, event_filter, report, progress)
+            else:
+                shift_times_in_directory(os.getcwd(), shift_value, None, args["--layers"], queue.Queue(), jobs,
+                                         engine, recursive, include, exclude, window, sync_map, event_filter, report,
+                                         progress)
+            if progress is not None:
+                progress.close()
+        if args["--profile"]:
+            logger.info(f"性能分析结果已保存到 {args['--profile']}，可使用 python -m pstats {args['--profile']} 查看")
+        if report is not None:
+            # 标准输出被字幕内容占用时，JSON 统计写到标准错误
+            emit(report, metrics_format, logger.info, sys.stderr if is_stdio else sys.stdout)
 
     # 否则启动GUI（没有提供 --offset 时）
     else:
+        from utils import hide_console
         hide_console()
         logger.info("正在启动GUI...")
         start_ui()
 
 if __name__ == "__main__":
+    import multiprocessing
+    # 打包为可执行文件后，进程池的子进程需要此调用才能正常启动
+    multiprocessing.freeze_support()
     main()
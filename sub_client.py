@@ -0,0 +1,139 @@
+import json
+import os
+import socket
+import sys
+import threading
+from docopt import docopt
+
+# 轻量客户端：只依赖标准库与 docopt（不导入 loguru 与处理模块），启动开销尽可能小，
+# 实际处理由常驻的 sub_server.py 完成。
+
+__version__ = 'sub_client v0.1.0'
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 47291
+
+USAGE = f"""
+{__version__}
+Usage:
+  sub_client shift --offset <subtitle_shift_seconds> [--layers <layer_numbers>] [--engine <name>] [--filter <expr>] [options] FILES...
+  sub_client retime --from <source_fps> --to <target_fps> [--output-dir <dir>] [--filter <expr>] [options] FILES...
+  sub_client convert [--template <file>] [--output-dir <dir>] [--filter <expr>] [options] FILES...
+  sub_client --version
+  sub_client (-h | --help)
+
+将任务提交给已启动的 sub_server.py 执行，并逐个输出处理结果。有任务失败时以状态码 1 退出。
+
+Options:
+  -t --offset <subtitle_shift_seconds>    字幕偏移量（单位：秒），负数为提前，正数为延后
+  --layers <layer_numbers>                可选参数，将时间调整仅应用到此处设置的Layer中。默认为 all
+  --engine <name>                         可选参数，时间轴处理引擎（stream、numpy、mmap）。默认为 stream
+  --from <source_fps>                     源字幕匹配的视频帧率
+  --to <target_fps>                       目标视频帧率
+  --filter <expr>                         可选参数，只处理匹配过滤表达式的事件（语法见 sub_adjust --help）
+  --template <file>                       可选参数，SRT 转 ASS 使用的元数据模板文件
+  -o --output-dir <dir>                   可选参数，输出目录
+  --host <addr>                           服务地址 [default: {DEFAULT_HOST}]
+  --port <n>                              服务端口 [default: {DEFAULT_PORT}]
+  --socket <path>                         改为连接 Unix 套接字
+  --version                               显示版本信息
+  -h --help                               显示帮助信息
+
+Examples:
+  python sub_client.py shift --offset -2.5 example.ass example.srt
+  python sub_client.py retime --from 23.976 --to 25 --output-dir out example.ass
+  python sub_client.py convert example.srt
+"""
+
+
+def build_jobs(args):
+    """
+    根据命令行参数生成任务。路径转换为绝对路径，服务端的工作目录可能与客户端不同。
+    """
+    def path_option(name):
+        return os.path.abspath(args[name]) if args[name] else None
+
+    jobs = []
+    for index, filepath in enumerate(args["FILES"]):
+        job = {'id': index, 'path': os.path.abspath(filepath), 'filter': args["--filter"]}
+        if args["shift"]:
+            job.update(op='shift', offset=float(args["--offset"]), layers=args["--layers"], engine=args["--engine"])
+        elif args["retime"]:
+            job.update(op='retime', output_dir=path_option("--output-dir"))
+            job['from'], job['to'] = args["--from"], args["--to"]
+        else:
+            job.update(op='convert', template=path_option("--template"), output_dir=path_option("--output-dir"))
+        jobs.append(job)
+    return jobs
+
+
+def connect(host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None):
+    if socket_path:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(socket_path)
+        return sock
+    return socket.create_connection((host, port))
+
+
+def submit(jobs, sock):
+    """
+    在后台线程中发送任务，同时逐个产出服务端返回的结果，避免任务很多时双方缓冲区写满而互相等待。
+    """
+    def send_jobs():
+        try:
+            for job in jobs:
+                sock.sendall(json.dumps(job, ensure_ascii=False).encode('utf-8') + b'\n')
+        finally:
+            try:
+                sock.shutdown(socket.SHUT_WR)
+            except OSError:
+                pass
+
+    sender = threading.Thread(target=send_jobs, daemon=True)
+    sender.start()
+    with sock.makefile('rb') as results:
+        for line in results:
+            yield json.loads(line)
+    sender.join()
+
+
+def main():
+    args = docopt(USAGE, version=__version__)
+    jobs = build_jobs(args)
+    try:
+        sock = connect(args["--host"], int(args["--port"]), args["--socket"])
+    except OSError as e:
+        print(f"无法连接到 sub_server: {e}。请先运行 python sub_server.py", file=sys.stderr)
+        return 2
+
+    success_count = skipped_count = 0
+    failure_reasons = []
+    with sock:
+        for result in submit(jobs, sock):
+            if result['ok']:
+                success_count += 1
+                if result.get('skipped'):
+                    skipped_count += 1
+                    print(f"内容未变化，跳过写入: {result['path']} -> {result['output']}")
+                else:
+                    print(f"成功处理文件: {result['path']} -> {result['output']}")
+            else:
+                failure_reasons.append(f"{result['path']}: {result['error']}")
+                print(f"错误处理文件 {result['path']}: {result['error']}", file=sys.stderr)
+
+    result_message = (
+        f"运行完毕。\n"
+        f"共处理 {len(jobs)} 个文件。\n"
+        f"成功处理 {success_count} 个文件。\n"
+        f"失败处理 {len(jobs) - success_count} 个文件。\n"
+    )
+    if skipped_count:
+        result_message += f"其中 {skipped_count} 个文件内容未变化，未重写。\n"
+    if failure_reasons:
+        result_message += "\n失败原因:\n" + "\n".join(failure_reasons)
+    print(f"\n{result_message}")
+    return 0 if success_count == len(jobs) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
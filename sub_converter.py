@@ -1,43 +1,273 @@
-import re
 import os
-import threading
-import tkinter as tk
-from tkinter import filedialog, messagebox, scrolledtext
-from utils import detect_encoding, center_window, custom_messagebox, display_errors
 import queue
+import sys
+from docopt import docopt
 from loguru import logger
-import json
+# GUI 相关模块（tkinter、webbrowser、utils）只在启动 GUI 时导入，命令行模式只加载处理核心
+from sub_core import (DEFAULT_ASS_TEMPLATE, FORMAT_SRT, FSYNC_BATCH, FSYNC_FILE, UNCHANGED, AssConverter,
+                      decode_text, fsync_policy, load_events, parse_data, set_fsync_policy, sync_files)
+from archive import is_archive, rewrite_archive
+from batch import largest_first, parse_jobs, run_batch, run_watch
+from discovery import expand_inputs, iter_subtitle_files, output_directory
+from metrics import METRICS_FORMATS, Report, emit, profiling
+from progress import CancelToken, ProgressBar
 
 # Constant for subtitle file extension
 SUBTITLE_EXTENSION = '.srt'
 
 # Version constant
-VERSION = 'v0.0.1'
+VERSION = 'v0.1.0'
+__version__ = f'sub_converter {VERSION}'
+
+# 转换成功但输出中含有需要人工处理的高级语法时，process_file 返回 (True, ADVANCED_SYNTAX)
+ADVANCED_SYNTAX = "包含高级语法（如 {\\an1} ~ {\\an9}），需要手动进一步处理"
+
+USAGE = f"""
+{__version__}
+Usage:
+  sub_converter [--template <file>] [--output-dir <dir>] [--jobs <n>] [--metrics <format>] [--profile <file>] [--progress] [--fsync <policy>] [--watch] [-r] [--include <glob>]... [--exclude <glob>]... INPUTS...
+  sub_converter --version
+  sub_converter (-h | --help)
+  sub_converter
+
+Options:
+  --template <file>                       可选参数，ASS 元数据模板文件（UTF-8），{{filename}} 会被替换为文件名。默认使用内置模板
+  -o --output-dir <dir>                   可选参数，输出目录。默认输出到源文件所在目录
+                                          输入目录中的文件在输出目录下保留相对于该目录的子目录结构
+  -j --jobs <n>                           可选参数，并行处理文件的进程数。默认为 CPU 核心数
+  --metrics <format>                      可选参数，处理完成后输出各阶段耗时等性能统计：text（写入日志）或 json（写到标准输出）
+  --profile <file>                        可选参数，使用 cProfile 记录性能分析数据并保存到该文件（pstats 格式）。启用时在单进程中处理
+  --progress                              可选参数，在标准错误上显示进度条（已处理文件数、事件数与每秒处理的事件数）
+  --fsync <policy>                        可选参数，写入的落盘策略：file（每个文件写完立即落盘）、batch（全部处理完成后统一落盘）
+                                          或 none（交给操作系统）。默认为 file。输出文件已存在且内容相同时不会重写
+  -w --watch                              可选参数，监视模式：持续转换 INPUTS 目录中新增或修改的 SRT，直到按 Ctrl+C 停止。
+                                          启动时已存在的文件不处理，仍在写入的文件等写入完成后再处理
+  -r --recursive                          可选参数，输入为目录时包含所有子目录
+  --include <glob>                        可选参数，只处理匹配该模式的文件，可重复指定
+  --exclude <glob>                        可选参数，跳过匹配该模式的文件或目录，可重复指定
+  --version                               显示版本信息
+  -h --help                               显示帮助信息
+
+不带任何参数运行时启动GUI（转换程序当前目录下的 SRT 字幕）。输入为目录时只处理其中的 .srt 文件。
+转换后的文件名为 原文件名.converted.ass，不会覆盖原文件。SRT 的编码自动检测。
+INPUTS 可以是 zip 压缩包：无需解压，直接输出 原文件名.converted.zip，其中的 SRT 替换为转换后的 ASS，其余文件按原始压缩数据复制。
+元数据模板与对话样式在开始时解析一次：只有一个样式时使用该样式；存在多个样式时，
+优先选择包含 default（不区分大小写）的样式名，否则使用第一个样式名。
+
+Examples (Python运行源码):
+  # 使用4个进程转换 subs 目录及其子目录下的所有 SRT 字幕，输出到 out 目录
+  python sub_converter.py --jobs 4 --recursive --output-dir out subs
+
+  # 使用自定义元数据模板
+  python sub_converter.py --template template.txt example.srt
+
+  # 转换字幕包中的所有 SRT，输出 subs.converted.zip
+  python sub_converter.py subs.zip
+
+  # 监视 inbox 目录，新放入的 SRT 自动转换并输出到 out 目录
+  python sub_converter.py --watch --output-dir out inbox
+"""
 
-# Global variable to determine command-line mode
-is_cmd_mode = False
 
+def converted_name(filepath):
+    filename, _ext = os.path.splitext(filepath)
+    return f"{filename}.converted.ass"
+
+
+def output_path(filepath, output_dir=None):
+    """
+    转换后的文件路径：原文件名.converted.ass（压缩包为 原文件名.converted.zip），默认与源文件位于同一目录。
+    """
+    filename, ext = os.path.splitext(os.path.basename(filepath))
+    ext = ext if is_archive(filepath) else '.ass'
+    return os.path.join(output_dir or os.path.dirname(filepath), f"{filename}.converted{ext}")
+
+
+def convert_archive(filepath, converter, output_dir=None):
+    """
+    转换 zip 压缩包中的所有 SRT，写出新的压缩包，其中 SRT 替换为转换后的 ASS，其余文件按原始压缩数据复制。
+    返回值同 convert_file；含有高级语法的成员会记录到日志。
+    """
+    advanced_syntax_members = []
+
+    def convert_member(data, name):
+        text, _encoding = decode_text(data)
+        if '\r' in text:
+            text = text.replace('\r\n', '\n').replace('\r', '\n')
+        store, _is_text = parse_data(text, FORMAT_SRT)
+        filename, _ext = os.path.splitext(os.path.basename(name))
+        result, has_advanced_syntax = converter.render(filename, store)
+        if has_advanced_syntax:
+            advanced_syntax_members.append(name)
+        return result
+
+    new_filepath = output_path(filepath, output_dir)
+    written = rewrite_archive(filepath, new_filepath, convert_member, (SUBTITLE_EXTENSION,), converted_name)
+    for name in advanced_syntax_members:
+        logger.warning(f"{filepath} 中的 {name} {ADVANCED_SYNTAX}")
+    return new_filepath, written, bool(advanced_syntax_members)
+
+
+def convert_file(filepath, converter, output_dir=None):
+    """
+    将 SRT 字幕转换为 ASS，返回 (转换后的文件路径, 是否写入了文件, 是否含有需要人工处理的高级语法)。出错时抛出异常。
+    """
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    if is_archive(filepath):
+        return convert_archive(filepath, converter, output_dir)
+    # 编码检测与解码共用同一次读取
+    store = load_events(filepath, encoding=None, fmt=FORMAT_SRT)
+    new_filepath = output_path(filepath, output_dir)
+    written, has_advanced_syntax = converter.write(store, new_filepath)
+    return new_filepath, written, has_advanced_syntax
+
+
+def process_file(filepath, converter, output_dir=None):
+    """
+    convert_file 的包装，返回 (是否成功, 失败原因)，供批量处理使用。
+    含有高级语法时返回 (True, ADVANCED_SYNTAX)，否则输出内容未变化时返回 (True, UNCHANGED)。
+    """
+    try:
+        new_filepath, written, has_advanced_syntax = convert_file(filepath, converter, output_dir)
+        if has_advanced_syntax:
+            logger.warning(f"{filepath} {ADVANCED_SYNTAX}")
+            return True, ADVANCED_SYNTAX
+        if not written:
+            logger.info(f"输出文件内容未变化，跳过写入: {new_filepath}")
+            return True, UNCHANGED
+        logger.info(f"成功处理文件: {filepath} -> {new_filepath}")
+        return True, None
+    except Exception as e:
+        logger.error(f"错误处理文件 {filepath}: {str(e)}")
+        return False, str(e)
+
+
+def convert_files(filepaths, converter, jobs=None, output_dir=None, report=None, progress=None, cancel=None,
+                  roots=()):
+    """
+    使用进程池并行转换多个 SRT 字幕，返回
+    (文件总数, 成功数, [(文件, 失败原因)], 内容未变化而未重写的文件数, [含有高级语法的文件])。
+    filepaths 为列表时大文件优先调度；为惰性迭代器（例如递归遍历目录）时边遍历边处理。
+    roots 为展开的输入目录，其中的文件在 output_dir 下保留子目录结构（见 discovery.output_directory）。
+    report、progress、cancel 的含义见 batch.run_batch。落盘策略为 batch 时，全部完成后统一 fsync 写入过的文件。
+    """
+    if isinstance(filepaths, list):
+        tasks = [(filepath, converter, output_directory(filepath, output_dir, roots))
+                 for filepath in largest_first(filepaths)]
+    else:
+        tasks = ((filepath, converter, output_directory(filepath, output_dir, roots)) for filepath in filepaths)
+
+    total_files = 0
+    success_count = skipped_count = 0
+    failures = []
+    advanced_syntax_files = []
+    written = []
+    for (filepath, _, directory), success, reason in run_batch(process_file, tasks, jobs, report, progress, cancel,
+                                                                initializer=set_fsync_policy,
+                                                                initargs=(fsync_policy(),)):
+        total_files += 1
+        if not success:
+            failures.append((filepath, reason))
+            continue
+        success_count += 1
+        if reason == UNCHANGED:
+            skipped_count += 1
+            continue
+        if reason == ADVANCED_SYNTAX:
+            advanced_syntax_files.append(filepath)
+        written.append(output_path(filepath, directory))
+    if fsync_policy() == FSYNC_BATCH:
+        sync_files(written)
+    return total_files, success_count, failures, skipped_count, advanced_syntax_files
+
+
+def watch_directories(directories, converter, jobs=None, output_dir=None, recursive=False, include=None,
+                      exclude=None, report=None, progress=None):
+    """
+    监视模式：持续转换 directories 中新增或修改的 SRT，直到按 Ctrl+C 停止（见 batch.run_watch）。
+    输出的 .converted.ass 不会被再次处理，指定 output_dir 时保留文件相对于监视目录的子目录结构。
+    落盘策略为 batch 时，每批文件处理完成后统一 fsync。
+    """
+    from watch import Watcher
+    try:
+        watcher = Watcher(directories, (SUBTITLE_EXTENSION,), recursive, include, exclude)
+    except ValueError as e:
+        logger.error(str(e))
+        return
+    written = []
+
+    def on_idle():
+        sync_files(written)
+        written.clear()
+
+    def make_task(filepath):
+        return filepath, converter, output_directory(filepath, output_dir, watcher.roots)
+
+    logger.info(f"正在监视（{watcher.backend}）: {', '.join(watcher.roots)}，按 Ctrl+C 停止")
+    results = run_watch(process_file, watcher, make_task, jobs, report, progress, initializer=set_fsync_policy,
+                        initargs=(fsync_policy(),), on_idle=on_idle if fsync_policy() == FSYNC_BATCH else None)
+    try:
+        for (filepath, _, directory), success, reason in results:
+            if success and reason != UNCHANGED:
+                written.append(output_path(filepath, directory))
+    except KeyboardInterrupt:
+        logger.info("已停止监视")
+    finally:
+        results.close()
+        watcher.close()
+        if fsync_policy() == FSYNC_BATCH:
+            sync_files(written)
+
+
+def format_result(total_files, success_count, failures, skipped_count=0, advanced_syntax_files=(), cancelled=False):
+    result_message = (
+        f"共处理 {total_files} 个文件。\n"
+        f"成功处理 {success_count} 个文件。\n"
+        f"失败处理 {len(failures)} 个文件。\n"
+    )
+    if skipped_count:
+        result_message += f"其中 {skipped_count} 个文件的输出内容未变化，未重写。\n"
+    if cancelled:
+        result_message += "处理已取消，其余文件未处理。\n"
+
+    if advanced_syntax_files:
+        result_message += ("\n以下文件包含高级语法（如 {\\an1} ~ {\\an9}），需要手动进一步处理:\n"
+                           + "\n".join(advanced_syntax_files) + "\n")
+    if failures:
+        result_message += "\n失败原因:\n" + "\n".join(f"{filepath}: {reason}" for filepath, reason in failures)
+    return result_message
+
+
+# GUI
 class SubtitleConverterApp:
-    def __init__(self, root: tk.Tk):
+    def __init__(self, root):
+        import tkinter as tk
+        from tkinter import scrolledtext
+        from utils import ProgressPanel, center_window
         self.root = root
         self.root.title(f"ASS 字幕转换器 {VERSION}")
-        self.root.geometry("500x500")
+        self.root.geometry("500x560")
         self.root.resizable(False, False)  # Disable maximizing and resizing
         self.root.pack_propagate(False)
         self.root.configure(padx=10, pady=10)  # Set window size
         center_window(self.root)
-        
+
+        # 一次转换中的进度事件队列与取消标记，未在转换时为 None
+        self.events = None
+        self.cancel = None
+
         # Program description
-        self.description_text = tk.Label(root, text="该程序可将SRT字幕转换为ASS字幕，自动添加自定义元数据到输出字幕中。仅支持UTF-8编码，自动作用于程序当前目录。StyleName的查找逻辑：当只有一个样式时，使用该样式；如果存在多个样式，优先选择包含‘default’字符串（不区分大小写）的样式名，如果没有包含‘default’的样式名，则使用第一个样式名。",  justify=tk.LEFT, wraplength=480)
+        self.description_text = tk.Label(root, text="该程序可将SRT字幕转换为ASS字幕，自动添加自定义元数据到输出字幕中。自动检测字幕编码，自动作用于程序当前目录。StyleName的查找逻辑：当只有一个样式时，使用该样式；如果存在多个样式，优先选择包含‘default’字符串（不区分大小写）的样式名，如果没有包含‘default’的样式名，则使用第一个样式名。",  justify=tk.LEFT, wraplength=480)
         self.description_text.pack(fill='x', pady=(0, 0), padx=(0, 0))  # Remove unnecessary padding at the top and bottom, fixed width
-        
+
         # Input Field
         self.input_label = tk.Label(root, text="ASS 元数据模板:", anchor='w', justify='left')
         self.input_label.pack(pady=5, anchor='w', fill='x')
-        
+
         self.input_text = scrolledtext.ScrolledText(root, height=15, width=50, wrap=tk.CHAR, undo=True)  # Set height larger, Add scrolling with undo support
         self.input_text.pack(pady=5, fill='both', expand=True)
-        
+
         # Enable native right-click menu by binding system clipboard operations
         self.input_text.bind_class("Text", "<Control-c>", self.copy)
         self.input_text.bind_class("Text", "<Control-x>", self.cut)
@@ -46,26 +276,23 @@ class SubtitleConverterApp:
         self.input_text.bind_class("Text", "<Control-y>", self.redo)
         self.input_text.bind("<Button-3>", self.show_context_menu)
         self.input_text.bind("<<Modified>>", self.update_undo_redo_buttons)
-        
-        default_template = """[Script Info]
-Title: {filename}
-ScriptType: v4.00+
-WrapStyle: 0
-ScaledBorderAndShadow: yes
-YCbCr Matrix: None
-PlayResX: 1280
-PlayResY: 720
-
-[V4+ Styles]
-Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding
-Style: Default,方正隶变_GBK,48,&H00FFFFFF,&H000000FF,&H00000000,&H00000000,-1,0,0,0,100,100,0,0,1,2,0,2,10,10,10,1
-"""
-        
-        self.input_text.insert(tk.END, default_template)
-        
-        # Convert Button
-        self.convert_button = tk.Button(root, text="转换字幕", command=self.start_conversion_thread)
-        self.convert_button.pack(pady=10)
+
+        self.input_text.insert(tk.END, DEFAULT_ASS_TEMPLATE)
+
+        # Convert / cancel buttons
+        self.button_frame = tk.Frame(root)
+        self.button_frame.pack(pady=10)
+        self.convert_button = tk.Button(self.button_frame, text="转换字幕", command=self.start_conversion_thread)
+        self.convert_button.pack(side=tk.LEFT, padx=5)
+        self.cancel_button = tk.Button(self.button_frame, text="取消", command=self.cancel_conversion,
+                                       state=tk.DISABLED)
+        self.cancel_button.pack(side=tk.LEFT, padx=5)
+
+        # Progress（ProgressPanel 按 grid 布局，放在单独的 Frame 中）
+        self.progress_frame = tk.Frame(root)
+        self.progress_frame.pack(fill='x')
+        self.progress_frame.columnconfigure(0, weight=1)
+        self.progress_panel = ProgressPanel(self.progress_frame, row=0, columnspan=1)
 
         # Create context menu for the input text widget
         self.context_menu = tk.Menu(self.root, tearoff=0)
@@ -107,6 +334,7 @@ Style: Default,方正隶变_GBK,48,&H00FFFFFF,&H000000FF,&H00000000,&H00000000,-
         self.update_undo_redo_buttons()
 
     def undo(self, event=None):
+        import tkinter as tk
         try:
             self.root.focus_get().event_generate("<<Undo>>")
         except tk.TclError:
@@ -114,6 +342,7 @@ Style: Default,方正隶变_GBK,48,&H00FFFFFF,&H000000FF,&H00000000,&H00000000,-
         self.update_undo_redo_buttons()
 
     def redo(self, event=None):
+        import tkinter as tk
         try:
             self.root.focus_get().event_generate("<<Redo>>")
         except tk.TclError:
@@ -124,10 +353,12 @@ Style: Default,方正隶变_GBK,48,&H00FFFFFF,&H000000FF,&H00000000,&H00000000,-
         self.input_text.tag_add("sel", "1.0", "end")
 
     def clear_all(self, event=None):
+        import tkinter as tk
         self.input_text.delete("1.0", tk.END)
         self.update_undo_redo_buttons()
 
     def update_undo_redo_buttons(self, event=None):
+        import tkinter as tk
         if self.input_text.edit_modified():
             self.context_menu.entryconfig("撤销", state=tk.NORMAL)
             try:
@@ -140,134 +371,152 @@ Style: Default,方正隶变_GBK,48,&H00FFFFFF,&H000000FF,&H00000000,&H00000000,-
         self.input_text.edit_modified(False)
 
     def start_conversion_thread(self):
+        import threading
+        import tkinter as tk
+        from tkinter import messagebox
+        from utils import PROGRESS_QUEUE_SIZE, display_errors
+        if self.cancel is not None:
+            return  # 上一次转换尚未结束
+        # 模板与样式只解析一次，整批文件共用
+        try:
+            converter = AssConverter(self.input_text.get("1.0", tk.END))
+        except ValueError as e:
+            messagebox.showerror("错误", f"元数据模板无效: {e}")
+            return
+        filepaths = list(iter_subtitle_files('.', extensions=(SUBTITLE_EXTENSION,)))
+        if not filepaths:
+            display_errors(self.root, "当前目录中未找到字幕文件。")
+            return
+
         result_queue = queue.Queue()
-        thread = threading.Thread(target=self.convert_subtitles, args=(result_queue,))
+        # 有界队列：界面来不及显示时工作线程在 put 处等待，避免事件无限堆积
+        self.events = queue.Queue(maxsize=PROGRESS_QUEUE_SIZE)
+        self.cancel = CancelToken()
+        self.convert_button.config(state=tk.DISABLED)
+        self.cancel_button.config(state=tk.NORMAL)
+        self.progress_panel.start()
+        thread = threading.Thread(target=self.convert_subtitles, args=(result_queue, converter, filepaths))
         thread.daemon = True
         thread.start()
         self.check_queue(result_queue)
 
+    def cancel_conversion(self):
+        import tkinter as tk
+        if self.cancel is not None:
+            self.cancel.cancel()
+            self.cancel_button.config(state=tk.DISABLED)
+
     def check_queue(self, result_queue):
+        import tkinter as tk
+        from utils import PROGRESS_BATCH_SIZE, custom_messagebox, display_errors, drain_queue
+        # 每次只取一批进度事件，大批量转换时不会占满界面线程
+        self.progress_panel.update(drain_queue(self.events, PROGRESS_BATCH_SIZE))
+        if not self.events.empty():
+            self.root.after(100, lambda: self.check_queue(result_queue))
+            return
         try:
-            result_message_json = result_queue.get_nowait()
-            if result_message_json:
-                # 将结果从 JSON 字符串转换回字典
-                result_message = json.loads(result_message_json)
-                # 根据 includeDetail 值来决定使用哪个弹窗
-                if result_message['includeDetail']:
-                    display_errors(self.root, result_message['body'])
-                else:
-                    custom_messagebox(self.root, result_message['body'])
+            result_message, include_detail = result_queue.get_nowait()
         except queue.Empty:
             self.root.after(100, lambda: self.check_queue(result_queue))
-
-    def convert_subtitles(self, result_queue):
-        template = self.input_text.get("1.0", tk.END)
-        files = [f for f in os.listdir('.') if os.path.isfile(f) and f.endswith(SUBTITLE_EXTENSION)]
-        if not files:
-            result_queue.put(json.dumps({"body": "当前目录中未找到字幕文件。", "includeDetail": True}))
             return
+        cancelled = self.cancel.cancelled()
+        self.events = self.cancel = None
+        self.convert_button.config(state=tk.NORMAL)
+        self.cancel_button.config(state=tk.DISABLED)
+        self.progress_panel.finish("已取消" if cancelled else None)
+        # 有失败或需要人工处理的文件时使用可滚动的详情窗口
+        if include_detail:
+            display_errors(self.root, result_message)
+        else:
+            custom_messagebox(self.root, result_message)
 
-        total_files = len(files)
-        success_count = 0
-        failure_count = 0
-        advanced_syntax_files = set()  # Use a set to avoid duplicates
+    def convert_subtitles(self, result_queue, converter, filepaths):
+        result = convert_files(filepaths, converter, progress=self.events.put, cancel=self.cancel)
+        result_queue.put((format_result(*result, cancelled=self.cancel.cancelled()), bool(result[2] or result[4])))
 
-        for file in files:
-            try:
-                encoding = detect_encoding(file)
-                with open(file, 'r', encoding=encoding) as f:
-                    content = f.readlines()
-
-                filename, _ext = os.path.splitext(file)
-                new_filename = f"{filename}.converted.ass"
-
-                new_lines = []
-                # Write metadata from the input field
-                metadata = template.format(filename=filename)
-                new_lines.append(metadata + '\n')
-                new_lines.append("[Events]\n")
-                new_lines.append("Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text\n")
-
-                # Extract styles from the metadata
-                style_lines = [line for line in metadata.splitlines() if line.startswith("Style:")]
-                style_names = [line.split(",")[0].split(":")[1].strip() for line in style_lines]
-
-                # Determine which style to use based on rules
-                if len(style_names) == 1:
-                    style_name = style_names[0]
-                else:
-                    style_name = style_names[0]  # Default to the first style name if no "default" is found
-                    for name in style_names:
-                        if name.lower() == "default":
-                            style_name = name
-                            break
-                        elif "default" in name.lower():
-                            style_name = name
-                            break
-
-                # Write dialogue lines
-                i = 0
-                while i < len(content):
-                    line = content[i].strip()
-
-                    # If it's a timestamp line (including non-standard formats)
-                    if re.match(r'\d{2}:\d{2}:\d{2}(,\d{1,3})? --> \d{2}:\d{2}:\d{2}(,\d{1,3})?', line):
-                        start_end = line.split('-->')
-                        start = start_end[0].strip().replace(',', '.')
-                        end = start_end[1].strip().replace(',', '.')
-
-                        # Ensure milliseconds are two digits (truncation or padding)
-                        if '.' in start:
-                            start = start[:-1] if len(start.split('.')[-1]) > 2 else start.ljust(len(start) + (2 - len(start.split('.')[-1])), '0')
-                        else:
-                            start += '.00'
-                        if '.' in end:
-                            end = end[:-1] if len(end.split('.')[-1]) > 2 else end.ljust(len(end) + (2 - len(end.split('.')[-1])), '0')
-                        else:
-                            end += '.00'
-
-                        i += 1
-
-                        # Gather all subtitle lines until an empty line is found
-                        dialogue_text = []
-                        while i < len(content) and content[i].strip():
-                            dialogue_text.append(content[i].strip())
-                            i += 1
-
-                        # Join the lines into one subtitle text
-                        full_dialogue = ' '.join(dialogue_text)
-                        new_lines.append(f"Dialogue: 0,{start},{end},{style_name},,0,0,0,,{full_dialogue}\n")
-
-                        # Check for advanced syntax like {\an1} ~ {\an9}
-                        if re.search(r'\{\\an[1-9]\}', full_dialogue):
-                            advanced_syntax_files.add(file)
-                    i += 1
-
-                # Write the new content to the file
-                with open(new_filename, 'w', encoding='utf-8') as f:
-                    f.writelines(new_lines)
-
-                success_count += 1
-
-            except Exception as e:
-                failure_count += 1
-
-        result_message = (
-            f"共处理 {total_files} 个文件。\n"
-            f"成功处理 {success_count} 个文件。\n"
-            f"失败处理 {failure_count} 个文件。\n"
-        )
-
-        include_detail = False
-
-        if advanced_syntax_files:
-            result_message += "\n以下文件包含高级语法（如 {\\an1} ~ {\\an9}），需要手动进一步处理:\n" + "\n".join(advanced_syntax_files)
-            include_detail = True
-
-        # 将结果信息放入队列中，以 JSON 格式传递
-        result_queue.put(json.dumps({"body": result_message, "includeDetail": include_detail}))
 
-if __name__ == "__main__":
+def start_ui():
+    import tkinter as tk
     root = tk.Tk()
     app = SubtitleConverterApp(root)
     root.mainloop()
+
+
+def main():
+    # 使用 options_first=True 确保没有参数时不会直接触发 Usage 输出
+    args = docopt(USAGE, version=__version__, options_first=True)
+
+    if args["--version"]:
+        logger.info(__version__)
+        return
+
+    if not args["INPUTS"]:
+        from utils import hide_console
+        hide_console()
+        logger.info("正在启动GUI...")
+        start_ui()
+        return
+
+    template = DEFAULT_ASS_TEMPLATE
+    try:
+        if args["--template"]:
+            with open(args["--template"], 'r', encoding='utf-8-sig') as f:
+                template = f.read()
+        converter = AssConverter(template)
+    except (OSError, ValueError) as e:
+        logger.error(f"元数据模板无效: {e}")
+        return
+    try:
+        jobs = parse_jobs(args["--jobs"])
+        set_fsync_policy(args["--fsync"] or FSYNC_FILE)
+    except ValueError as e:
+        logger.error(str(e))
+        return
+
+    metrics_format = args["--metrics"]
+    if metrics_format not in (None, *METRICS_FORMATS):
+        logger.error(f"未知的统计输出格式: {metrics_format}，可选值为 {', '.join(METRICS_FORMATS)}")
+        return
+    report = Report() if metrics_format else None
+    if args["--profile"]:
+        # 工作进程中的调用无法被主进程的 cProfile 记录，分析时在当前进程中逐个处理
+        jobs = 1
+
+    output_dir = args["--output-dir"]
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    filepaths = args["INPUTS"]
+    if args["--watch"]:
+        with profiling(args["--profile"]):
+            progress = ProgressBar() if args["--progress"] else None
+            watch_directories(filepaths, converter, jobs, output_dir, args["--recursive"], args["--include"],
+                              args["--exclude"], report, progress)
+            if progress is not None:
+                progress.close()
+        if report is not None:
+            emit(report, metrics_format, logger.info, sys.stdout)
+        return
+    roots = [path for path in filepaths if os.path.isdir(path)]
+    if roots:
+        filepaths = expand_inputs(filepaths, extensions=(SUBTITLE_EXTENSION,), recursive=args["--recursive"],
+                                  include=args["--include"], exclude=args["--exclude"])
+    with profiling(args["--profile"]):
+        progress = ProgressBar() if args["--progress"] else None
+        result = convert_files(filepaths, converter, jobs, output_dir, report, progress, roots=roots)
+        if progress is not None:
+            progress.close()
+
+    log_result_fn = logger.info if result[1] > 0 else logger.error
+    log_result_fn(f"\n\n运行完毕。\n{format_result(*result)}")
+    if args["--profile"]:
+        logger.info(f"性能分析结果已保存到 {args['--profile']}，可使用 python -m pstats {args['--profile']} 查看")
+    if report is not None:
+        emit(report, metrics_format, logger.info, sys.stdout)
+
+
+if __name__ == "__main__":
+    import multiprocessing
+    # 打包为可执行文件后，进程池的子进程需要此调用才能正常启动
+    multiprocessing.freeze_support()
+    main()
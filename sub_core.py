@@ -0,0 +1,1266 @@
+import codecs
+import mmap
+import os
+import re
+import shutil
+import tempfile
+from array import array
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
+from itertools import islice
+import metrics
+from metrics import stage
+from progress import check_cancelled
+
+# 字幕格式常量
+FORMAT_ASS = 'ass'
+FORMAT_SRT = 'srt'
+
+SUBTITLE_EXTENSIONS = ('.ass', '.ssa', '.srt')
+
+_TIME_PATTERN = r'[0-9]+:[0-9]{1,2}:[0-9]{1,2}(?:[.,][0-9]{1,3})?'
+# ASS/SSA 事件行：只捕获 Layer（SSA 为 Marked=）以及 Start、End 两个字段，其余内容原样保留
+_ASS_EVENT_RE = re.compile(
+    rf'^Dialogue: (?:Marked=)?(?P<layer>[0-9]+)[^,\n]*, *(?P<start>{_TIME_PATTERN}) *, *(?P<end>{_TIME_PATTERN}) *,', re.M)
+# 仅用于为无法解析的事件行生成错误信息
+_ASS_LOOSE_RE = re.compile(r'^Dialogue: (?:Marked=)?(?P<layer>\d+)?[^,\n]*,(?P<start>[^,\n]*),(?P<end>[^,\n]*),')
+_ASS_DIALOGUE_LINE_RE = re.compile(r'^Dialogue: .*$', re.M)
+# SRT 时间行，兼容 "," 与 "." 两种毫秒分隔符以及缺省毫秒的非标准写法
+_SRT_TIMING_RE = re.compile(rf'^[ \t]*(?P<start>{_TIME_PATTERN}) --> (?P<end>{_TIME_PATTERN})', re.M)
+_TIME_RE = re.compile(r'(\d+):(\d{1,2}):(\d{1,2})(?:[.,](\d{1,3}))?')
+# 与上面相同的模式，直接作用于 UTF-8 字节（时间字段均为 ASCII），供零拷贝扫描使用
+_ASS_EVENT_BYTES_RE = re.compile(_ASS_EVENT_RE.pattern.encode('ascii'), re.M)
+_SRT_TIMING_BYTES_RE = re.compile(_SRT_TIMING_RE.pattern.encode('ascii'), re.M)
+
+# 零拷贝扫描每次读入的块大小，块会补齐到行尾
+SCAN_BLOCK_SIZE = 1024 * 1024
+
+# 写入落盘策略：每个文件写完立即 fsync（默认）、整批处理完成后统一 fsync（见 sync_files）、不主动 fsync
+FSYNC_FILE = 'file'
+FSYNC_BATCH = 'batch'
+FSYNC_NONE = 'none'
+FSYNC_POLICIES = (FSYNC_FILE, FSYNC_BATCH, FSYNC_NONE)
+_fsync_policy = FSYNC_FILE
+# 当前进程的 umask，首次新建文件时读取（见 _umask）
+_cached_umask = None
+
+# 处理结果与原文件完全相同、没有重写文件时，批量处理函数返回 (True, UNCHANGED)
+UNCHANGED = "内容未变化，未重写文件"
+
+# 按 BOM 判断编码，UTF-32 LE 的 BOM 以 UTF-16 LE 的 BOM 开头，必须先判断
+_BOMS = (
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+# chardet 常把 GBK/GB18030 文本判断为其子集 GB2312，统一按超集解码
+_ENCODING_SUPERSETS = {'gb2312': 'gb18030', 'gbk': 'gb18030'}
+# 交给 chardet 检测的最大字节数
+CHARDET_SAMPLE_SIZE = 64 * 1024
+_ENCODING_CACHE_SIZE = 4096
+# (绝对路径, 文件大小, 修改时间) -> 编码
+_encoding_cache = {}
+
+# SRT 转 ASS 时使用的默认元数据模板，{filename} 会被替换为字幕文件名
+DEFAULT_ASS_TEMPLATE = """[Script Info]
+Title: {filename}
+ScriptType: v4.00+
+WrapStyle: 0
+ScaledBorderAndShadow: yes
+YCbCr Matrix: None
+PlayResX: 1280
+PlayResY: 720
+
+[V4+ Styles]
+Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding
+Style: Default,方正隶变_GBK,48,&H00FFFFFF,&H000000FF,&H00000000,&H00000000,-1,0,0,0,100,100,0,0,1,2,0,2,10,10,10,1
+"""
+ASS_EVENTS_HEADER = "[Events]\nFormat: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text\n"
+# 转换后需要人工进一步处理的高级语法，如 {\an1} ~ {\an9}
+ADVANCED_SYNTAX_RE = re.compile(r'\{\\an[1-9]\}')
+# SRT 转 ASS 时每次格式化并写出的 Dialogue 行数
+ASS_WRITE_BATCH = 4096
+
+
+def format_for_path(filepath):
+    """
+    根据扩展名判断字幕格式。
+    """
+    lower = filepath.lower()
+    if lower.endswith(('.ass', '.ssa')):
+        return FORMAT_ASS
+    if lower.endswith('.srt'):
+        return FORMAT_SRT
+    raise ValueError(f"不支持的字幕格式: {filepath}")
+
+
+def parse_layers(layer_numbers):
+    if not layer_numbers or layer_numbers.lower() == "all":
+        return []
+    return [int(layer) for layer in layer_numbers.split(',')]
+
+
+def parse_timestamp(value):
+    """
+    解析命令行中的时间点：h:mm:ss[.ff] / hh:mm:ss,mmm 形式的时间，或以秒为单位的数字，返回毫秒。
+    """
+    value = value.strip()
+    if ':' in value:
+        return parse_time_to_ms(value)
+    return int(round(float(value) * 1000))
+
+
+def parse_time_to_ms(time_str):
+    """
+    将 ASS (h:mm:ss.cc) 或 SRT (hh:mm:ss,mmm) 时间转换为毫秒。
+    """
+    match = _TIME_RE.fullmatch(time_str.strip())
+    if match is None:
+        raise ValueError(f"Unsupported subtitle time format: {time_str}")
+    h, m, s, frac = match.groups()
+    ms = int(frac.ljust(3, '0')) if frac else 0
+    return (int(h) * 3600 + int(m) * 60 + int(s)) * 1000 + ms
+
+
+def ms_to_time(ms, hour_width=1):
+    """
+    将毫秒转换为 ASS 时间格式 (h:mm:ss.cc)，不足一厘秒的部分截断。
+    """
+    h, ms = divmod(ms, 3600000)
+    m, ms = divmod(ms, 60000)
+    s, ms = divmod(ms, 1000)
+    return f"{h:0{hour_width}}:{m:02}:{s:02}.{ms // 10:02}"
+
+
+def ms_to_srt_time(ms):
+    """
+    将毫秒转换为 SRT 时间格式 (hh:mm:ss,mmm)。
+    """
+    h, ms = divmod(ms, 3600000)
+    m, ms = divmod(ms, 60000)
+    s, ms = divmod(ms, 1000)
+    return f"{h:02}:{m:02}:{s:02},{ms:03}"
+
+
+def parse_times_scalar(fields):
+    return array('q', map(parse_time_to_ms, fields))
+
+
+def describe_event_error(line):
+    """
+    为无法解析的 Dialogue 行生成错误信息。
+    """
+    match = _ASS_LOOSE_RE.match(line)
+    if match is None or match.group('layer') is None:
+        return f"错误解析行的层级: {line.rstrip()}"
+    return f"错误解析时间: {match.group('start')} 或 {match.group('end')}"
+
+
+class EventStore:
+    """
+    一次解析得到的紧凑事件表。
+
+    start/end/layer 以 array('q') 按列存放；原文只保留一份，
+    每个事件只记录 Start、End 两个字段在原文中的位置（spans，每个事件 4 个偏移量），
+    输出时用原文切片拼接新的时间戳，不再逐行 split/join。
+    """
+    __slots__ = ('text', 'fmt', 'layer', 'start', 'end', 'spans', 'dirty', 'errors', 'path', 'newline')
+
+    def __init__(self, text, fmt):
+        self.text = text
+        self.fmt = fmt
+        # 从文件读入时为文件路径，写回同一路径时据此判断内容是否变化
+        self.path = None
+        # 写出文件时使用的换行符：load_events 统一为 \n 后解析，写回时恢复原文件的换行符
+        self.newline = '\n'
+        self.layer = array('q')
+        self.start = array('q')
+        self.end = array('q')
+        self.spans = array('q')
+        # 标记哪些事件的时间需要重新格式化输出，未标记的事件保持原样
+        self.dirty = bytearray()
+        # 无法解析的事件行（原样保留，不做修改）
+        self.errors = []
+
+    @classmethod
+    def parse(cls, text, fmt, parse_times=None):
+        """
+        解析整份字幕。parse_times 用于把时间字段列表批量转换为毫秒数组，默认逐个调用 parse_time_to_ms。
+        """
+        if parse_times is None:
+            parse_times = parse_times_scalar
+        store = cls(text, fmt)
+        event_re = _ASS_EVENT_RE if fmt == FORMAT_ASS else _SRT_TIMING_RE
+        spans_extend = store.spans.extend
+        start_fields = []
+        end_fields = []
+        start_append = start_fields.append
+        end_append = end_fields.append
+
+        if fmt == FORMAT_ASS:
+            layers = []
+            layer_append = layers.append
+            for match in event_re.finditer(text):
+                layer, start, end = match.group('layer', 'start', 'end')
+                layer_append(int(layer))
+                start_append(start)
+                end_append(end)
+                spans_extend(match.span('start') + match.span('end'))
+            store.layer = array('q', layers)
+            # 只有存在未匹配的 Dialogue 行时才逐行查找出错原因
+            if len(layers) < text.count('\nDialogue: ') + text.startswith('Dialogue: '):
+                store.errors = [describe_event_error(m.group()) for m in _ASS_DIALOGUE_LINE_RE.finditer(text)
+                                if _ASS_EVENT_RE.match(m.group()) is None]
+        else:
+            for match in event_re.finditer(text):
+                start, end = match.group('start', 'end')
+                start_append(start)
+                end_append(end)
+                spans_extend(match.span('start') + match.span('end'))
+            store.layer = array('q', bytes(8 * len(start_fields)))
+
+        store.start = parse_times(start_fields)
+        store.end = parse_times(end_fields)
+        store.dirty = bytearray(len(start_fields))
+        return store
+
+    def __len__(self):
+        return len(self.start)
+
+    def _line_at(self, pos):
+        line_end = self.text.find('\n', pos)
+        return self.text[pos:line_end if line_end != -1 else len(self.text)]
+
+    def shift(self, offset_ms, layers=None, indices=None):
+        """
+        将事件整体偏移 offset_ms 毫秒，结果小于 0 时截断为 0。layers 为空时作用于所有层。
+        indices 为需要偏移的事件下标（例如 EventIndex 的查询结果），为 None 时作用于所有事件。
+        """
+        offset_ms = int(round(offset_ms))
+        layers = set(layers) if layers else None
+        start, end, layer, dirty = self.start, self.end, self.layer, self.dirty
+        for i in range(len(start)) if indices is None else indices:
+            if layers is not None and layer[i] not in layers:
+                continue
+            start[i] = max(0, start[i] + offset_ms)
+            end[i] = max(0, end[i] + offset_ms)
+            dirty[i] = 1
+
+    def apply_sync_map(self, sync_map, layers=None, indices=None):
+        """
+        按同步映射（SyncMap）调整事件时间，结果小于 0 时截断为 0。layers、indices 的含义同 shift。
+        """
+        layers = set(layers) if layers else None
+        start, end, layer, dirty = self.start, self.end, self.layer, self.dirty
+        map_time, offset_at = sync_map.map_time, sync_map.offset_at
+        for i in range(len(start)) if indices is None else indices:
+            if layers is not None and layer[i] not in layers:
+                continue
+            if sync_map.interpolate:
+                start[i], end[i] = max(0, map_time(start[i])), max(0, map_time(end[i]))
+            else:
+                offset_ms = offset_at(start[i])
+                start[i], end[i] = max(0, start[i] + offset_ms), max(0, end[i] + offset_ms)
+            dirty[i] = 1
+
+    def retime(self, factor, indices=None):
+        """
+        按比例缩放事件时间（帧率转换）。ASS 结果四舍五入到厘秒，SRT 四舍五入到毫秒。indices 的含义同 shift。
+        factor 为源帧率 / 目标帧率（建议使用 Fraction，见 parse_framerate），缩放全部用整数运算，长片也不会累积误差；
+        也可以是 Timecodes.sync_map 生成的逐帧映射（可变帧率）。
+        """
+        if isinstance(factor, SyncMap):
+            self.apply_sync_map(factor, indices=indices)
+            return
+        unit = 10 if self.fmt == FORMAT_ASS else 1
+        num, den = scale_ratio(factor)
+        # round(ms * num / den / unit)，取整方式为四舍五入
+        num, den = 2 * num, 2 * den * unit
+        half = den // 2
+        start, end, dirty = self.start, self.end, self.dirty
+        for i in range(len(start)) if indices is None else indices:
+            start[i] = (start[i] * num + half) // den * unit
+            end[i] = (end[i] * num + half) // den * unit
+            dirty[i] = 1
+
+    def event_text(self, i):
+        """
+        返回事件的正文：ASS 为 Text 字段，SRT 为时间行之后直到空行为止的各行（以换行连接）。
+        """
+        text = self.text
+        pos = self.spans[4 * i + 3]
+        if self.fmt == FORMAT_ASS:
+            # End 之后依次为 Style, Name, MarginL, MarginR, MarginV, Effect, Text
+            line = self._line_at(pos).rstrip('\r')
+            parts = line.split(',', 7)
+            return parts[7] if len(parts) == 8 else ''
+
+        line_end = text.find('\n', pos)
+        if line_end == -1:
+            return ''
+        pos = line_end + 1
+        lines = []
+        while pos < len(text):
+            line_end = text.find('\n', pos)
+            if line_end == -1:
+                line_end = len(text)
+            line = text[pos:line_end]
+            if not line.strip():
+                break
+            lines.append(line.rstrip('\r'))
+            pos = line_end + 1
+        return '\n'.join(lines)
+
+    def event_fields(self, i):
+        """
+        返回供事件过滤使用的 (Style, Name, Effect, Text)。SRT 没有前三个字段，均为空字符串。
+        """
+        if self.fmt != FORMAT_ASS:
+            return '', '', '', self.event_text(i)
+        # End 之后依次为 Style, Name, MarginL, MarginR, MarginV, Effect, Text
+        parts = self._line_at(self.spans[4 * i + 3]).rstrip('\r').split(',', 7)
+        parts += [''] * (8 - len(parts))
+        return parts[1].strip(), parts[2].strip(), parts[6].strip(), parts[7]
+
+    def select(self, event_filter, indices=None):
+        """
+        返回满足过滤器（event_filter.compile_filter 的结果）的事件下标。indices 不为 None 时只在其中挑选。
+        先用层号筛选，只有通过的事件才提取文本字段。
+        """
+        layer = self.layer
+        layer_test, test = event_filter.layer_test, event_filter.test
+        selected = []
+        for i in range(len(layer)) if indices is None else indices:
+            if layer_test is not None and not layer_test(layer[i]):
+                continue
+            if test is not None and not test(layer[i], self.event_fields(i)):
+                continue
+            selected.append(i)
+        return selected
+
+    def dirty_indices(self):
+        return [i for i, changed in enumerate(self.dirty) if changed]
+
+    def chunks(self, formatted=None):
+        """
+        逐段产出转换后的内容：未修改部分直接为原文切片，只有被标记事件的时间戳被重新格式化。
+        formatted 可按被标记事件的顺序提供预先批量格式化好的 (start, end) 文本。
+        """
+        text, spans = self.text, self.spans
+        indices = self.dirty_indices()
+        if formatted is None:
+            format_time = ms_to_time if self.fmt == FORMAT_ASS else ms_to_srt_time
+            start, end = self.start, self.end
+            formatted = ((format_time(start[i]), format_time(end[i])) for i in indices)
+        pos = 0
+        for i, (start_text, end_text) in zip(indices, formatted):
+            base = 4 * i
+            yield text[pos:spans[base]]
+            yield start_text
+            yield text[spans[base + 1]:spans[base + 2]]
+            yield end_text
+            pos = spans[base + 3]
+        yield text[pos:]
+
+    def render(self):
+        return ''.join(self.chunks())
+
+
+class EventIndex:
+    """
+    按开始时间排序的事件索引，供时间范围查询使用，每次查询耗时 O(log n + k)。
+
+    order 为按开始时间排序的事件下标，starts 为对应的开始时间；
+    重叠查询以最长事件时长为界向前扩展二分查找的范围，再按结束时间过滤。
+    索引建立后若事件时间被修改，需要重新建立。
+    """
+    __slots__ = ('order', 'starts', 'ends', 'max_duration')
+
+    def __init__(self, store):
+        start, end = store.start, store.end
+        self.order = array('q', sorted(range(len(start)), key=start.__getitem__))
+        self.starts = array('q', (start[i] for i in self.order))
+        self.ends = end
+        self.max_duration = max((e - s for s, e in zip(start, end)), default=0)
+
+    def __len__(self):
+        return len(self.order)
+
+    def starting_in(self, lo=None, hi=None):
+        """
+        开始时间位于 [lo, hi) 的事件下标（按开始时间排序）。lo/hi 为 None 时不限制该端。
+        """
+        left = 0 if lo is None else bisect_left(self.starts, lo)
+        right = len(self.starts) if hi is None else bisect_left(self.starts, hi)
+        return self.order[left:right]
+
+    def overlapping(self, lo=None, hi=None):
+        """
+        与 [lo, hi) 有重叠（start < hi 且 end > lo）的事件下标（按开始时间排序）。
+        """
+        right = len(self.starts) if hi is None else bisect_left(self.starts, hi)
+        if lo is None:
+            return self.order[:right]
+        left = bisect_left(self.starts, lo - max(self.max_duration, 0))
+        ends = self.ends
+        return array('q', (i for i in self.order[left:right] if ends[i] > lo))
+
+
+class SyncMap:
+    """
+    分段时间映射，一次即可完成多段不同偏移量的调整。支持两种写法（每行一条，# 开头为注释）：
+
+    - 分段偏移：“时间点 偏移秒数”，例如 "0:12:34 +2.0"。开始时间位于该时间点与下一个时间点之间的事件
+      整体偏移对应的量，早于第一个时间点的事件不变。
+    - 锚点插值：“原时间 -> 目标时间”，例如 "0:12:34 -> 0:12:36.5"。事件的开始、结束时间分别在相邻锚点之间线性插值，
+      锚点范围之外沿用最近锚点的偏移量。
+
+    时间的写法同 parse_timestamp。times 为升序的时间点（毫秒），values 为对应的偏移量或目标时间（毫秒）。
+    """
+    __slots__ = ('times', 'values', 'interpolate')
+
+    def __init__(self, times, values, interpolate=False):
+        self.times = list(times)
+        self.values = list(values)
+        self.interpolate = interpolate
+
+    @classmethod
+    def parse(cls, text):
+        entries = []
+        interpolate = None
+        for number, raw_line in enumerate(text.splitlines(), 1):
+            line = raw_line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            try:
+                if '->' in line:
+                    source, target = line.split('->')
+                    entry, is_anchor = (parse_timestamp(source), parse_timestamp(target)), True
+                else:
+                    moment, offset = line.split()
+                    entry, is_anchor = (parse_timestamp(moment), int(round(float(offset) * 1000))), False
+            except ValueError:
+                raise ValueError(f"同步映射第 {number} 行格式错误: {raw_line.strip()}")
+            if interpolate is None:
+                interpolate = is_anchor
+            elif interpolate != is_anchor:
+                raise ValueError(f"同步映射第 {number} 行: 分段偏移与锚点不能混用")
+            entries.append(entry)
+        if not entries:
+            raise ValueError("同步映射为空")
+
+        entries.sort()
+        times = [moment for moment, _ in entries]
+        values = [value for _, value in entries]
+        if any(a == b for a, b in zip(times, times[1:])):
+            raise ValueError("同步映射中存在重复的时间点")
+        if interpolate and any(a >= b for a, b in zip(values, values[1:])):
+            raise ValueError("同步映射的目标时间必须随原时间递增")
+        return cls(times, values, interpolate)
+
+    @classmethod
+    def load(cls, filepath):
+        with open(filepath, 'r', encoding='utf-8-sig') as f:
+            return cls.parse(f.read())
+
+    def offset_at(self, ms):
+        """
+        分段偏移：返回开始时间为 ms 的事件应偏移的毫秒数。
+        """
+        i = bisect_right(self.times, ms) - 1
+        return self.values[i] if i >= 0 else 0
+
+    def map_time(self, ms):
+        """
+        锚点插值：返回时间 ms 映射后的时间（四舍五入到毫秒，整数运算，与向量化实现结果一致）。
+        """
+        times, values = self.times, self.values
+        i = bisect_right(times, ms) - 1
+        if i < 0:
+            return ms + values[0] - times[0]
+        if i >= len(times) - 1:
+            return ms + values[-1] - times[-1]
+        t0, t1, d0, d1 = times[i], times[i + 1], values[i], values[i + 1]
+        return d0 + (2 * (ms - t0) * (d1 - d0) + (t1 - t0)) // (2 * (t1 - t0))
+
+
+def parse_framerate(value):
+    """
+    将帧率解析为 Fraction：支持整数、小数与分数（例如 24000/1001）。
+    23.976、29.97、59.94 等 NTSC 帧率的近似写法会换算为精确的 n*1000/1001。
+    """
+    from fractions import Fraction
+    try:
+        rate = Fraction(str(value).strip())
+    except (ValueError, ZeroDivisionError):
+        raise ValueError(f"无效的帧率: {value}") from None
+    if rate <= 0:
+        raise ValueError(f"帧率必须大于 0: {value}")
+    if rate.denominator != 1:
+        ntsc = Fraction(round(rate * Fraction(1001, 1000)) * 1000, 1001)
+        if abs(rate - ntsc) < Fraction(1, 200):
+            return ntsc
+    return rate
+
+
+def scale_ratio(factor):
+    """
+    将缩放比例转换为 (分子, 分母) 两个整数。浮点数会先近似为分母不超过 10^6 的分数。
+    """
+    if isinstance(factor, int):
+        return factor, 1
+    from fractions import Fraction
+    factor = Fraction(factor)
+    if factor.denominator > 1000000:
+        factor = factor.limit_denominator(1000000)
+    return factor.numerator, factor.denominator
+
+
+class Timecodes:
+    """
+    可变帧率视频的逐帧时间表（mkvextract 等工具导出的 timecodes v2 文件：首行为 "# timecode format v2"，
+    之后每行一个帧的显示时间，单位为毫秒，可以带小数）。times 为升序的各帧时间（毫秒，整数）。
+    """
+    __slots__ = ('times',)
+
+    HEADER = '# timecode format v2'
+
+    def __init__(self, times):
+        self.times = times
+
+    @classmethod
+    def parse(cls, text):
+        lines = text.splitlines()
+        if not lines or lines[0].strip().lower() != cls.HEADER:
+            raise ValueError(f"只支持 timecodes v2 格式，首行应为 \"{cls.HEADER}\"")
+        times = []
+        for number, raw_line in enumerate(lines[1:], 2):
+            line = raw_line.strip()
+            if not line or line.startswith('#'):
+                continue
+            try:
+                times.append(int(round(float(line))))
+            except ValueError:
+                raise ValueError(f"时间码文件第 {number} 行格式错误: {line}") from None
+            if len(times) > 1 and times[-1] <= times[-2]:
+                raise ValueError(f"时间码文件第 {number} 行: 帧时间必须严格递增")
+        if len(times) < 2:
+            raise ValueError("时间码文件中至少需要两帧")
+        return cls(times)
+
+    @classmethod
+    def load(cls, filepath):
+        with open(filepath, 'r', encoding='utf-8-sig') as f:
+            return cls.parse(f.read())
+
+    @classmethod
+    def constant(cls, rate, frames):
+        """
+        固定帧率 rate（见 parse_framerate）下前 frames 帧的时间表。
+        """
+        num, den = scale_ratio(rate)
+        return cls([(2000 * i * den + num) // (2 * num) for i in range(frames)])
+
+    def frame_at(self, ms):
+        """
+        返回时间 ms 所在的帧号（早于第一帧时为 -1）。
+        """
+        return bisect_right(self.times, ms) - 1
+
+    def sync_map(self, target):
+        """
+        生成将本时间表上的时间逐帧映射到 target 时间表的 SyncMap：第 n 帧的时间对应 target 中第 n 帧的时间，
+        帧内按两帧的时长线性插值，超出两者共同帧数的部分沿用最后一帧的偏移量。
+        """
+        frames = min(len(self.times), len(target.times))
+        return SyncMap(self.times[:frames], target.times[:frames], interpolate=True)
+
+
+def frame_mapping(source, target):
+    """
+    生成帧率转换使用的映射，交给 EventStore.retime。source、target 为帧率（Fraction）或 Timecodes：
+    两者均为固定帧率时返回缩放比例，否则把固定帧率的一方展开为时间表后返回逐帧映射。
+    """
+    if not isinstance(source, Timecodes) and not isinstance(target, Timecodes):
+        return source / target
+    if not isinstance(source, Timecodes):
+        source = Timecodes.constant(source, len(target.times))
+    elif not isinstance(target, Timecodes):
+        target = Timecodes.constant(target, len(source.times))
+    return source.sync_map(target)
+
+
+def iter_shifted_lines(lines, fmt, offset_ms, layers=None, errors=None):
+    """
+    流式平移时间戳的生成器：逐行读入、逐行产出，内存占用与文件大小无关。
+    无法解析的事件行原样产出，错误信息追加到 errors 中。
+    """
+    offset_ms = int(round(offset_ms))
+    layers = set(layers) if layers and fmt == FORMAT_ASS else None
+    if fmt == FORMAT_ASS:
+        match_event, format_time = _ASS_EVENT_RE.match, ms_to_time
+    else:
+        match_event, format_time = _SRT_TIMING_RE.match, ms_to_srt_time
+
+    for line in lines:
+        match = match_event(line)
+        if match is None:
+            if errors is not None and fmt == FORMAT_ASS and line.startswith('Dialogue: '):
+                errors.append(describe_event_error(line))
+            yield line
+            continue
+
+        if layers is not None and int(match.group('layer')) not in layers:
+            yield line
+            continue
+
+        start = parse_time_to_ms(match.group('start'))
+        end = parse_time_to_ms(match.group('end'))
+
+        start_pos, start_stop = match.span('start')
+        end_pos, end_stop = match.span('end')
+        yield (f"{line[:start_pos]}{format_time(max(0, start + offset_ms))}"
+               f"{line[start_stop:end_pos]}{format_time(max(0, end + offset_ms))}{line[end_stop:]}")
+
+
+def _iter_time_patches(buffer, fmt, offset_ms, layers=None, errors=None):
+    """
+    在 UTF-8 字节（须从行首开始、在行尾结束）上定位需要平移的 Start/End 字段，
+    依次产出 (字段起点, 字段终点, 新时间戳字节)。
+    """
+    offset_ms = int(round(offset_ms))
+    layers = set(layers) if layers and fmt == FORMAT_ASS else None
+    if fmt == FORMAT_ASS:
+        event_re, format_time = _ASS_EVENT_BYTES_RE, ms_to_time
+    else:
+        event_re, format_time = _SRT_TIMING_BYTES_RE, ms_to_srt_time
+
+    matched = 0
+    for match in event_re.finditer(buffer):
+        matched += 1
+        if layers is not None and int(match.group('layer')) not in layers:
+            continue
+        start = parse_time_to_ms(match.group('start').decode('ascii'))
+        end = parse_time_to_ms(match.group('end').decode('ascii'))
+        yield match.span('start') + (format_time(max(0, start + offset_ms)).encode('ascii'),)
+        yield match.span('end') + (format_time(max(0, end + offset_ms)).encode('ascii'),)
+
+    record = metrics.current()
+    if record is not None:
+        record.events += matched
+
+    # 只有存在未匹配的 Dialogue 行时才逐行查找出错原因
+    if errors is not None and fmt == FORMAT_ASS and \
+            matched < buffer.count(b'\nDialogue: ') + buffer[:10].startswith(b'Dialogue: '):
+        for line in bytes(buffer).decode('utf-8').splitlines():
+            if line.startswith('Dialogue: ') and _ASS_EVENT_RE.match(line) is None:
+                errors.append(describe_event_error(line))
+
+
+def iter_shifted_spans(buffer, fmt, offset_ms, layers=None, errors=None):
+    """
+    在 UTF-8 字节（bytes，须从行首开始、在行尾结束）上只定位 Start/End 时间戳的偏移量，
+    产出输出片段：时间戳之间的原文为 memoryview 切片，不解码也不复制，只有新的时间戳是新建的 bytes。
+    """
+    view = memoryview(buffer)
+    pos = 0
+    for field_start, field_stop, value in _iter_time_patches(buffer, fmt, offset_ms, layers, errors):
+        yield view[pos:field_start]
+        yield value
+        pos = field_stop
+    yield view[pos:]
+
+
+def iter_line_blocks(infile, block_size=SCAN_BLOCK_SIZE):
+    """
+    从二进制文件中按块读取，每块补齐到行尾，保证事件行不会被块边界截断。
+    """
+    while True:
+        block = infile.read(block_size)
+        if not block:
+            return
+        if not block.endswith(b'\n'):
+            block += infile.readline()
+        yield block
+
+
+def _timed_blocks(infile):
+    # 与 iter_line_blocks 相同，启用统计时把每块的读取计入 read 阶段；每读一块前检查是否已取消
+    blocks = iter_line_blocks(infile)
+    while True:
+        check_cancelled()
+        with stage('read'):
+            block = next(blocks, None)
+        if block is None:
+            return
+        yield block
+
+
+def _umask():
+    # 只能通过设置再恢复的方式读取 umask，进程内只读取一次
+    global _cached_umask
+    if _cached_umask is None:
+        _cached_umask = os.umask(0o022)
+        os.umask(_cached_umask)
+    return _cached_umask
+
+
+@contextmanager
+def atomic_open(filepath, encoding='utf-8', binary=False):
+    """
+    在目标文件所在目录创建临时文件供写入，写入完成后通过 os.replace 原子替换目标文件。
+    写入过程中出错时删除临时文件，原文件保持不变。binary 为 True 时以二进制模式写入。
+    落盘策略为 file 时替换前 fsync 临时文件、替换后 fsync 所在目录；batch 时记录路径，由 sync_files 统一落盘。
+    目标为符号链接时替换链接指向的文件；新建的文件与直接 open 一样按 umask 设置权限。
+    """
+    filepath = os.path.realpath(filepath)
+    directory = os.path.dirname(filepath)
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(filepath)}.", suffix='.tmp', dir=directory)
+    try:
+        with (os.fdopen(fd, 'wb') if binary else os.fdopen(fd, 'w', encoding=encoding)) as outfile:
+            yield outfile
+            if _fsync_policy == FSYNC_FILE:
+                outfile.flush()
+                os.fsync(outfile.fileno())
+        if os.path.exists(filepath):
+            shutil.copymode(filepath, tmp_path)
+        else:
+            # mkstemp 创建的文件只有所有者可读写
+            os.chmod(tmp_path, 0o666 & ~_umask())
+        os.replace(tmp_path, filepath)
+        if _fsync_policy == FSYNC_FILE:
+            _fsync_directory(directory)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def set_fsync_policy(policy):
+    """
+    设置当前进程的落盘策略（FSYNC_POLICIES 之一）。进程池的工作进程需在 initializer 中设置。
+    """
+    global _fsync_policy
+    if policy not in FSYNC_POLICIES:
+        raise ValueError(f"未知的落盘策略: {policy}，可选值为 {', '.join(FSYNC_POLICIES)}")
+    _fsync_policy = policy
+
+
+def fsync_policy():
+    return _fsync_policy
+
+
+def _fsync_directory(directory):
+    # 让 os.replace 的结果落盘；Windows 无法打开目录，NTFS 的元数据由日志保证
+    if os.name == 'nt':
+        return
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def sync_files(filepaths):
+    """
+    批量落盘：依次 fsync 已写入的文件，再对涉及的目录各 fsync 一次。用于 batch 策略下整批处理完成之后。
+    """
+    directories = set()
+    for filepath in filepaths:
+        with open(filepath, 'r+b') as f:
+            os.fsync(f.fileno())
+        directories.add(os.path.dirname(os.path.abspath(filepath)))
+    for directory in directories:
+        _fsync_directory(directory)
+
+
+def sniff_format(data):
+    """
+    根据内容判断字幕格式（用于没有扩展名的标准输入等）：含 [Script Info]、[Events] 或 Dialogue 行的为 ASS/SSA，否则按 SRT 处理。
+    """
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    head = data[:64 * 1024]
+    if b'[Script Info]' in head or b'[Events]' in head or b'\nDialogue: ' in head or head.startswith(b'Dialogue: '):
+        return FORMAT_ASS
+    return FORMAT_SRT
+
+
+def shift_stream(infile, outfile, offset_ms, layers=None, fmt=None, errors=None):
+    """
+    从二进制流读取、向二进制流写出（例如 sys.stdin.buffer 与 sys.stdout.buffer），平移时间轴，内存占用与输入大小无关。
+    按块直接处理 UTF-8 字节，时间戳以外的内容（包括换行符）原样写出；每块仍会校验 UTF-8，编码错误时报错。
+    未指定 fmt 时根据第一块的内容判断格式。
+    """
+    for block in _timed_blocks(infile):
+        if fmt is None:
+            fmt = sniff_format(block)
+        _write_spans(outfile, block, _shift_block(block, fmt, offset_ms, layers, errors))
+
+
+def _shift_block(block, fmt, offset_ms, layers, errors):
+    with stage('decode'):
+        # 块在行尾结束，不会截断多字节字符
+        codecs.utf_8_decode(block, 'strict', True)
+    with stage('transform'):
+        return list(iter_shifted_spans(block, fmt, offset_ms, layers, errors))
+
+
+def _write_spans(outfile, block, spans):
+    with stage('write'):
+        outfile.writelines(spans)
+    record = metrics.current()
+    if record is not None:
+        record.bytes_in += len(block)
+        record.bytes_out += sum(map(len, spans))
+
+
+def shift_file(filepath, offset_ms, layers=None, fmt=None, errors=None):
+    """
+    以流式方式平移字幕文件的时间轴并原子替换原文件，返回是否写入了文件。
+    在第一个发生变化的块之前不创建临时文件；所有时间戳都与原文相同（例如偏移量为 0、指定的层没有事件）时不写入。
+    注意：输入文件须在替换前关闭（Windows 下无法替换仍被打开的文件）。
+    """
+    if fmt is None:
+        fmt = format_for_path(filepath)
+    record = metrics.current()
+    with open(filepath, 'rb') as infile:
+        unchanged_size = 0
+        for block in _timed_blocks(infile):
+            spans = _shift_block(block, fmt, offset_ms, layers, errors)
+            if len(spans) > 1 and b''.join(spans) != block:
+                break
+            unchanged_size += len(block)
+        else:
+            if record is not None:
+                record.bytes_in += unchanged_size
+            return False
+        if record is not None:
+            record.bytes_in += unchanged_size
+        resume = infile.tell()
+
+    with atomic_open(filepath, binary=True) as outfile:
+        with open(filepath, 'rb') as infile:
+            # 未变化的部分原样复制，从第一个变化的块开始继续流式处理
+            with stage('write'):
+                _copy_bytes(infile, outfile, unchanged_size)
+            if record is not None:
+                record.bytes_out += unchanged_size
+            infile.seek(resume)
+            _write_spans(outfile, block, spans)
+            shift_stream(infile, outfile, offset_ms, layers, fmt, errors)
+    return True
+
+
+def _copy_bytes(infile, outfile, size):
+    while size > 0:
+        chunk = infile.read(min(size, SCAN_BLOCK_SIZE))
+        if not chunk:
+            return
+        outfile.write(chunk)
+        size -= len(chunk)
+
+
+def _read_data(data):
+    # 文本流或二进制流先读出全部内容
+    return data.read() if hasattr(data, 'read') else data
+
+
+def shift_text(data, offset_ms, layers=None, fmt=None, errors=None):
+    """
+    在内存中平移时间轴：data 为 str、UTF-8 bytes 或可读取的流，返回与输入同类型（流按读出的类型）的结果，不读写文件。
+    """
+    data = _read_data(data)
+    is_text = isinstance(data, str)
+    raw = data.encode('utf-8') if is_text else bytes(data)
+    if not is_text:
+        codecs.utf_8_decode(raw, 'strict', True)
+    if fmt is None:
+        fmt = sniff_format(raw)
+    result = b''.join(iter_shifted_spans(raw, fmt, offset_ms, layers, errors))
+    return result.decode('utf-8') if is_text else result
+
+
+def parse_data(data, fmt=None, parse_times=None):
+    """
+    将 str、UTF-8 bytes 或可读取的流解析为 EventStore，返回 (store, 输入是否为 str)。未指定 fmt 时根据内容判断。
+    """
+    with stage('read'):
+        data = _read_data(data)
+    is_text = isinstance(data, str)
+    with stage('decode'):
+        text = data if is_text else bytes(data).decode('utf-8')
+    if fmt is None:
+        fmt = sniff_format(text[:64 * 1024])
+    with stage('parse'):
+        store = EventStore.parse(text, fmt, parse_times)
+    record = metrics.current()
+    if record is not None:
+        record.events += len(store)
+        record.bytes_in += len(data)
+    return store, is_text
+
+
+def retime_text(data, factor, fmt=None, event_filter=None):
+    """
+    在内存中按比例缩放时间轴（帧率转换）：data 为 str、UTF-8 bytes 或可读取的流，返回与输入同类型的结果。
+    指定 event_filter 时只转换匹配的事件。
+    """
+    store, is_text = parse_data(data, fmt)
+    with stage('transform'):
+        store.retime(factor, None if event_filter is None else store.select(event_filter))
+    with stage('format'):
+        result = store.render()
+        if not is_text:
+            result = result.encode('utf-8')
+    return result
+
+
+def patch_file_in_place(filepath, offset_ms, layers=None, fmt=None, errors=None):
+    """
+    时间戳宽度全部不变时，通过 mmap 只改写原文件中发生变化的时间戳字节，返回改写的时间戳个数（没有变化时为 0，不写入）；
+    只要有一个时间戳的宽度会改变（例如跨越 10 小时），就不做任何修改并返回 None，由调用方退回到 shift_file。
+    注意：原地改写不是原子操作，写入过程中断会留下部分修改的文件。
+    """
+    if fmt is None:
+        fmt = format_for_path(filepath)
+    # 先完整扫描一遍并校验宽度，确认可以原地改写后才开始写入
+    positions = array('q')
+    widths = bytearray()
+    values = bytearray()
+    found_errors = []
+    with open(filepath, 'rb') as infile:
+        base = 0
+        for block in _timed_blocks(infile):
+            with stage('decode'):
+                codecs.utf_8_decode(block, 'strict', True)
+            with stage('transform'):
+                for field_start, field_stop, value in _iter_time_patches(block, fmt, offset_ms, layers, found_errors):
+                    if len(value) != field_stop - field_start:
+                        return None
+                    if block[field_start:field_stop] != value:
+                        positions.append(base + field_start)
+                        widths.append(len(value))
+                        values += value
+            base += len(block)
+
+    if positions:
+        with stage('write'), open(filepath, 'r+b') as f, mmap.mmap(f.fileno(), 0) as mm:
+            offset = 0
+            for pos, width in zip(positions, widths):
+                mm[pos:pos + width] = values[offset:offset + width]
+                offset += width
+            if _fsync_policy == FSYNC_FILE:
+                mm.flush()
+    record = metrics.current()
+    if record is not None:
+        record.bytes_in += base
+        record.bytes_out += len(values)
+    if errors is not None:
+        errors.extend(found_errors)
+    return len(widths)
+
+
+def _cache_key(filepath, st):
+    return os.path.abspath(filepath), st.st_size, st.st_mtime_ns
+
+
+def _remember_encoding(key, encoding):
+    if len(_encoding_cache) >= _ENCODING_CACHE_SIZE:
+        _encoding_cache.clear()
+    _encoding_cache[key] = encoding
+
+
+def _chardet_encoding(data):
+    import chardet
+    encoding = chardet.detect(data)['encoding'] or 'utf-8'
+    return _ENCODING_SUPERSETS.get(encoding.lower(), encoding)
+
+
+def _guess_encoding(data, final):
+    """
+    依次检查 BOM、尝试严格的 UTF-8 解码，都不满足时才对有限的样本调用 chardet。
+    final 为 False 表示 data 只是文件开头的一部分，末尾可能截断了多字节字符。
+    """
+    for bom, encoding in _BOMS:
+        if data.startswith(bom):
+            return encoding
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(data, final)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        pass
+    return _chardet_encoding(data[:CHARDET_SAMPLE_SIZE])
+
+
+def detect_encoding(filepath):
+    """
+    检测文本文件编码，只读取文件开头的有限字节；结果按 (路径, 大小, 修改时间) 缓存。
+    """
+    st = os.stat(filepath)
+    key = _cache_key(filepath, st)
+    encoding = _encoding_cache.get(key)
+    if encoding is None:
+        with open(filepath, 'rb') as f:
+            data = f.read(CHARDET_SAMPLE_SIZE)
+        encoding = _guess_encoding(data, final=len(data) >= st.st_size)
+        _remember_encoding(key, encoding)
+    return encoding
+
+
+def read_text(filepath):
+    """
+    读取并解码文本文件，返回 (text, encoding)。文件只读取一次，检测编码时使用已读入的字节。
+    """
+    with open(filepath, 'rb') as f:
+        st = os.fstat(f.fileno())
+        data = f.read()
+    key = _cache_key(filepath, st)
+    encoding = _encoding_cache.get(key)
+    if encoding is None:
+        text, encoding = decode_text(data)
+        _remember_encoding(key, encoding)
+        return text, encoding
+    return data.decode(encoding), encoding
+
+
+def decode_text(data):
+    """
+    检测编码并解码已读入的字节（例如压缩包中的文件），返回 (text, encoding)。
+    """
+    for bom, encoding in _BOMS:
+        if data.startswith(bom):
+            break
+    else:
+        # 大多数字幕是 UTF-8，解码成功时直接使用解码结果，不必再检测
+        try:
+            return data.decode('utf-8'), 'utf-8'
+        except UnicodeDecodeError:
+            encoding = _guess_encoding(data[:CHARDET_SAMPLE_SIZE], final=False)
+    try:
+        return data.decode(encoding), encoding
+    except UnicodeDecodeError:
+        # 样本不足以判断时，退回到对全部内容检测
+        encoding = _chardet_encoding(data)
+        return data.decode(encoding), encoding
+
+
+def pick_style_name(metadata):
+    """
+    从 ASS 元数据中选取对话使用的样式：只有一个样式时使用该样式；存在多个样式时，
+    优先选择名为 default 或包含 default（不区分大小写）的样式，否则使用第一个样式。
+    """
+    style_lines = [line for line in metadata.splitlines() if line.startswith("Style:")]
+    style_names = [line.split(",")[0].split(":")[1].strip() for line in style_lines]
+    if not style_names:
+        raise ValueError("ASS 元数据模板中没有找到样式（Style:）")
+
+    for name in style_names:
+        if "default" in name.lower():
+            return name
+    return style_names[0]
+
+
+def iter_ass_dialogues(store, style_name, indices=None):
+    """
+    将 SRT 事件逐条转换为 ASS 的 Dialogue 行，多行字幕以空格连接。indices 不为 None 时只转换其中的事件。
+    """
+    start, end = store.start, store.end
+    for i in range(len(store)) if indices is None else indices:
+        text = ' '.join(line.strip() for line in store.event_text(i).split('\n'))
+        yield f"Dialogue: 0,{ms_to_time(start[i], hour_width=2)},{ms_to_time(end[i], hour_width=2)},{style_name},,0,0,0,,{text}\n"
+
+
+def _iter_ass_output(store, metadata, style_name, indices, advanced):
+    # 文件头之后每 ASS_WRITE_BATCH 行产出一段，同时检查高级语法，结果记录在 advanced 中
+    yield ''.join((metadata, '\n', ASS_EVENTS_HEADER))
+    dialogues = iter_ass_dialogues(store, style_name, indices)
+    while True:
+        with stage('format'):
+            chunk = ''.join(islice(dialogues, ASS_WRITE_BATCH))
+            if not advanced and ADVANCED_SYNTAX_RE.search(chunk):
+                advanced.append(True)
+        if not chunk:
+            return
+        yield chunk
+
+
+def write_srt_as_ass(store, filepath, metadata, indices=None, style_name=None):
+    """
+    以 metadata 为文件头，将 SRT 事件逐段写为 ASS 字幕，内存占用与输出大小无关。
+    返回 (是否写入了文件, 输出中是否含有需要人工处理的高级语法)。未指定 style_name 时从 metadata 中选取。
+    """
+    if style_name is None:
+        style_name = pick_style_name(metadata)
+    advanced = []
+    written = _write_chunks(filepath, _iter_ass_output(store, metadata, style_name, indices, advanced))
+    return written, bool(advanced)
+
+
+class AssConverter:
+    """
+    SRT 转 ASS：元数据模板与对话样式在创建时解析一次，整批文件共用（可 pickle 后交给进程池）。
+    模板中的 {filename} 替换为不含扩展名的文件名，其余字段或花括号不匹配时抛出 ValueError。
+    """
+
+    def __init__(self, template=DEFAULT_ASS_TEMPLATE):
+        from string import Formatter
+        self.template = template
+        # [(字面文本, 是否在其后插入文件名)]
+        self.parts = []
+        for literal, field, spec, conversion in Formatter().parse(template):
+            if field is not None and (field != 'filename' or spec or conversion):
+                field += f"!{conversion}" if conversion else ''
+                field += f":{spec}" if spec else ''
+                raise ValueError(f"元数据模板中只能使用 {{filename}} 占位符，不支持 {{{field}}}")
+            self.parts.append((literal, field is not None))
+        self.style_name = pick_style_name(self.metadata(''))
+
+    def metadata(self, filename):
+        return ''.join(literal + filename if has_field else literal for literal, has_field in self.parts)
+
+    def write(self, store, filepath, indices=None):
+        """
+        将 SRT 事件写为 ASS 字幕，文件头中的文件名取自 store.path。返回值同 write_srt_as_ass。
+        """
+        filename, _ext = os.path.splitext(os.path.basename(store.path))
+        return write_srt_as_ass(store, filepath, self.metadata(filename), indices, self.style_name)
+
+    def render(self, filename, store, indices=None):
+        """
+        在内存中转换（例如压缩包中的文件），返回 (UTF-8 编码、换行符与写入文件时相同的 ASS 内容, 是否含有高级语法)。
+        """
+        advanced = []
+        text = ''.join(_iter_ass_output(store, self.metadata(filename), self.style_name, indices, advanced))
+        return _encode_output(text), bool(advanced)
+
+
+def load_events(filepath, encoding='utf-8', fmt=None, parse_times=None):
+    """
+    读取字幕文件并解析为 EventStore。未指定 fmt 时根据扩展名判断；encoding 为 None 时自动检测编码。
+    """
+    if fmt is None:
+        fmt = format_for_path(filepath)
+    if encoding is None:
+        # 编码检测需要完整的字节，读取与解码一并计入 decode 阶段
+        with stage('decode'):
+            text, _encoding = read_text(filepath)
+    else:
+        with stage('read'):
+            with open(filepath, 'rb') as infile:
+                data = infile.read()
+        with stage('decode'):
+            text = data.decode(encoding)
+    newline = '\n'
+    if '\r' in text:
+        # 与文本模式读取保持一致，统一换行符；记录原来的换行符，写出时恢复，与流式引擎的输出逐字节相同
+        newline = '\r\n' if '\r\n' in text else '\r'
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    check_cancelled()
+    with stage('parse'):
+        store = EventStore.parse(text, fmt, parse_times)
+    store.path = filepath
+    store.newline = newline
+    record = metrics.current()
+    if record is not None:
+        record.events += len(store)
+        record.bytes_in += os.path.getsize(filepath)
+    return store
+
+
+def _same_content(filepath, data):
+    try:
+        if os.path.getsize(filepath) != len(data):
+            return False
+        with open(filepath, 'rb') as f:
+            return f.read() == data
+    except OSError:
+        return False
+
+
+def _write_text(filepath, text, original=None, newline=os.linesep):
+    """
+    以 UTF-8 写出 text（其中的 \\n 写为 newline），返回是否写入了文件。
+    original 为目标文件当前的内容（已读入的原文）时直接比较字符串，否则与磁盘上的现有文件逐字节比较；内容相同时不写入。
+    """
+    # 取消后不再写出，原文件保持不变
+    check_cancelled()
+    if original is not None and text == original:
+        return False
+    data = _encode_output(text, newline)
+    if original is None and _same_content(filepath, data):
+        return False
+    with stage('write'):
+        with atomic_open(filepath, binary=True) as outfile:
+            outfile.write(data)
+    record = metrics.current()
+    if record is not None:
+        record.bytes_out += len(data)
+    return True
+
+
+def _encode_output(text, newline=os.linesep):
+    return (text if newline == '\n' else text.replace('\n', newline)).encode('utf-8')
+
+
+def _write_chunks(filepath, chunks):
+    """
+    以 UTF-8（与文本模式相同的换行符）逐段写出 chunks（str 的可迭代对象），返回是否写入了文件。
+    先与磁盘上的现有文件逐段比较，在第一段不同的内容之前不创建临时文件；内容完全相同时不写入。
+    """
+    check_cancelled()
+    chunks = iter(chunks)
+    matched = 0
+    data = None
+    try:
+        existing = open(filepath, 'rb')
+    except OSError:
+        existing = None
+    if existing is not None:
+        with existing:
+            for text in chunks:
+                data = _encode_output(text)
+                if existing.read(len(data)) != data:
+                    break
+                matched += len(data)
+                data = None
+            else:
+                if not existing.read(1):
+                    return False
+
+    record = metrics.current()
+    with atomic_open(filepath, binary=True) as outfile:
+        if matched:
+            # 与现有文件相同的开头部分原样复制
+            with stage('write'):
+                with open(filepath, 'rb') as infile:
+                    _copy_bytes(infile, outfile, matched)
+        size = matched
+        if data is not None:
+            with stage('write'):
+                outfile.write(data)
+            size += len(data)
+        for text in chunks:
+            # 每段之间检查取消，取消时删除临时文件，原文件保持不变
+            check_cancelled()
+            data = _encode_output(text)
+            with stage('write'):
+                outfile.write(data)
+            size += len(data)
+    if record is not None:
+        record.bytes_out += size
+    return True
+
+
+def write_events(store, filepath, chunks=None):
+    """
+    写出 EventStore，返回是否写入了文件（内容与原文件相同时不写入）。换行符与读入的原文件相同。
+    chunks 为预先生成的输出片段（例如 sub_vector.store_chunks 的结果），默认为 store.chunks()。
+    """
+    with stage('format'):
+        text = ''.join(store.chunks() if chunks is None else chunks)
+    return _write_text(filepath, text, store.text if filepath == store.path else None, store.newline)
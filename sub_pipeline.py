@@ -0,0 +1,274 @@
+import multiprocessing
+import os
+import sys
+from docopt import docopt
+from loguru import logger
+from batch import largest_first, parse_jobs, run_batch
+from discovery import expand_inputs, output_directory
+from event_filter import compile_filter
+from metrics import METRICS_FORMATS, Report, emit, profiling, stage
+from progress import ProgressBar
+from sub_core import (DEFAULT_ASS_TEMPLATE, FORMAT_ASS, FORMAT_SRT, FSYNC_BATCH, FSYNC_FILE, UNCHANGED, AssConverter,
+                      SyncMap, format_for_path, fsync_policy, load_events, parse_framerate, parse_layers,
+                      set_fsync_policy, sync_files, write_events)
+
+__version__ = 'sub_pipeline v0.1.0'
+
+USAGE = f"""
+{__version__}
+Usage:
+  sub_pipeline [--retime <source_fps:target_fps>] [--sync-map <file>] [--offset <subtitle_shift_seconds>] [--layers <layer_numbers>] [--filter <expr>] [--to-ass] [--template <file>] [--output-dir <dir>] [--jobs <n>] [--metrics <format>] [--profile <file>] [--progress] [--fsync <policy>] [-r] [--include <glob>]... [--exclude <glob>]... INPUTS...
+  sub_pipeline --version
+  sub_pipeline (-h | --help)
+
+每个文件只读取、解析、写入一次，依次执行：帧率转换 → 同步映射 → 时间偏移 → 输出（可选转换为 ASS）。
+
+Options:
+  --retime <source_fps:target_fps>        可选参数，帧率转换，例如 25:23.976 或 25:24000/1001（23.976 等按精确的 n*1000/1001 计算）
+  --sync-map <file>                       可选参数，同步映射文件，按分段偏移或锚点插值调整时间（格式见 sub_adjust --help）。在帧率转换之后应用
+  -t --offset <subtitle_shift_seconds>    可选参数，字幕偏移量（单位：秒），负数为提前，正数为延后。在帧率转换之后应用
+  --layers <layer_numbers>                可选参数，将同步映射与时间偏移仅应用到此处设置的Layer中（仅ASS/SSA）。默认为 all
+  --filter <expr>                         可选参数，只处理匹配过滤表达式的事件（语法见 sub_adjust --help），例如 "style=Sign"。
+                                          帧率转换、同步映射与时间偏移只作用于匹配的事件；转换为 ASS 时只输出匹配的事件
+  --to-ass                                可选参数，将 SRT 字幕转换为 ASS 字幕输出（文件名为 原文件名.converted.ass）
+  --template <file>                       可选参数，SRT 转 ASS 使用的元数据模板文件（UTF-8），{{filename}} 会被替换为文件名。默认使用 sub_converter 的默认模板
+  -o --output-dir <dir>                   可选参数，输出目录。默认覆盖原文件（转换为 ASS 时输出到源文件所在目录）
+                                          输入目录中的文件在输出目录下保留相对于该目录的子目录结构
+  -j --jobs <n>                           可选参数，并行处理文件的进程数。默认为 CPU 核心数
+  --metrics <format>                      可选参数，处理完成后输出各阶段耗时等性能统计：text（写入日志）或 json（写到标准输出）
+  --profile <file>                        可选参数，使用 cProfile 记录性能分析数据并保存到该文件（pstats 格式）。启用时在单进程中处理
+  --progress                              可选参数，在标准错误上显示进度条（已处理文件数、事件数与每秒处理的事件数）
+  --fsync <policy>                        可选参数，写入的落盘策略：file（每个文件写完立即落盘）、batch（全部处理完成后统一落盘）
+                                          或 none（交给操作系统）。默认为 file。输出内容与现有文件相同时不会重写
+  -r --recursive                          可选参数，输入为目录时包含所有子目录
+  --include <glob>                        可选参数，只处理匹配该模式的文件，可重复指定
+  --exclude <glob>                        可选参数，跳过匹配该模式的文件或目录，可重复指定
+  --version                               显示版本信息
+  -h --help                               显示帮助信息
+
+Examples:
+  # 帧率 25 → 23.976，再提前 1.2 秒，并将 SRT 按模板转换为 ASS，输出到 out 目录
+  python sub_pipeline.py --retime 25:23.976 --offset -1.2 --to-ass --template template.txt --output-dir out subs
+
+  # 仅调整帧率与偏移，覆盖原文件
+  python sub_pipeline.py --retime 23.976:25 --offset 3 example.ass example.srt
+"""
+
+
+class RetimeStage:
+    """
+    帧率转换：按 source_rate / target_rate 缩放所有事件的时间，比例在创建时计算一次。
+    """
+
+    def __init__(self, source_rate, target_rate):
+        self.source_rate = source_rate
+        self.target_rate = target_rate
+        self.factor = source_rate / target_rate
+
+    def apply(self, store, indices=None):
+        store.retime(self.factor, indices)
+
+
+class ShiftStage:
+    """
+    时间偏移：layers 只对 ASS/SSA 生效，SRT 没有层的概念，总是整体偏移。
+    """
+
+    def __init__(self, offset_ms, layers=None):
+        self.offset_ms = offset_ms
+        self.layers = layers
+
+    def apply(self, store, indices=None):
+        store.shift(self.offset_ms, self.layers if store.fmt == FORMAT_ASS else None, indices)
+
+
+class SyncStage:
+    """
+    同步映射：按事件所在的分段偏移，或在锚点之间线性插值。layers 同样只对 ASS/SSA 生效。
+    """
+
+    def __init__(self, sync_map, layers=None):
+        self.sync_map = sync_map
+        self.layers = layers
+
+    def apply(self, store, indices=None):
+        store.apply_sync_map(self.sync_map, self.layers if store.fmt == FORMAT_ASS else None, indices)
+
+
+class Pipeline:
+    """
+    对同一份解析结果依次执行各个阶段，最后只写出一次。
+    指定 event_filter 时，每个文件只筛选一次事件，各阶段只作用于筛选出的事件。
+    转换为 ASS 时元数据模板在创建时解析一次，模板无效时抛出 ValueError。
+    roots 为展开的输入目录，其中的文件在 output_dir 下保留子目录结构（见 discovery.output_directory）。
+    """
+
+    def __init__(self, stages, to_ass=False, template=DEFAULT_ASS_TEMPLATE, output_dir=None, event_filter=None,
+                 roots=()):
+        self.stages = stages
+        self.to_ass = to_ass
+        self.converter = AssConverter(template) if to_ass else None
+        self.output_dir = output_dir
+        self.event_filter = event_filter
+        self.roots = roots
+
+    def output_path(self, filepath, fmt):
+        directory = output_directory(filepath, self.output_dir, self.roots) or os.path.dirname(filepath)
+        if self.to_ass and fmt == FORMAT_SRT:
+            filename, _ext = os.path.splitext(os.path.basename(filepath))
+            return os.path.join(directory, f"{filename}.converted.ass")
+        return os.path.join(directory, os.path.basename(filepath))
+
+
+def process_file(filepath, pipeline):
+    try:
+        # 转换为 ASS 时与 sub_converter 一致自动检测 SRT 编码，其余情况按 UTF-8 读写以保留原文件编码
+        fmt = format_for_path(filepath)
+        encoding = None if pipeline.to_ass and fmt == FORMAT_SRT else 'utf-8'
+        store = load_events(filepath, encoding, fmt)
+        with stage('transform'):
+            indices = None if pipeline.event_filter is None else store.select(pipeline.event_filter)
+            for step in pipeline.stages:
+                step.apply(store, indices)
+
+        output = pipeline.output_path(filepath, store.fmt)
+        if pipeline.output_dir:
+            os.makedirs(os.path.dirname(output), exist_ok=True)
+        if pipeline.to_ass and store.fmt == FORMAT_SRT:
+            written, has_advanced_syntax = pipeline.converter.write(store, output, indices)
+            if has_advanced_syntax:
+                logger.warning(f"{filepath} 包含高级语法（如 {{\\an1}} ~ {{\\an9}}），需要手动进一步处理")
+        else:
+            written = write_events(store, output)
+
+        if not written:
+            logger.info(f"输出内容未变化，跳过写入: {output}")
+            return True, UNCHANGED
+        logger.info(f"成功处理文件: {filepath} -> {output}")
+        return True, None
+    except Exception as e:
+        logger.error(f"错误处理文件 {filepath}: {str(e)}")
+        return False, str(e)
+
+
+def run_pipeline(filepaths, pipeline, jobs=None, report=None, progress=None):
+    """
+    并行处理所有文件，返回 (文件总数, 成功数, [(文件, 失败原因)], 内容未变化而未重写的文件数)。
+    report、progress 的含义见 batch.run_batch。落盘策略为 batch 时，全部完成后统一 fsync 写入过的文件。
+    """
+    filepaths = list(filepaths)
+    tasks = [(filepath, pipeline) for filepath in largest_first(filepaths)]
+    success_count = skipped_count = 0
+    failures = []
+    written = []
+    for (filepath, _), success, reason in run_batch(process_file, tasks, jobs, report, progress,
+                                                     initializer=set_fsync_policy, initargs=(fsync_policy(),)):
+        if not success:
+            failures.append((filepath, reason))
+            continue
+        success_count += 1
+        if reason == UNCHANGED:
+            skipped_count += 1
+        else:
+            written.append(pipeline.output_path(filepath, format_for_path(filepath)))
+    if fsync_policy() == FSYNC_BATCH:
+        sync_files(written)
+    return len(filepaths), success_count, failures, skipped_count
+
+
+def parse_retime(value):
+    source, _, target = value.partition(':')
+    return parse_framerate(source), parse_framerate(target)
+
+
+def main():
+    args = docopt(USAGE, version=__version__)
+
+    stages = []
+    if args["--retime"]:
+        try:
+            source_rate, target_rate = parse_retime(args["--retime"])
+        except ValueError as e:
+            logger.error(str(e))
+            return
+        stages.append(RetimeStage(source_rate, target_rate))
+    if args["--sync-map"]:
+        try:
+            sync_map = SyncMap.load(args["--sync-map"])
+        except (OSError, ValueError) as e:
+            logger.error(f"无法读取同步映射文件: {e}")
+            return
+        stages.append(SyncStage(sync_map, parse_layers(args["--layers"])))
+    if args["--offset"]:
+        stages.append(ShiftStage(float(args["--offset"]) * 1000, parse_layers(args["--layers"])))
+    if not stages and not args["--to-ass"]:
+        logger.error("未指定任何处理步骤（--retime、--sync-map、--offset、--to-ass）。")
+        return
+
+    event_filter = None
+    if args["--filter"]:
+        try:
+            event_filter = compile_filter(args["--filter"])
+        except ValueError as e:
+            logger.error(str(e))
+            return
+
+    template = DEFAULT_ASS_TEMPLATE
+    if args["--template"]:
+        with open(args["--template"], 'r', encoding='utf-8-sig') as f:
+            template = f.read()
+
+    output_dir = args["--output-dir"]
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    metrics_format = args["--metrics"]
+    if metrics_format not in (None, *METRICS_FORMATS):
+        logger.error(f"未知的统计输出格式: {metrics_format}，可选值为 {', '.join(METRICS_FORMATS)}")
+        return
+    report = Report() if metrics_format else None
+    try:
+        set_fsync_policy(args["--fsync"] or FSYNC_FILE)
+    except ValueError as e:
+        logger.error(str(e))
+        return
+    # 工作进程中的调用无法被主进程的 cProfile 记录，分析时在当前进程中逐个处理
+    jobs = 1 if args["--profile"] else parse_jobs(args["--jobs"])
+
+    try:
+        pipeline = Pipeline(stages, args["--to-ass"], template, output_dir, event_filter,
+                            [path for path in args["INPUTS"] if os.path.isdir(path)])
+    except ValueError as e:
+        logger.error(f"元数据模板无效: {e}")
+        return
+    filepaths = expand_inputs(args["INPUTS"], recursive=args["--recursive"],
+                              include=args["--include"], exclude=args["--exclude"])
+    with profiling(args["--profile"]):
+        progress = ProgressBar() if args["--progress"] else None
+        total_files, success_count, failures, skipped_count = run_pipeline(filepaths, pipeline, jobs, report, progress)
+        if progress is not None:
+            progress.close()
+
+    result_message = (
+        f"运行完毕。\n"
+        f"共处理 {total_files} 个文件。\n"
+        f"成功处理 {success_count} 个文件。\n"
+        f"失败处理 {len(failures)} 个文件。\n"
+    )
+    if skipped_count:
+        result_message += f"其中 {skipped_count} 个文件的输出内容未变化，未重写。\n"
+    if failures:
+        result_message += "\n失败原因:\n" + "\n".join(f"{filepath}: {reason}" for filepath, reason in failures)
+
+    log_result_fn = logger.info if success_count > 0 else logger.error
+    log_result_fn(f"\n\n{result_message}")
+    if args["--profile"]:
+        logger.info(f"性能分析结果已保存到 {args['--profile']}，可使用 python -m pstats {args['--profile']} 查看")
+    if report is not None:
+        emit(report, metrics_format, logger.info, sys.stdout)
+
+
+if __name__ == "__main__":
+    # 打包为可执行文件后，进程池的子进程需要此调用才能正常启动
+    multiprocessing.freeze_support()
+    main()
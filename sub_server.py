@@ -0,0 +1,231 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import stat
+from concurrent.futures import ProcessPoolExecutor
+from docopt import docopt
+from loguru import logger
+from batch import parse_jobs
+from event_filter import compile_filter
+from sub_core import DEFAULT_ASS_TEMPLATE, FORMAT_SRT, UNCHANGED, format_for_path, parse_layers
+
+__version__ = 'sub_server v0.1.0'
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 47291
+
+USAGE = f"""
+{__version__}
+Usage:
+  sub_server [--host <addr>] [--port <n>] [--jobs <n>]
+  sub_server --socket <path> [--jobs <n>]
+  sub_server --version
+  sub_server (-h | --help)
+
+常驻的本地任务服务：进程池中的解释器与模块只启动、导入一次，客户端（sub_client.py）提交的每个任务只需承担实际处理的开销。
+
+协议：每行一个 JSON 任务，服务端每完成一个任务就返回一行 JSON 结果（顺序与提交顺序无关，以 id 对应）。
+客户端发送完所有任务后关闭写端，服务端返回全部结果后关闭连接。
+
+  {{"id": 1, "op": "shift", "path": "a.ass", "offset": -2.5, "layers": "0,1", "engine": "stream", "filter": "style=Sign"}}
+  {{"id": 2, "op": "retime", "path": "a.srt", "from": 23.976, "to": 25, "output_dir": "out"}}
+  {{"id": 3, "op": "convert", "path": "a.srt", "template": "template.txt", "output_dir": "out"}}
+  -> {{"id": 1, "op": "shift", "path": "a.ass", "ok": true, "error": null, "skipped": false, "output": "a.ass"}}
+
+skipped 为 true 表示处理结果与现有文件相同，没有重写文件。
+convert 只接受 SRT 字幕，输出为 原文件名.converted.ass。
+
+Options:
+  --host <addr>                           可选参数，监听地址 [default: {DEFAULT_HOST}]
+  --port <n>                              可选参数，监听端口 [default: {DEFAULT_PORT}]
+  --socket <path>                         可选参数，改为监听 Unix 套接字（仅 Linux & MacOS）
+  -j --jobs <n>                           可选参数，工作进程数。默认为 CPU 核心数
+  --version                               显示版本信息
+  -h --help                               显示帮助信息
+
+Examples:
+  python sub_server.py --jobs 4
+  python sub_client.py shift --offset -2.5 example.ass
+"""
+
+OPS = ('shift', 'retime', 'convert')
+
+
+def job_filter(job):
+    return compile_filter(job['filter']) if job.get('filter') else None
+
+
+def _shift(job):
+    import sub_adjust
+    layers = job.get('layers')
+    layers = parse_layers(layers) if isinstance(layers, str) or layers is None else [int(layer) for layer in layers]
+    engine = job.get('engine') or sub_adjust.ENGINE_STREAM
+    if engine not in sub_adjust.ENGINES:
+        raise ValueError(f"未知的处理引擎: {engine}，可选值为 {', '.join(sub_adjust.ENGINES)}")
+    success, reason = sub_adjust.process_subtitle_file(job['path'], float(job['offset']) * 1000, layers, engine,
+                                                       event_filter=job_filter(job))
+    return success, reason, job['path']
+
+
+def _retime(job):
+    import timecode_converter
+    source_rate = timecode_converter.parse_rate(str(job['from']), "源帧率")
+    target_rate = timecode_converter.parse_rate(str(job['to']), "目标帧率")
+    new_filepath, written = timecode_converter.convert_file(job['path'], source_rate, target_rate,
+                                                            job.get('output_dir'), job_filter(job))
+    return True, None if written else UNCHANGED, new_filepath
+
+
+def _convert(job):
+    import sub_pipeline
+    if format_for_path(job['path']) != FORMAT_SRT:
+        raise ValueError(f"convert 只支持 SRT 字幕: {job['path']}")
+    template = DEFAULT_ASS_TEMPLATE
+    if job.get('template'):
+        with open(job['template'], 'r', encoding='utf-8-sig') as f:
+            template = f.read()
+    pipeline = sub_pipeline.Pipeline([], to_ass=True, template=template, output_dir=job.get('output_dir'),
+                                     event_filter=job_filter(job))
+    success, reason = sub_pipeline.process_file(job['path'], pipeline)
+    return success, reason, pipeline.output_path(job['path'], FORMAT_SRT)
+
+
+def init_worker():
+    """
+    工作进程启动时预先导入各处理模块，第一个任务无需再承担导入开销。
+    Ctrl+C 由主进程处理，工作进程忽略 SIGINT，随进程池一同退出。
+    """
+    import signal
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    import sub_adjust  # noqa: F401
+    import sub_pipeline  # noqa: F401
+    import timecode_converter  # noqa: F401
+
+
+def run_job(job):
+    """
+    在工作进程中执行一个任务，返回可直接序列化为 JSON 的结果。
+    """
+    result = {'id': job.get('id'), 'op': job.get('op'), 'path': job.get('path')}
+    try:
+        handler = {'shift': _shift, 'retime': _retime, 'convert': _convert}.get(job.get('op'))
+        if handler is None:
+            raise ValueError(f"未知的任务类型: {job.get('op')}，可选值为 {', '.join(OPS)}")
+        if not job.get('path'):
+            raise ValueError("任务缺少 path")
+        success, reason, output = handler(job)
+    except KeyError as e:
+        success, reason, output = False, f"任务缺少 {e.args[0]}", None
+    except Exception as e:
+        success, reason, output = False, str(e), None
+    result.update({'ok': success, 'error': None if success else reason, 'skipped': success and reason == UNCHANGED,
+                   'output': output if success else None})
+    return result
+
+
+async def handle_client(reader, writer, pool, max_pending):
+    """
+    逐行读取任务并提交到进程池，结果在完成后立即写回。在途任务达到上限时暂停读取，对客户端形成背压。
+    """
+    loop = asyncio.get_running_loop()
+    slots = asyncio.Semaphore(max_pending)
+    write_lock = asyncio.Lock()
+    pending = set()
+
+    async def send(result):
+        async with write_lock:
+            writer.write(json.dumps(result, ensure_ascii=False).encode('utf-8') + b'\n')
+            await writer.drain()
+
+    async def run(job):
+        try:
+            result = await loop.run_in_executor(pool, run_job, job)
+            log_fn = logger.info if result['ok'] else logger.error
+            log_fn(f"{result['op']} {result['path']}: {'成功' if result['ok'] else result['error']}")
+            await send(result)
+        finally:
+            slots.release()
+
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if not line.strip():
+                continue
+            try:
+                job = json.loads(line)
+                if not isinstance(job, dict):
+                    raise ValueError("任务必须是 JSON 对象")
+            except ValueError as e:
+                await send({'id': None, 'op': None, 'path': None, 'ok': False, 'error': f"无效的任务: {e}",
+                            'output': None})
+                continue
+            await slots.acquire()
+            task = asyncio.create_task(run(job))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+        if pending:
+            await asyncio.gather(*pending)
+    except (ConnectionError, asyncio.IncompleteReadError) as e:
+        logger.warning(f"客户端连接中断: {e}")
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+
+
+def remove_stale_socket(socket_path):
+    """
+    删除上次运行遗留的 Unix 套接字文件。路径上已有其他类型的文件时抛出 ValueError，不会删除。
+    """
+    try:
+        mode = os.lstat(socket_path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise ValueError(f"{socket_path} 已存在且不是套接字文件，拒绝覆盖")
+    os.remove(socket_path)
+
+
+async def serve(jobs, host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None):
+    if socket_path:
+        remove_stale_socket(socket_path)
+    # 使用 spawn 启动工作进程：fork 出的子进程会继承已接受的客户端连接，导致关闭连接后客户端收不到 EOF
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=init_worker) as pool:
+        def client_connected(reader, writer):
+            return handle_client(reader, writer, pool, jobs * 2)
+
+        if socket_path:
+            server = await asyncio.start_unix_server(client_connected, path=socket_path)
+            logger.info(f"{__version__} 正在监听 {socket_path}，工作进程数 {jobs}")
+        else:
+            server = await asyncio.start_server(client_connected, host=host, port=port)
+            logger.info(f"{__version__} 正在监听 {host}:{port}，工作进程数 {jobs}")
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    args = docopt(USAGE, version=__version__)
+    try:
+        jobs = parse_jobs(args["--jobs"])
+    except ValueError as e:
+        logger.error(str(e))
+        return
+    try:
+        asyncio.run(serve(jobs, args["--host"], int(args["--port"]), args["--socket"]))
+    except ValueError as e:
+        logger.error(str(e))
+    except KeyboardInterrupt:
+        logger.info("服务已停止。")
+
+
+if __name__ == "__main__":
+    # 打包为可执行文件后，进程池的子进程需要此调用才能正常启动
+    multiprocessing.freeze_support()
+    main()
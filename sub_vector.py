@@ -0,0 +1,241 @@
+"""
+可选的 NumPy 向量化时间轴引擎。
+
+时间字段一次性转换为 int64 数组，偏移、截断、帧率缩放与格式化均以数组运算批量完成，
+输出与 sub_core 中逐事件的标量实现逐字节一致。未安装 numpy 时 available() 返回 False，
+调用方应退回到标量实现。
+"""
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import sub_core
+from metrics import stage
+from sub_core import FORMAT_ASS, SyncMap, parse_times_scalar, scale_ratio
+
+
+def available():
+    return np is not None
+
+
+def _as_int64(values):
+    # 与 array('q') 共享内存，原地修改即作用于 EventStore 的列
+    if len(values) == 0:
+        return np.zeros(0, dtype=np.int64)
+    return np.frombuffer(values, dtype=np.int64)
+
+
+def _to_array(values):
+    result = array('q')
+    result.frombytes(values.astype(np.int64).tobytes())
+    return result
+
+
+def _parse_uniform(fields):
+    """
+    解析宽度相同的一组时间字段；分隔符位置不一致时返回 None。
+    """
+    count = len(fields)
+    width = len(fields[0])
+    matrix = np.frombuffer(''.join(fields).encode('ascii'), dtype=np.uint8).reshape(count, width)
+    is_digit = (matrix >= 48) & (matrix <= 57)
+    if not (is_digit == is_digit[0]).all():
+        return None
+
+    # 按分隔符把列划分为 时、分、秒、毫秒（可缺省）几组
+    groups = []
+    current = []
+    for column, digit in enumerate(is_digit[0]):
+        if digit:
+            current.append(column)
+        else:
+            groups.append(current)
+            current = []
+    groups.append(current)
+
+    def group_value(columns):
+        weights = 10 ** np.arange(len(columns) - 1, -1, -1, dtype=np.int64)
+        return (matrix[:, columns].astype(np.int64) - 48) @ weights
+
+    h, m, s = (group_value(columns) for columns in groups[:3])
+    result = (h * 3600 + m * 60 + s) * 1000
+    if len(groups) > 3:
+        frac_columns = groups[3]
+        result += group_value(frac_columns) * 10 ** (3 - len(frac_columns))
+    return result
+
+
+def parse_times(fields):
+    """
+    批量解析时间字段：按字段宽度分组后以字符矩阵计算（同一宽度内分隔符位置一致，绝大多数文件如此），
+    个别格式不统一的分组退回到标量解析。
+    """
+    count = len(fields)
+    if count == 0:
+        return array('q')
+    lengths = np.fromiter(map(len, fields), dtype=np.int64, count=count)
+    widths = np.unique(lengths)
+    if len(widths) == 1:
+        result = _parse_uniform(fields)
+        return parse_times_scalar(fields) if result is None else _to_array(result)
+
+    result = np.empty(count, dtype=np.int64)
+    for width in widths:
+        indices = np.flatnonzero(lengths == width)
+        group = [fields[i] for i in indices.tolist()]
+        values = _parse_uniform(group)
+        result[indices] = np.frombuffer(parse_times_scalar(group), dtype=np.int64) if values is None else values
+    return _to_array(result)
+
+
+def _digit_columns(matrix, column, values, width):
+    for i in range(width):
+        matrix[:, column + i] = (values // 10 ** (width - 1 - i)) % 10 + 48
+
+
+def format_times(values, fmt):
+    """
+    批量格式化毫秒数组，返回与 ms_to_time / ms_to_srt_time 结果一致的字符串列表。
+    """
+    values = np.asarray(values, dtype=np.int64)
+    count = len(values)
+    if count == 0:
+        return []
+
+    h, rem = np.divmod(values, 3600000)
+    m, rem = np.divmod(rem, 60000)
+    s, ms = np.divmod(rem, 1000)
+    if fmt == FORMAT_ASS:
+        min_hour_width, frac, frac_width, separator = 1, ms // 10, 2, ord('.')
+    else:
+        min_hour_width, frac, frac_width, separator = 2, ms, 3, ord(',')
+
+    hour_width = max(min_hour_width, len(str(int(h.max()))))
+    width = hour_width + 7 + frac_width
+    matrix = np.empty((count, width), dtype=np.uint8)
+    _digit_columns(matrix, 0, h, hour_width)
+    matrix[:, hour_width] = ord(':')
+    _digit_columns(matrix, hour_width + 1, m, 2)
+    matrix[:, hour_width + 3] = ord(':')
+    _digit_columns(matrix, hour_width + 4, s, 2)
+    matrix[:, hour_width + 6] = separator
+    _digit_columns(matrix, hour_width + 7, frac, frac_width)
+    text = matrix.tobytes().decode('ascii')
+
+    # 小时位数不统一时，去掉较短小时数多补的前导零
+    digits = np.full(count, min_hour_width, dtype=np.int64)
+    for power in range(min_hour_width, hour_width):
+        digits += h >= 10 ** power
+    skip = hour_width - digits
+    if not skip.any():
+        return [text[pos:pos + width] for pos in range(0, count * width, width)]
+    return [text[pos + extra:pos + width] for pos, extra in zip(range(0, count * width, width), skip.tolist())]
+
+
+def _selection_mask(store, layers=None, indices=None):
+    if layers:
+        mask = np.isin(_as_int64(store.layer), list(layers))
+    else:
+        mask = np.ones(len(store), dtype=bool)
+    if indices is not None:
+        selected = np.zeros(len(store), dtype=bool)
+        selected[np.asarray(indices, dtype=np.int64)] = True
+        mask &= selected
+    return mask
+
+
+def shift_store(store, offset_ms, layers=None, indices=None):
+    """
+    与 EventStore.shift 等价的向量化实现。
+    """
+    offset_ms = int(round(offset_ms))
+    if len(store) == 0:
+        return
+    start = _as_int64(store.start)
+    end = _as_int64(store.end)
+    mask = _selection_mask(store, layers, indices)
+    start[mask] = np.maximum(start[mask] + offset_ms, 0)
+    end[mask] = np.maximum(end[mask] + offset_ms, 0)
+    np.frombuffer(store.dirty, dtype=np.uint8)[mask] = 1
+
+
+def _map_times(times, values, ms):
+    # 与 SyncMap.map_time 相同的整数插值
+    i = np.searchsorted(times, ms, side='right') - 1
+    before = ms + (values[0] - times[0])
+    after = ms + (values[-1] - times[-1])
+    if len(times) == 1:
+        return after
+    segment = np.clip(i, 0, len(times) - 2)
+    t0, t1 = times[segment], times[segment + 1]
+    d0, d1 = values[segment], values[segment + 1]
+    inside = d0 + (2 * (ms - t0) * (d1 - d0) + (t1 - t0)) // (2 * (t1 - t0))
+    return np.where(i < 0, before, np.where(i >= len(times) - 1, after, inside))
+
+
+def sync_store(store, sync_map, layers=None, indices=None):
+    """
+    与 EventStore.apply_sync_map 等价的向量化实现，每个事件所在的分段通过 searchsorted 批量查找。
+    """
+    if len(store) == 0:
+        return
+    start = _as_int64(store.start)
+    end = _as_int64(store.end)
+    mask = _selection_mask(store, layers, indices)
+    times = np.asarray(sync_map.times, dtype=np.int64)
+    values = np.asarray(sync_map.values, dtype=np.int64)
+    if sync_map.interpolate:
+        new_start = _map_times(times, values, start[mask])
+        new_end = _map_times(times, values, end[mask])
+    else:
+        segment = np.searchsorted(times, start[mask], side='right') - 1
+        offset = np.where(segment >= 0, values[np.maximum(segment, 0)], 0)
+        new_start = start[mask] + offset
+        new_end = end[mask] + offset
+    start[mask] = np.maximum(new_start, 0)
+    end[mask] = np.maximum(new_end, 0)
+    np.frombuffer(store.dirty, dtype=np.uint8)[mask] = 1
+
+
+def retime_store(store, factor, indices=None):
+    """
+    与 EventStore.retime 等价的向量化实现，同样使用整数运算。逐帧映射交给 sync_store。
+    """
+    if isinstance(factor, SyncMap):
+        sync_store(store, factor, indices=indices)
+        return
+    if len(store) == 0:
+        return
+    unit = 10 if store.fmt == FORMAT_ASS else 1
+    num, den = scale_ratio(factor)
+    num, den = 2 * num, 2 * den * unit
+    mask = _selection_mask(store, None, indices) if indices is not None else slice(None)
+    for column in (store.start, store.end):
+        values = _as_int64(column)
+        values[mask] = (values[mask] * num + den // 2) // den * unit
+    np.frombuffer(store.dirty, dtype=np.uint8)[mask] = 1
+
+
+def store_chunks(store):
+    """
+    批量格式化所有被标记事件的时间戳后，产出与 EventStore.chunks() 相同的内容。
+    """
+    if len(store) == 0:
+        return store.chunks()
+    indices = np.flatnonzero(np.frombuffer(store.dirty, dtype=np.uint8))
+    starts = format_times(_as_int64(store.start)[indices], store.fmt)
+    ends = format_times(_as_int64(store.end)[indices], store.fmt)
+    return store.chunks(zip(starts, ends))
+
+
+def load_events(filepath, encoding='utf-8', fmt=None):
+    return sub_core.load_events(filepath, encoding, fmt, parse_times=parse_times)
+
+
+def write_events(store, filepath):
+    with stage('format'):
+        chunks = store_chunks(store)
+    return sub_core.write_events(store, filepath, chunks)
@@ -0,0 +1,16 @@
+import os
+import sys
+
+import pytest
+
+# 各模块位于仓库根目录，没有安装为包
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture
+def example():
+    """
+    返回仓库中示例字幕（example.ass 等）的路径。
+    """
+    return lambda name: os.path.join(ROOT, name)
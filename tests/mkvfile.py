@@ -0,0 +1,201 @@
+"""
+测试用的最小 Matroska 文件生成与读取，与 matroska.py 的实现无关。
+"""
+import struct
+import zlib
+
+ID_SEGMENT = 0x18538067
+ID_SEEK_HEAD = 0x114D9B74
+ID_INFO = 0x1549A966
+ID_TRACKS = 0x1654AE6B
+ID_CLUSTER = 0x1F43B675
+ID_CUES = 0x1C53BB6B
+ID_CRC32 = 0xBF
+
+
+def _size(value, width=None):
+    if width is None:
+        width = 1
+        while value >= (1 << (7 * width)) - 1:
+            width += 1
+    return (value | (1 << (7 * width))).to_bytes(width, 'big')
+
+
+def _id(element_id):
+    return element_id.to_bytes((element_id.bit_length() + 7) // 8, 'big')
+
+
+def _el(element_id, payload, width=None):
+    return _id(element_id) + _size(len(payload), width) + payload
+
+
+def _uint(element_id, value, width=None):
+    width = width or max(1, (value.bit_length() + 7) // 8)
+    return _el(element_id, value.to_bytes(width, 'big'))
+
+
+def _block(track, rel, flags, data):
+    return _size(track) + struct.pack('>hB', rel, flags) + data
+
+
+def build(path, clusters, tracks, scale=1000000, crc_clusters=(), cues_first=False, duration_width=2,
+          simple_tracks=()):
+    """
+    clusters 为 [(Timestamp, [(轨道, 时间, 数据, 持续时间或 None)])]，tracks 为 {轨道号: CodecID}。
+    有持续时间的块写为 BlockGroup（simple_tracks 中的轨道除外），字幕块与时间为整秒的块写入 Cues。
+    """
+    ebml = _el(0x1A45DFA3, _el(0x4282, b'matroska') + _uint(0x4287, 4) + _uint(0x4285, 2))
+    info = _el(ID_INFO, _uint(0x2AD7B1, scale) + _el(0x4D80, b'test'))
+    entries = b''
+    for number, codec in tracks.items():
+        private = _el(0x63A2, b'[Script Info]\nScriptType: v4.00+\n') if 'ASS' in codec else b''
+        entries += _el(0xAE, _uint(0xD7, number) + _uint(0x73C5, number) +
+                       _uint(0x83, 0x11 if codec.startswith('S_') else 1) + _el(0x86, codec.encode()) + private)
+    tracks_element = _el(ID_TRACKS, entries)
+
+    cluster_bytes = []
+    cue_entries = []
+    prev_size = None
+    for index, (timestamp, blocks) in enumerate(clusters):
+        children = [_uint(0xE7, timestamp)]
+        if prev_size is not None:
+            children.append(_uint(0xAB, prev_size))
+        crc = index in crc_clusters
+        for track, time, data, duration in blocks:
+            pos = sum(map(len, children)) + (6 if crc else 0)
+            if duration is None or track in simple_tracks:
+                children.append(_el(0xA3, _block(track, time - timestamp, 0x80, data)))
+            else:
+                children.append(_el(0xA0, _el(0xA1, _block(track, time - timestamp, 0, data)) +
+                                    _uint(0x9B, duration, duration_width)))
+            if tracks[track].startswith('S_') or time % 1000 == 0:
+                cue_entries.append((time, track, index, pos))
+        body = b''.join(children)
+        if crc:
+            body = _el(ID_CRC32, struct.pack('<I', zlib.crc32(body))) + body
+        cluster = _el(ID_CLUSTER, body)
+        prev_size = len(cluster)
+        cluster_bytes.append(cluster)
+
+    def cues(cluster_positions):
+        points = {}
+        for time, track, index, pos in cue_entries:
+            points.setdefault(time, []).append(
+                _el(0xB7, _uint(0xF7, track) + _uint(0xF1, cluster_positions[index], 8) + _uint(0xF0, pos, 4)))
+        return _el(ID_CUES, b''.join(_el(0xBB, _uint(0xB3, time, 4) + b''.join(positions))
+                                     for time, positions in sorted(points.items())))
+
+    def seek_head(positions):
+        return _el(ID_SEEK_HEAD, b''.join(_el(0x4DBB, _el(0x53AB, _id(element_id)) + _uint(0x53AC, pos, 8))
+                                          for element_id, pos in positions))
+
+    names = ['seek', 'void', 'info', 'tracks'] + (['cues'] if cues_first else []) + \
+        [index for index in range(len(cluster_bytes))] + ([] if cues_first else ['cues'])
+    parts = {'seek': seek_head([(ID_INFO, 0), (ID_TRACKS, 0), (ID_CUES, 0)]), 'void': _el(0xEC, bytes(20)),
+             'info': info, 'tracks': tracks_element, 'cues': cues([0] * len(cluster_bytes))}
+    parts.update(enumerate(cluster_bytes))
+    positions = {}
+    pos = 0
+    for name in names:
+        positions[name] = pos
+        pos += len(parts[name])
+    parts['seek'] = seek_head([(ID_INFO, positions['info']), (ID_TRACKS, positions['tracks']),
+                               (ID_CUES, positions['cues'])])
+    parts['cues'] = cues([positions[index] for index in range(len(cluster_bytes))])
+    with open(path, 'wb') as f:
+        f.write(ebml + _el(ID_SEGMENT, b''.join(parts[name] for name in names), 8))
+
+
+def _vint(data, pos):
+    length = 9 - data[pos].bit_length()
+    return int.from_bytes(data[pos:pos + length], 'big') & ((1 << (7 * length)) - 1), length
+
+
+def _children(data, start, end):
+    pos = start
+    while pos < end:
+        length = 9 - data[pos].bit_length()
+        element_id = int.from_bytes(data[pos:pos + length], 'big')
+        size, size_length = _vint(data, pos + length)
+        yield element_id, pos, pos + length + size_length, size
+        pos += length + size_length + size
+    assert pos == end, "元素超出父元素范围"
+
+
+def read(path):
+    """
+    读取文件并检查结构：CRC-32、PrevSize、SeekHead 与 Cues 指向的位置、CuePoint 的顺序。
+    返回 {'clusters': [(位置, Timestamp, [块])], 'blocks': [块], 'cues': [(时间, 轨道, Cluster 位置, 相对位置)]}，
+    块为 {'track', 'time', 'duration', 'data', 'cluster', 'relpos'}。
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    (segment,) = [child for child in _children(data, 0, len(data)) if child[0] == ID_SEGMENT]
+    start, end = segment[2], segment[2] + segment[3]
+    assert end == len(data), "Segment 大小与文件不符"
+    result = {'clusters': [], 'blocks': [], 'cues': [], 'seek': [], 'top': {}}
+    prev_size = None
+    for element_id, pos, data_pos, size in _children(data, start, end):
+        result['top'][pos - start] = element_id
+        if element_id == ID_CLUSTER:
+            children = list(_children(data, data_pos, data_pos + size))
+            timestamp = None
+            for child_id, _child_pos, child_data, child_size in children:
+                value = data[child_data:child_data + child_size]
+                if child_id == ID_CRC32:
+                    assert struct.unpack('<I', value)[0] == zlib.crc32(data[child_data + 4:data_pos + size]), "CRC-32"
+                elif child_id == 0xE7:
+                    timestamp = int.from_bytes(value, 'big')
+                elif child_id == 0xAB:
+                    assert int.from_bytes(value, 'big') == prev_size, "PrevSize"
+            blocks = []
+            for child_id, child_pos, child_data, child_size in children:
+                duration = None
+                if child_id == 0xA0:
+                    for group_id, _group_pos, group_data, group_size in _children(data, child_data,
+                                                                                   child_data + child_size):
+                        if group_id == 0xA1:
+                            block_data, block_size = group_data, group_size
+                        elif group_id == 0x9B:
+                            duration = int.from_bytes(data[group_data:group_data + group_size], 'big')
+                elif child_id == 0xA3:
+                    block_data, block_size = child_data, child_size
+                else:
+                    continue
+                track, length = _vint(data, block_data)
+                rel = struct.unpack_from('>h', data, block_data + length)[0]
+                blocks.append({'track': track, 'time': timestamp + rel, 'duration': duration,
+                               'data': data[block_data + length + 3:block_data + block_size],
+                               'cluster': pos - start, 'relpos': child_pos - data_pos})
+            result['clusters'].append((pos - start, timestamp, blocks))
+            result['blocks'].extend(blocks)
+            prev_size = data_pos + size - pos
+        elif element_id == ID_CUES:
+            for _point_id, _point_pos, point_data, point_size in _children(data, data_pos, data_pos + size):
+                time = None
+                for child_id, _child_pos, child_data, child_size in _children(data, point_data,
+                                                                               point_data + point_size):
+                    if child_id == 0xB3:
+                        time = int.from_bytes(data[child_data:child_data + child_size], 'big')
+                    elif child_id == 0xB7:
+                        fields = {field_id: int.from_bytes(data[field_data:field_data + field_size], 'big')
+                                  for field_id, _field_pos, field_data, field_size in
+                                  _children(data, child_data, child_data + child_size)}
+                        result['cues'].append((time, fields[0xF7], fields[0xF1], fields.get(0xF0)))
+        elif element_id == ID_SEEK_HEAD:
+            for _seek_id, _seek_pos, seek_data, seek_size in _children(data, data_pos, data_pos + size):
+                fields = {field_id: data[field_data:field_data + field_size]
+                          for field_id, _field_pos, field_data, field_size in
+                          _children(data, seek_data, seek_data + seek_size)}
+                result['seek'].append((int.from_bytes(fields[0x53AB], 'big'),
+                                       int.from_bytes(fields[0x53AC], 'big')))
+
+    for element_id, pos in result['seek']:
+        assert result['top'].get(pos) == element_id, "SeekHead 位置错误"
+    by_position = {(block['cluster'], block['relpos']): block for block in result['blocks']}
+    for time, track, cluster, relpos in result['cues']:
+        block = by_position.get((cluster, relpos))
+        assert block is not None and block['track'] == track and block['time'] == time, "Cues 位置错误"
+    times = [cue[0] for cue in result['cues']]
+    assert times == sorted(times), "CuePoint 未按时间排列"
+    return result
@@ -0,0 +1,138 @@
+import io
+import struct
+import zipfile
+
+import pytest
+
+import archive
+from archive import rewrite_archive
+
+SUBTITLE = '[Script Info]\nTitle: test\n\n[Events]\nDialogue: 0,0:00:01.00,0:00:02.00,Default,,0,0,0,,{}\n'
+
+
+class Unseekable(io.RawIOBase):
+    """
+    只能顺序写入的流：zipfile 会为每个成员写出数据描述符。
+    """
+
+    def __init__(self):
+        self.buffer = io.BytesIO()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        return self.buffer.write(data)
+
+
+def members():
+    return [
+        ('sub/', None, zipfile.ZIP_STORED),
+        ('sub/changed.ass', SUBTITLE.format('changed').encode(), zipfile.ZIP_DEFLATED),
+        ('sub/same.ass', SUBTITLE.format('same').encode(), zipfile.ZIP_DEFLATED),
+        ('video.bin', bytes(range(256)) * 64, zipfile.ZIP_STORED),
+        ('notes.txt', 'notes\n'.encode() * 100, zipfile.ZIP_BZIP2),
+    ]
+
+
+def make_archive(path, layout):
+    if layout == 'descriptor':
+        stream = Unseekable()
+        with zipfile.ZipFile(stream, 'w') as zf:
+            for name, data, method in members():
+                if data is None:
+                    zf.writestr(name, b'')
+                else:
+                    zf.writestr(zipfile.ZipInfo(name, (2020, 1, 1, 0, 0, 0)), data, compress_type=method)
+        path.write_bytes(stream.buffer.getvalue())
+        return
+    with zipfile.ZipFile(path, 'w') as zf:
+        for name, data, method in members():
+            if data is None:
+                zf.mkdir(name)
+            elif layout == 'zip64':
+                info = zipfile.ZipInfo(name, (2020, 1, 1, 0, 0, 0))
+                info.compress_type = method
+                with zf.open(info, 'w', force_zip64=True) as f:
+                    f.write(data)
+            else:
+                zf.writestr(zipfile.ZipInfo(name, (2020, 1, 1, 0, 0, 0)), data, compress_type=method)
+        zf.comment = b'archive comment'
+
+
+def transform(data, name):
+    return data.replace(b'changed', b'CHANGED')
+
+
+def raw_data(path, info):
+    with open(path, 'rb') as f:
+        f.seek(info.header_offset)
+        header = f.read(30)
+        name_length, extra_length = struct.unpack('<HH', header[26:])
+        extra = f.read(name_length + extra_length)[name_length:]
+        return struct.unpack('<H', header[6:8])[0], extra, f.read(info.compress_size)
+
+
+def extra_ids(extra):
+    ids = []
+    pos = 0
+    while pos + 4 <= len(extra):
+        field_id, size = struct.unpack_from('<HH', extra, pos)
+        ids.append(field_id)
+        pos += 4 + size
+    return ids
+
+
+def check_output(source, output, raw=True):
+    with zipfile.ZipFile(source) as zin, zipfile.ZipFile(output) as zout:
+        assert zout.testzip() is None
+        assert zout.namelist() == zin.namelist()
+        assert zout.comment == zin.comment
+        for info in zin.infolist():
+            copied = zout.getinfo(info.filename)
+            data = zin.read(info)
+            expected = transform(data, info.filename) if info.filename.endswith('.ass') else data
+            assert zout.read(copied) == expected
+            assert copied.compress_type == info.compress_type
+            assert copied.date_time == info.date_time
+            flags, extra, compressed = raw_data(output, copied)
+            assert not flags & 0x08
+            assert extra_ids(extra).count(0x0001) <= 1
+            if raw and expected == data:
+                assert compressed == raw_data(source, info)[2]
+
+
+@pytest.mark.parametrize('layout', ['plain', 'zip64', 'descriptor'])
+def test_copies_unchanged_members_raw(tmp_path, layout):
+    source = tmp_path / 'in.zip'
+    make_archive(source, layout)
+    output = tmp_path / 'out.zip'
+    assert rewrite_archive(str(source), str(output), transform)
+    check_output(source, output)
+
+
+@pytest.mark.parametrize('layout', ['plain', 'zip64', 'descriptor'])
+def test_falls_back_without_zipfile_internals(tmp_path, monkeypatch, layout):
+    monkeypatch.setattr(archive, '_RAW_COPY_ATTRIBUTES', archive._RAW_COPY_ATTRIBUTES + ('_missing',))
+    source = tmp_path / 'in.zip'
+    make_archive(source, layout)
+    output = tmp_path / 'out.zip'
+    assert rewrite_archive(str(source), str(output), transform)
+    check_output(source, output, raw=False)
+
+
+def test_unchanged_archive_is_not_rewritten(tmp_path):
+    source = tmp_path / 'in.zip'
+    make_archive(source, 'plain')
+    original = source.read_bytes()
+    assert not rewrite_archive(str(source), str(source), lambda data, name: data)
+    assert source.read_bytes() == original
+
+
+def test_rename_members(tmp_path):
+    source = tmp_path / 'in.zip'
+    make_archive(source, 'plain')
+    output = tmp_path / 'out.zip'
+    assert rewrite_archive(str(source), str(output), transform, rename=lambda name: name + '.bak')
+    with zipfile.ZipFile(output) as zout:
+        assert 'sub/same.ass.bak' in zout.namelist() and 'video.bin' in zout.namelist()
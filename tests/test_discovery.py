@@ -0,0 +1,66 @@
+import os
+import shutil
+from fractions import Fraction
+
+import sub_converter
+import sub_pipeline
+import timecode_converter
+from discovery import expand_inputs, output_directory
+from sub_core import DEFAULT_ASS_TEMPLATE, AssConverter
+
+
+def test_output_directory(tmp_path):
+    root = tmp_path / 'in'
+    assert output_directory(str(root / 'a' / 'b' / 'x.ass'), 'out', [str(root)]) == os.path.join('out', 'a', 'b')
+    assert output_directory(str(root / 'x.ass'), 'out', [str(root)]) == 'out'
+    assert output_directory(str(tmp_path / 'x.ass'), 'out', [str(root)]) == 'out'
+    assert output_directory(str(tmp_path / 'inbox' / 'x.ass'), 'out', [str(root)]) == 'out'
+    assert output_directory(str(root / 'a' / 'x.ass'), None, [str(root)]) is None
+
+
+def same_names(tmp_path, example, name, target):
+    """
+    在 in/a 与 in/b 中放入同名字幕，返回输入目录与输出目录。
+    """
+    for sub in ('a', 'b'):
+        os.makedirs(tmp_path / 'in' / sub)
+        shutil.copy(example(name), tmp_path / 'in' / sub / target)
+    (tmp_path / 'in' / 'b' / target).write_bytes((tmp_path / 'in' / 'b' / target).read_bytes() + b'\n')
+    return str(tmp_path / 'in'), str(tmp_path / 'out')
+
+
+def test_pipeline_keeps_subdirectories(tmp_path, example):
+    root, out = same_names(tmp_path, example, 'example.ass', 'x.ass')
+    pipeline = sub_pipeline.Pipeline([sub_pipeline.ShiftStage(1000)], output_dir=out, roots=[root])
+    total, success, failures, _skipped = sub_pipeline.run_pipeline(expand_inputs([root], recursive=True), pipeline, 1)
+    assert (total, success, failures) == (2, 2, [])
+    for sub in ('a', 'b'):
+        assert os.path.isfile(os.path.join(out, sub, 'x.ass'))
+    assert not os.path.exists(os.path.join(out, 'x.ass'))
+
+
+def test_sub_converter_keeps_subdirectories(tmp_path, example):
+    root, out = same_names(tmp_path, example, 'example.srt', 'x.srt')
+    result = sub_converter.convert_files(expand_inputs([root], recursive=True), AssConverter(DEFAULT_ASS_TEMPLATE), 1,
+                                         out, roots=[root])
+    assert result[:3] == (2, 2, [])
+    for sub in ('a', 'b'):
+        assert os.path.isfile(os.path.join(out, sub, 'x.converted.ass'))
+
+
+def test_timecode_converter_keeps_subdirectories(tmp_path, example):
+    root, out = same_names(tmp_path, example, 'example.srt', 'x.srt')
+    result = timecode_converter.convert_files(expand_inputs([root], recursive=True), Fraction(25), Fraction(24), 1,
+                                              out, roots=[root])
+    assert result[:3] == (2, 2, [])
+    for sub in ('a', 'b'):
+        assert os.path.isfile(os.path.join(out, sub, 'x.srt.24.0-converted.srt'))
+
+
+def test_expand_inputs_skips_outputs(tmp_path, example):
+    for name in ('x.srt', 'x.srt.25.0-converted.srt', 'x.converted.ass'):
+        shutil.copy(example('example.srt'), tmp_path / name)
+    assert list(expand_inputs([str(tmp_path)])) == [str(tmp_path / 'x.srt')]
+    # 明确指定的文件照常处理
+    explicit = str(tmp_path / 'x.converted.ass')
+    assert list(expand_inputs([explicit])) == [explicit]
@@ -0,0 +1,55 @@
+import pickle
+import re
+
+import pytest
+
+from event_filter import compile_filter
+
+
+def matches(event_filter, layer, style='', actor='', effect='', text=''):
+    fields = (style, actor, effect, text)
+    return ((event_filter.layer_test is None or event_filter.layer_test(layer))
+            and (event_filter.test is None or event_filter.test(layer, fields)))
+
+
+@pytest.mark.parametrize('expression, message', [
+    ('', "为空"),
+    ('   ', "为空"),
+    ('style', "'表达式结尾' 处语法错误"),
+    ('style=', "'表达式结尾' 处语法错误"),
+    ('style=a and', "'表达式结尾' 处语法错误"),
+    ('not', "'表达式结尾' 处语法错误"),
+    ('(style=a', "'表达式结尾' 处语法错误"),
+    ('style=a)', "')' 处语法错误"),
+    ('style=a or or style=b', "'or' 处语法错误"),
+    ('style="a', "第 7 个字符处无法解析"),
+    ('foo=1', "未知的字段: foo"),
+    ('layer=a', "无效的层号: a"),
+    ('text~"("', "正则表达式 '(' 无效"),
+])
+def test_grammar_errors(expression, message):
+    with pytest.raises(ValueError, match=re.escape(message)):
+        compile_filter(expression)
+
+
+@pytest.mark.parametrize('expression, event, expected', [
+    ('layer=0-2,5', {'layer': 2}, True),
+    ('layer=0-2,5', {'layer': 3}, False),
+    ('layer=0-2,5', {'layer': 5}, True),
+    ('style="Sign","Title"', {'layer': 0, 'style': 'Title'}, True),
+    ('style="Sign","Title"', {'layer': 0, 'style': 'Default'}, False),
+    ('name!=旁白', {'layer': 0, 'actor': '旁白'}, False),
+    ('text~^♪', {'layer': 0, 'text': '♪ la'}, True),
+    (r'text!~"\{\\an8\}"', {'layer': 0, 'text': r'{\an8}上'}, False),
+    ('style=Sign or (layer=1 and not text~^♪)', {'layer': 1, 'text': 'a'}, True),
+    ('style=Sign or (layer=1 and not text~^♪)', {'layer': 1, 'text': '♪'}, False),
+    ('style=Sign and layer=1', {'layer': 0, 'style': 'Sign'}, False),
+])
+def test_matches(expression, event, expected):
+    assert matches(compile_filter(expression), **event) is expected
+
+
+def test_pickle_recompiles():
+    event_filter = pickle.loads(pickle.dumps(compile_filter('style=Sign and layer=1')))
+    assert matches(event_filter, 1, style='Sign')
+    assert not matches(event_filter, 0, style='Sign')
@@ -0,0 +1,11 @@
+import pytest
+
+from benchmark import CLI_MODULES, IMPORT_BUDGET_MS, measure_import
+
+
+@pytest.mark.parametrize('module', CLI_MODULES)
+def test_cli_import_budget(module):
+    # 命令行工具启动时不加载 GUI 等模块，导入耗时（取 3 次中最快的一次）不超过上限
+    best, forbidden = measure_import(module, 3)
+    assert not forbidden, f"{module} 导入时加载了 {', '.join(forbidden)}"
+    assert best <= IMPORT_BUDGET_MS, f"{module} 导入耗时 {best:.1f} ms，超过上限 {IMPORT_BUDGET_MS} ms"
@@ -0,0 +1,235 @@
+import os
+import random
+
+import pytest
+
+import mkvfile
+from matroska import shift_matroska
+from sub_core import SyncMap
+
+VIDEO, AUDIO, ASS, SRT = 1, 2, 3, 4
+TRACKS = {VIDEO: 'V_MPEG4/ISO/AVC', AUDIO: 'A_AAC', ASS: 'S_TEXT/ASS', SRT: 'S_TEXT/UTF8'}
+SUBTITLE_TRACKS = (ASS, SRT)
+
+
+def make_file(path, count=8, span=5000, gap_until=None, duration=1200, **kwargs):
+    """
+    每个 Cluster 覆盖 span 毫秒：每 40 ms 一个视频块、每 120 ms 一个音频块，两条字幕轨道各有若干带持续时间的块。
+    gap_until 不为 None 时其后追加只含字幕、相隔 40 秒的 Cluster。
+    """
+    rng = random.Random(count * span)
+    clusters = []
+    line = 0
+    for index in range(count):
+        timestamp = index * span
+        blocks = []
+        for time in range(timestamp, timestamp + span, 40):
+            blocks.append((VIDEO, time, rng.randbytes(rng.randint(10, 300)), None))
+            if time % 120 == 0:
+                blocks.append((AUDIO, time, rng.randbytes(50), None))
+            if time % 1500 == 20:
+                line += 1
+                blocks.append((ASS, time, f'{line},{line % 3},Style{line % 2},,0,0,0,,Line {line}'.encode(),
+                               duration + line % 50))
+            if time % 2000 == 60:
+                blocks.append((SRT, time, f'srt {time}'.encode(), duration))
+        clusters.append((timestamp, blocks))
+    if gap_until is not None:
+        for timestamp in range(count * span, gap_until, 40000):
+            clusters.append((timestamp, [(ASS, timestamp, f'0,0,Style0,,0,0,0,,late {timestamp}'.encode(), 1000)]))
+    mkvfile.build(str(path), clusters, TRACKS, **kwargs)
+
+
+def events(info):
+    return sorted((block['data'], block['track'], block['time'], block['duration']) for block in info['blocks'])
+
+
+def expected(info, shift, selected=lambda block: True):
+    result = []
+    for block in info['blocks']:
+        time, duration = block['time'], block['duration']
+        if block['track'] in SUBTITLE_TRACKS and selected(block):
+            time, duration = shift(time, duration)
+        result.append((block['data'], block['track'], time, duration))
+    return sorted(result)
+
+
+def check_layout(info):
+    # 每个 Cluster 中的块按时间排列，字幕块位于所在 Cluster 的范围内，且没有空的 Cluster
+    clusters = info['clusters']
+    for index, (_position, timestamp, blocks) in enumerate(clusters):
+        assert blocks
+        times = [block['time'] for block in blocks]
+        assert times == sorted(times)
+        following = clusters[index + 1][1] if index + 1 < len(clusters) else None
+        for block in blocks:
+            if block['track'] in SUBTITLE_TRACKS:
+                assert timestamp <= block['time'] and (following is None or block['time'] < following)
+
+
+def shifted(path, *args, **kwargs):
+    inode = os.stat(path).st_ino
+    assert shift_matroska(str(path), *args, **kwargs)
+    return os.stat(path).st_ino == inode
+
+
+def test_zero_offset_leaves_file_untouched(tmp_path):
+    path = tmp_path / 'a.mks'
+    make_file(path)
+    original = path.read_bytes()
+    assert not shift_matroska(str(path), 0)
+    assert path.read_bytes() == original
+
+
+def test_small_shift_is_patched_in_place(tmp_path):
+    path = tmp_path / 'a.mks'
+    make_file(path, crc_clusters=(2,))
+    original = path.read_bytes()
+    before = mkvfile.read(path)
+    assert shifted(path, 400)
+    after = mkvfile.read(path)
+    assert events(after) == expected(before, lambda time, duration: (time + 400, duration))
+    assert len(path.read_bytes()) == len(original)
+    assert shifted(path, -400)
+    assert path.read_bytes() == original
+
+
+@pytest.mark.parametrize('options', [{}, {'crc_clusters': (1, 2)}, {'cues_first': True}])
+def test_blocks_move_between_clusters(tmp_path, options):
+    path = tmp_path / 'a.mks'
+    make_file(path, **options)
+    original = path.read_bytes()
+    before = mkvfile.read(path)
+    assert not shifted(path, 1000)
+    after = mkvfile.read(path)
+    assert events(after) == expected(before, lambda time, duration: (time + 1000, duration))
+    check_layout(after)
+    assert not shifted(path, -1000)
+    assert path.read_bytes() == original
+
+
+def four_clusters(path, **options):
+    clusters = []
+    for timestamp in (0, 30000, 60000, 90000):
+        blocks = [(VIDEO, time, b'video %d' % time, None) for time in range(timestamp, timestamp + 30000, 10000)]
+        blocks.insert(1, (ASS, timestamp + 100, b'0,0,Default,,0,0,0,,at %d' % (timestamp + 100), 2000))
+        clusters.append((timestamp, blocks))
+    mkvfile.build(str(path), clusters, {VIDEO: 'V_X', ASS: 'S_TEXT/ASS'}, **options)
+
+
+@pytest.mark.parametrize('options', [{}, {'crc_clusters': (1,)}, {'cues_first': True}])
+def test_reverse_shift_restores_layout(tmp_path, options):
+    path = tmp_path / 'a.mks'
+    four_clusters(path, **options)
+    original = path.read_bytes()
+    shift_matroska(str(path), 45000)
+    check_layout(mkvfile.read(path))
+    shift_matroska(str(path), -45000)
+    assert path.read_bytes() == original
+
+    shift_matroska(str(path), 45000)
+    shift_matroska(str(path), -46000)
+    after = mkvfile.read(path)
+    check_layout(after)
+    assert len(after['clusters']) == 4
+    assert sorted(block['time'] for block in after['blocks'] if block['track'] == ASS) == [0, 29100, 59100, 89100]
+
+
+def test_new_clusters_for_sparse_subtitles(tmp_path):
+    path = tmp_path / 'a.mks'
+    make_file(path, gap_until=300000)
+    original = path.read_bytes()
+    before = mkvfile.read(path)
+    shift_matroska(str(path), 50000)
+    after = mkvfile.read(path)
+    assert events(after) == expected(before, lambda time, duration: (time + 50000, duration))
+    check_layout(after)
+    assert len(after['clusters']) > len(before['clusters'])
+    shift_matroska(str(path), -50000)
+    assert path.read_bytes() == original
+
+
+def test_negative_shift_is_clamped(tmp_path):
+    path = tmp_path / 'a.mks'
+    make_file(path, cues_first=True)
+    before = mkvfile.read(path)
+    shift_matroska(str(path), -3000)
+
+    def clamp(time, duration):
+        start = max(0, time - 3000)
+        return start, max(0, time + duration - 3000) - start
+
+    after = mkvfile.read(path)
+    assert events(after) == expected(before, clamp)
+    check_layout(after)
+
+
+def test_wider_block_duration_rebuilds_block_group(tmp_path):
+    path = tmp_path / 'a.mks'
+    make_file(path, duration=200, duration_width=1)
+    before = mkvfile.read(path)
+    sync_map = SyncMap.parse('0:00:00 -> 0:00:00\n0:00:40 -> 0:01:20\n')
+    shift_matroska(str(path), 0, sync_map=sync_map)
+
+    def stretch(time, duration):
+        start = sync_map.map_time(time)
+        return start, sync_map.map_time(time + duration) - start
+
+    after = mkvfile.read(path)
+    assert events(after) == expected(before, stretch)
+    check_layout(after)
+
+
+def test_simple_blocks_and_layers(tmp_path):
+    path = tmp_path / 'a.mkv'
+    make_file(path, simple_tracks=(SRT,))
+    before = mkvfile.read(path)
+    shift_matroska(str(path), 300, layers=[1])
+
+    def layer_one(block):
+        return block['track'] == ASS and block['data'].split(b',')[1] == b'1'
+
+    assert events(mkvfile.read(path)) == expected(before, lambda time, duration: (time + 300, duration), layer_one)
+
+
+def test_scaled_timestamps(tmp_path):
+    path = tmp_path / 'a.mks'
+    # TimestampScale 为 0.1 ms
+    make_file(path, scale=100000)
+    before = mkvfile.read(path)
+    assert shifted(path, 40)
+    assert events(mkvfile.read(path)) == expected(before, lambda time, duration: (time + 400, duration))
+
+
+def test_file_without_subtitle_tracks(tmp_path):
+    path = tmp_path / 'a.mkv'
+    mkvfile.build(str(path), [(0, [(VIDEO, 0, b'x', None)])], {VIDEO: 'V_X'})
+    with pytest.raises(ValueError):
+        shift_matroska(str(path), 1000)
+
+
+def test_truncated_file(tmp_path):
+    path = tmp_path / 'a.mks'
+    make_file(path, count=2)
+    path.write_bytes(path.read_bytes()[:-100])
+    with pytest.raises(ValueError):
+        shift_matroska(str(path), 1000)
+
+
+@pytest.mark.parametrize('offset', [300, 7000])
+def test_cues_follow_block_with_same_start(tmp_path, offset):
+    # 同一轨道中两个开始时间相同的块只调整其中一个，两者的 CuePoint 都要指向各自的块
+    path = tmp_path / 'a.mks'
+    clusters = []
+    for timestamp in (0, 5000, 10000):
+        blocks = [(VIDEO, time, bytes(20), None) for time in range(timestamp, timestamp + 5000, 40)]
+        if timestamp == 0:
+            blocks += [(ASS, 1000, b'1,0,Default,,0,0,0,,stay', 500), (ASS, 1000, b'2,1,Default,,0,0,0,,move', 500)]
+            blocks.sort(key=lambda block: block[1])
+        clusters.append((timestamp, blocks))
+    mkvfile.build(str(path), clusters, TRACKS)
+    shift_matroska(str(path), offset, layers=[1])
+    info = mkvfile.read(str(path))
+    times = {block['data']: block['time'] for block in info['blocks'] if block['track'] == ASS}
+    assert times == {b'1,0,Default,,0,0,0,,stay': 1000, b'2,1,Default,,0,0,0,,move': 1000 + offset}
+    assert sorted(cue[0] for cue in info['cues'] if cue[1] == ASS) == sorted(times.values())
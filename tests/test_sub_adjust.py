@@ -0,0 +1,90 @@
+import shutil
+
+import pytest
+
+import sub_adjust
+from event_filter import compile_filter
+from sub_core import SyncMap
+
+EXAMPLES = {'.ass': 'example.ass', '.ssa': 'example.ssa', '.srt': 'example.srt'}
+
+
+@pytest.mark.parametrize('name', ['A.ASS', 'b.Ssa', 'C.SRT'])
+def test_extension_is_case_insensitive(tmp_path, example, name):
+    path = tmp_path / name
+    shutil.copy(example(EXAMPLES[path.suffix.lower()]), path)
+    original = path.read_bytes()
+    success, reason = sub_adjust.process_subtitle_file(str(path), 1000, [])
+    assert success, reason
+    assert path.read_bytes() != original
+
+
+def test_unsupported_extension(tmp_path):
+    path = tmp_path / 'a.txt'
+    path.write_text('x')
+    assert sub_adjust.process_subtitle_file(str(path), 1000, []) == (False, "不支持的字幕格式")
+
+
+def crlf_copy(example, tmp_path, name, target):
+    path = tmp_path / target
+    data = open(example(name), 'rb').read().replace(b'\r\n', b'\n').replace(b'\n', b'\r\n')
+    path.write_bytes(data)
+    return path
+
+
+@pytest.mark.parametrize('name', ['example.ass', 'example.srt'])
+@pytest.mark.parametrize('options', [
+    {'engine': sub_adjust.ENGINE_NUMPY},
+    {'window': (0, None)},
+    {'event_filter': compile_filter('layer=0-99999')},
+    {'sync_map': SyncMap.parse('0:00:00 +1\n')},
+])
+def test_crlf_matches_stream_engine(tmp_path, example, name, options):
+    # 需要整体解析的路径与流式引擎一样保留 CRLF 换行符，输出逐字节相同
+    expected = crlf_copy(example, tmp_path, name, 'stream' + name[-4:])
+    assert sub_adjust.process_subtitle_file(str(expected), 1000, [])[0]
+    path = crlf_copy(example, tmp_path, name, 'other' + name[-4:])
+    assert sub_adjust.process_subtitle_file(str(path), 1000, [], **options)[0]
+    assert path.read_bytes() == expected.read_bytes()
+
+
+@pytest.mark.parametrize('name', ['example.ass', 'example.ssa', 'example.srt'])
+@pytest.mark.parametrize('shift_ms', [
+    1234,
+    -1005,
+    # 部分事件跨越 10 小时，时间戳变宽
+    9 * 3600 * 1000,
+    # 开头的事件被截断到 0
+    -60 * 1000,
+    # 全部事件被截断到 0
+    -3 * 3600 * 1000,
+])
+@pytest.mark.parametrize('layers', [[], [1]])
+def test_engines_match(tmp_path, example, name, shift_ms, layers):
+    pytest.importorskip('numpy')
+    outputs = {}
+    for engine in sub_adjust.ENGINES:
+        path = tmp_path / f'{engine}{name[-4:]}'
+        shutil.copy(example(name), path)
+        success, reason = sub_adjust.process_subtitle_file(str(path), shift_ms, layers, engine=engine)
+        assert success, reason
+        outputs[engine] = path.read_bytes()
+    assert outputs[sub_adjust.ENGINE_NUMPY] == outputs[sub_adjust.ENGINE_STREAM]
+    assert outputs[sub_adjust.ENGINE_MMAP] == outputs[sub_adjust.ENGINE_STREAM]
+    if not layers:
+        # example.ssa 中没有 Layer 1 的事件，只在调整全部事件时要求内容变化
+        assert outputs[sub_adjust.ENGINE_STREAM] != open(example(name), 'rb').read()
+
+
+@pytest.mark.parametrize('options', [
+    {},
+    {'window': (0, None)},
+    {'event_filter': compile_filter('layer=0-99999')},
+    {'sync_map': SyncMap.parse('0:00:00 +1\n')},
+])
+def test_shift_data_keeps_input_type(example, options):
+    data = open(example('example.ass'), 'rb').read()
+    shifted = sub_adjust.shift_data(data, 1000, [], **options)
+    assert isinstance(shifted, bytes) and shifted != data
+    text = data.decode('utf-8')
+    assert sub_adjust.shift_data(text, 1000, [], **options) == shifted.decode('utf-8')
@@ -0,0 +1,158 @@
+import os
+import stat
+import sys
+from fractions import Fraction
+
+import pytest
+
+from sub_core import SyncMap, Timecodes, atomic_open, frame_mapping, parse_framerate
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason="Windows 没有 POSIX 权限位")
+def test_new_file_follows_umask(tmp_path):
+    path = tmp_path / 'new.ass'
+    old = os.umask(0o022)
+    try:
+        with atomic_open(str(path)) as f:
+            f.write('x')
+    finally:
+        os.umask(old)
+    assert stat.S_IMODE(path.stat().st_mode) == 0o644
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason="Windows 没有 POSIX 权限位")
+def test_existing_file_keeps_mode(tmp_path):
+    path = tmp_path / 'a.ass'
+    path.write_text('old')
+    path.chmod(0o640)
+    with atomic_open(str(path)) as f:
+        f.write('new')
+    assert path.read_text() == 'new'
+    assert stat.S_IMODE(path.stat().st_mode) == 0o640
+
+
+@pytest.mark.skipif(not hasattr(os, 'symlink') or sys.platform == 'win32', reason="需要符号链接")
+def test_symlink_target_is_replaced(tmp_path):
+    (tmp_path / 'real').mkdir()
+    real = tmp_path / 'real' / 'real.srt'
+    real.write_text('old')
+    link = tmp_path / 'link.srt'
+    link.symlink_to(real)
+    with atomic_open(str(link)) as f:
+        f.write('new')
+    assert link.is_symlink()
+    assert real.read_text() == 'new'
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.tmp')]
+
+
+def test_failed_write_keeps_original(tmp_path):
+    path = tmp_path / 'a.ass'
+    path.write_text('old')
+    with pytest.raises(RuntimeError):
+        with atomic_open(str(path)) as f:
+            f.write('new')
+            raise RuntimeError
+    assert path.read_text() == 'old'
+    assert os.listdir(tmp_path) == ['a.ass']
+
+
+SEGMENTS = SyncMap.parse("""
+# 一分钟起延后 2 秒，两分钟起提前 1.5 秒
+0:02:00 -1.5
+0:01:00 +2
+""")
+
+
+@pytest.mark.parametrize('ms, offset', [
+    (0, 0),
+    (59999, 0),
+    (60000, 2000),
+    (119999, 2000),
+    (120000, -1500),
+    (10 ** 9, -1500),
+])
+def test_sync_map_segments(ms, offset):
+    assert not SEGMENTS.interpolate
+    assert SEGMENTS.offset_at(ms) == offset
+
+
+ANCHORS = SyncMap.parse("0:00:10 -> 0:00:12\n0:00:20 -> 0:00:21\n")
+
+
+@pytest.mark.parametrize('ms, mapped', [
+    # 锚点范围之外沿用最近锚点的偏移量
+    (0, 2000),
+    (10000, 12000),
+    (10001, 12001),
+    (15000, 16500),
+    # 插值结果四舍五入到毫秒
+    (15001, 16501),
+    (15003, 16503),
+    (20000, 21000),
+    (30000, 31000),
+])
+def test_sync_map_interpolation(ms, mapped):
+    assert ANCHORS.interpolate
+    assert ANCHORS.map_time(ms) == mapped
+
+
+@pytest.mark.parametrize('text, message', [
+    ("", "同步映射为空"),
+    ("# 只有注释\n", "同步映射为空"),
+    ("0:01:00\n", "第 1 行格式错误"),
+    ("0:01:00 +1\n0:02:00 -> 0:02:01\n", "第 2 行: 分段偏移与锚点不能混用"),
+    ("0:01:00 +1\n0:01:00 +2\n", "重复的时间点"),
+    ("0:01:00 -> 0:01:05\n0:02:00 -> 0:01:00\n", "目标时间必须随原时间递增"),
+])
+def test_sync_map_errors(text, message):
+    with pytest.raises(ValueError, match=message):
+        SyncMap.parse(text)
+
+
+@pytest.mark.parametrize('value, rate', [
+    ('23.976', Fraction(24000, 1001)),
+    ('23.98', Fraction(24000, 1001)),
+    ('24000/1001', Fraction(24000, 1001)),
+    ('29.97', Fraction(30000, 1001)),
+    ('47.952', Fraction(48000, 1001)),
+    ('59.94', Fraction(60000, 1001)),
+    ('119.88', Fraction(120000, 1001)),
+    # 整数帧率与非 NTSC 的小数保持原值
+    ('25', Fraction(25)),
+    ('30', Fraction(30)),
+    ('12.5', Fraction(25, 2)),
+])
+def test_parse_framerate_ntsc(value, rate):
+    assert parse_framerate(value) == rate
+
+
+@pytest.mark.parametrize('value', ['', 'abc', '0', '-25', '1/0'])
+def test_parse_framerate_invalid(value):
+    with pytest.raises(ValueError):
+        parse_framerate(value)
+
+
+def test_timecodes_constant_ntsc():
+    # 24000/1001 的第 n 帧为 n * 1001 / 24 毫秒，四舍五入
+    assert Timecodes.constant(parse_framerate('23.976'), 5).times == [0, 42, 83, 125, 167]
+    assert Timecodes.constant(Fraction(25), 3).times == [0, 40, 80]
+
+
+def test_timecodes_parse():
+    timecodes = Timecodes.parse("# timecode format v2\n0\n41.708\n# 注释\n\n83.417\n")
+    assert timecodes.times == [0, 42, 83]
+    assert timecodes.frame_at(-1) == -1
+    assert timecodes.frame_at(41) == 0
+    assert timecodes.frame_at(42) == 1
+    with pytest.raises(ValueError, match="timecodes v2"):
+        Timecodes.parse("# timecode format v1\n")
+    with pytest.raises(ValueError, match="严格递增"):
+        Timecodes.parse("# timecode format v2\n0\n40\n40\n")
+
+
+def test_frame_mapping_ntsc():
+    # 两端都是固定帧率时为缩放比例，NTSC 帧率按精确分数计算
+    assert frame_mapping(parse_framerate('23.976'), Fraction(24)) == Fraction(1000, 1001)
+    source = Timecodes.constant(parse_framerate('23.976'), 4)
+    sync_map = frame_mapping(source, Fraction(24))
+    assert [sync_map.map_time(ms) for ms in source.times] == [0, 42, 83, 125]
@@ -0,0 +1,104 @@
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+import sub_client
+from sub_server import remove_stale_socket, run_job
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, 'AF_UNIX'), reason="需要 Unix 套接字")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_refuses_to_remove_regular_file(tmp_path):
+    path = tmp_path / 'important.txt'
+    path.write_text('keep me')
+    with pytest.raises(ValueError):
+        remove_stale_socket(str(path))
+    assert path.read_text() == 'keep me'
+
+
+def test_removes_stale_socket(tmp_path):
+    path = str(tmp_path / 'server.sock')
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.bind(path)
+    remove_stale_socket(path)
+    assert not os.path.exists(path)
+    remove_stale_socket(path)
+
+
+@pytest.fixture
+def server(tmp_path):
+    path = str(tmp_path / 'server.sock')
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT, 'sub_server.py'), '--socket', path, '--jobs', '1'],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    deadline = time.monotonic() + 30
+    while True:
+        try:
+            sub_client.connect(socket_path=path).close()
+            break
+        except OSError:
+            if process.poll() is not None or time.monotonic() > deadline:
+                process.kill()
+                pytest.fail(f"sub_server 未能启动: {process.communicate()[1].decode('utf-8', 'replace')}")
+            time.sleep(0.05)
+    yield path
+    process.send_signal(signal.SIGINT)
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def test_round_trip(server, tmp_path, example):
+    subtitle = tmp_path / 'a.ass'
+    shutil.copy(example('example.ass'), subtitle)
+    original = subtitle.read_bytes()
+    jobs = [
+        {'id': 1, 'op': 'shift', 'path': str(subtitle), 'offset': 1, 'layers': None, 'engine': None, 'filter': None},
+        {'id': 2, 'op': 'shift', 'path': str(subtitle), 'offset': -1, 'layers': 'all', 'engine': 'numpy'},
+        {'id': 3, 'op': 'unknown', 'path': str(subtitle)},
+        {'id': 4, 'op': 'shift', 'path': str(tmp_path / 'missing.ass'), 'offset': 1},
+    ]
+    results = {}
+    for job in jobs:
+        # 逐个连接提交，保证两个 shift 任务按顺序执行
+        with sub_client.connect(socket_path=server) as sock:
+            (result,) = sub_client.submit([job], sock)
+        results[result['id']] = result
+    assert results[1]['ok'] and not results[1]['skipped'] and results[1]['output'] == str(subtitle)
+    assert results[2]['ok']
+    assert subtitle.read_bytes() == original
+    assert not results[3]['ok'] and 'unknown' in results[3]['error']
+    assert not results[4]['ok'] and results[4]['output'] is None
+
+
+def test_invalid_job_line(server):
+    with sub_client.connect(socket_path=server) as sock:
+        sock.sendall(b'not json\n[1, 2]\n')
+        sock.shutdown(socket.SHUT_WR)
+        with sock.makefile('rb') as lines:
+            results = [line for line in lines]
+    assert len(results) == 2
+    assert all(b'"ok": false' in line for line in results)
+
+
+def test_convert_reports_output(tmp_path, example):
+    subtitle = tmp_path / 'a.srt'
+    shutil.copy(example('example.srt'), subtitle)
+    result = run_job({'id': 1, 'op': 'convert', 'path': str(subtitle), 'output_dir': str(tmp_path / 'out')})
+    assert result['ok'] and result['output'] == str(tmp_path / 'out' / 'a.converted.ass')
+    assert os.path.isfile(result['output'])
+    # ASS/SSA 无需转换，直接拒绝，不会改写原文件
+    subtitle = tmp_path / 'a.ass'
+    shutil.copy(example('example.ass'), subtitle)
+    original = subtitle.read_bytes()
+    result = run_job({'id': 2, 'op': 'convert', 'path': str(subtitle)})
+    assert not result['ok'] and 'SRT' in result['error'] and result['output'] is None
+    assert subtitle.read_bytes() == original
@@ -1,162 +1,240 @@
 import os
-import re
-import threading
-import tkinter as tk
-from tkinter import filedialog, messagebox, scrolledtext
-from tkinter import ttk
-import webbrowser
-from utils import center_window, display_errors, custom_messagebox
 import queue
-
-__version__ = 'timecode_converter v0.1'
+import sys
+from docopt import docopt
+from loguru import logger
+# GUI 相关模块（tkinter、webbrowser、utils）只在启动 GUI 时导入，命令行模式与被其他模块导入时只加载处理核心
+from sub_core import (FORMAT_ASS, FORMAT_SRT, FSYNC_BATCH, FSYNC_FILE, UNCHANGED, Timecodes, frame_mapping,
+                      fsync_policy, load_events, parse_data, parse_framerate, retime_text, set_fsync_policy, sync_files,
+                      write_events)
+from batch import largest_first, parse_jobs, run_batch
+from discovery import expand_inputs, output_directory
+from event_filter import compile_filter
+from metrics import METRICS_FORMATS, Report, current, emit, profiling, recording, stage
+from progress import CancelToken, ProgressBar
+
+__version__ = 'timecode_converter v0.2'
 
 USAGE = f"""
 {__version__}
 Usage:
-  timecode_converter --help
+  timecode_converter (--from <source_fps> | --from-timecodes <file>) (--to <target_fps> | --to-timecodes <file>) [--output-dir <dir>] [--jobs <n>] [--filter <expr>] [--metrics <format>] [--profile <file>] [--progress] [--fsync <policy>] [-r] [--include <glob>]... [--exclude <glob>]... [--format <name>] INPUTS...
   timecode_converter --version
+  timecode_converter (-h | --help)
+  timecode_converter
+
 Options:
+  --from <source_fps>                     源字幕匹配的视频帧率，例如 23.976 或 24000/1001。23.976、29.97 等按精确的 n*1000/1001 计算
+  --to <target_fps>                       目标视频帧率，例如 25
+  --from-timecodes <file>                 源字幕匹配的可变帧率视频的时间码文件（timecodes v2 格式，例如 mkvextract 导出的文件），代替 --from
+  --to-timecodes <file>                   目标可变帧率视频的时间码文件，代替 --to。转换时按帧号逐帧对应
+  -o --output-dir <dir>                   可选参数，输出目录。默认输出到源文件所在目录
+                                          输入目录中的文件在输出目录下保留相对于该目录的子目录结构
+  -j --jobs <n>                           可选参数，并行处理文件的进程数。默认为 CPU 核心数
+  --filter <expr>                         可选参数，只转换匹配过滤表达式的事件（语法见 sub_adjust --help），例如 "layer=0 and style=Default"
+  --metrics <format>                      可选参数，处理完成后输出各阶段耗时等性能统计：text（写入日志）或 json（写到标准输出，管道模式下写到标准错误）
+  --profile <file>                        可选参数，使用 cProfile 记录性能分析数据并保存到该文件（pstats 格式）。启用时在单进程中处理
+  --progress                              可选参数，在标准错误上显示进度条（已处理文件数、事件数与每秒处理的事件数）
+  --fsync <policy>                        可选参数，写入的落盘策略：file（每个文件写完立即落盘）、batch（全部处理完成后统一落盘）
+                                          或 none（交给操作系统）。默认为 file。输出文件已存在且内容相同时不会重写
+  -r --recursive                          可选参数，输入为目录时包含所有子目录
+  --include <glob>                        可选参数，只处理匹配该模式的文件，可重复指定
+  --exclude <glob>                        可选参数，跳过匹配该模式的文件或目录，可重复指定
+  --format <name>                         可选参数，标准输入的字幕格式（ass 或 srt）。默认根据内容判断
   --version                               显示版本信息
   -h --help                               显示帮助信息
+
+不带任何参数运行时启动GUI。转换后的文件名为 原文件名.目标帧率-converted.扩展名（目标为时间码文件时为 vfr），不会覆盖原文件。
+输入为 - 时从标准输入读取，结果写到标准输出（日志输出到标准错误），可用于管道。
+
+Examples (Python运行源码):
+  # 将 23.976 帧的字幕转换为匹配 25 帧视频的时间轴
+  python timecode_converter.py --from 23.976 --to 25 example.ass
+
+  # 将 23.976 帧的字幕转换为匹配可变帧率视频的时间轴
+  python timecode_converter.py --from 24000/1001 --to-timecodes timecodes.txt example.ass
+
+  # 使用4个进程转换 subs 目录及其子目录下的所有字幕，输出到 out 目录
+  python timecode_converter.py --from 25 --to 23.976 --jobs 4 --recursive --output-dir out subs
+
+  # 在管道中使用
+  cat example.srt | python timecode_converter.py --from 23.976 --to 25 - > converted.srt
 """
 
 COMMON_FRAMERATES = ["23.976", "24", "24.417", "25", "29.97", "30", "50", "59.94", "60", "120"]
 
-def parse_time_to_ms(time_str):
+def select(store, event_filter):
+    return None if event_filter is None else store.select(event_filter)
+
+def rate_label(rate):
     """
-    将时间格式 (h:mm:ss.cs) 转换为毫秒。
+    文件名中的帧率：保留三位小数（24000/1001 为 23.976，25 为 25.0），时间码文件为 vfr。
     """
-    h, m, s_cs = time_str.split(":")
-    s, cs = s_cs.split(".")
-
-    # 根据毫秒的实际位数处理
-    if len(cs) == 2:
-        cs = cs.ljust(3, '0')  # 补齐到三位（毫秒），如果不足三位则补0
-        ms = int(cs)
-    elif len(cs) == 3:
-        ms = int(cs)  # 直接是毫秒
-    else:
-        raise ValueError("Unsupported subtitle time format")
-
-    return max(0, (int(h) * 3600 + int(m) * 60 + int(s)) * 1000 + ms)
+    if isinstance(rate, Timecodes):
+        return 'vfr'
+    return str(round(float(rate), 3))
 
-def convert_time(time_str, source_rate, target_rate):
+def output_path(filepath, target_rate, output_dir=None):
     """
-    将时间格式根据源帧率和目标帧率转换。
+    转换后的文件路径：原文件名.目标帧率-converted.扩展名，默认与源文件位于同一目录。
     """
-    ms = parse_time_to_ms(time_str)
-    converted_ms = round(ms * (source_rate / target_rate))
-    h = int(converted_ms // 3600000)
-    m = int((converted_ms % 3600000) // 60000)
-    s = int((converted_ms % 60000) // 1000)
-    ms_remainder = int(converted_ms % 1000)
+    save_directory = output_dir or os.path.dirname(filepath)
+    return os.path.join(save_directory,
+                        f"{os.path.basename(filepath)}.{rate_label(target_rate)}-converted.{filepath.split('.')[-1]}")
 
-    if len(time_str.split('.')[-1]) == 2:
-        cs = str(round(ms_remainder / 10)).zfill(2)  # 保留两位 centiseconds，四舍五入
-        return f"{h}:{m:02}:{s:02}.{cs}"
+def convert_file(filepath, source_rate, target_rate, output_dir=None, event_filter=None):
+    """
+    进行帧率转换，返回 (转换后的文件路径, 是否写入了文件)：输出文件已存在且内容相同时不重写，是否写入为 False。
+    保留原始文件，出错时抛出异常。指定 event_filter 时只转换匹配的事件。
+    source_rate、target_rate 为帧率（Fraction，见 parse_rate）或 Timecodes。
+    """
+    import sub_vector
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    new_filepath = output_path(filepath, target_rate, output_dir)
+    mapping = frame_mapping(source_rate, target_rate)
+
+    # 安装了 numpy 时使用向量化引擎，输出与标量实现一致
+    if sub_vector.available():
+        store = sub_vector.load_events(filepath)
+        with stage('transform'):
+            sub_vector.retime_store(store, mapping, select(store, event_filter))
+        written = sub_vector.write_events(store, new_filepath)
     else:
-        return f"{h:02}:{m:02}:{s:02},{ms_remainder:03}"
+        store = load_events(filepath)
+        with stage('transform'):
+            store.retime(mapping, select(store, event_filter))
+        written = write_events(store, new_filepath)
+    return new_filepath, written
 
-def process_file(filepath, source_rate, target_rate):
+def convert_text(data, source_rate, target_rate, fmt=None, event_filter=None):
+    """
+    在内存中进行帧率转换：data 为 str、UTF-8 bytes 或可读取的流，返回与输入同类型的结果，不读写文件。
+    未指定 fmt 时根据内容判断格式。
     """
-    进行帧率转换的过程。保留原始文件，转换后的文件使用.transformed.作为名称后缀。
+    import sub_vector
+    mapping = frame_mapping(source_rate, target_rate)
+    if not sub_vector.available():
+        return retime_text(data, mapping, fmt, event_filter)
+    store, is_text = parse_data(data, fmt, sub_vector.parse_times)
+    with stage('transform'):
+        sub_vector.retime_store(store, mapping, select(store, event_filter))
+    with stage('format'):
+        result = ''.join(sub_vector.store_chunks(store))
+        if not is_text:
+            result = result.encode('utf-8')
+    return result
+
+def process_file(filepath, source_rate, target_rate, output_dir=None, event_filter=None):
+    """
+    convert_file 的包装，返回 (是否成功, 失败原因)，供批量处理使用。输出内容未变化时返回 (True, UNCHANGED)。
     """
     try:
-        with open(filepath, 'r', encoding='utf-8') as infile:
-            lines = infile.readlines()
-
-        new_lines = []
-        for line in lines:
-            if " --> " in line:  # 处理 SRT
-                start_time, end_time = line.split(" --> ")
-                new_start_time = convert_time(start_time, source_rate, target_rate)
-                new_end_time = convert_time(end_time, source_rate, target_rate)
-                new_lines.append(f"{new_start_time} --> {new_end_time}\n")
-            elif line.startswith("Dialogue: "):
-                parts = line.split(",", 9)
-                start_time, end_time = parts[1], parts[2]
-                parts[1] = convert_time(start_time, source_rate, target_rate)
-                parts[2] = convert_time(end_time, source_rate, target_rate)
-                new_lines.append(",".join(parts))
-            else:
-                new_lines.append(line)
-
-        save_directory = os.path.dirname(filepath)
-        new_filepath = os.path.join(save_directory, f"{os.path.basename(filepath)}.{target_rate}-converted.{filepath.split('.')[-1]}")
-        with open(new_filepath, 'w', encoding='utf-8') as outfile:
-            outfile.writelines(new_lines)
-
+        new_filepath, written = convert_file(filepath, source_rate, target_rate, output_dir, event_filter)
+        if not written:
+            logger.info(f"输出文件内容未变化，跳过写入: {new_filepath}")
+            return True, UNCHANGED
+        logger.info(f"成功处理文件: {filepath} -> {new_filepath}")
         return True, None
     except Exception as e:
+        logger.error(f"错误处理文件 {filepath}: {str(e)}")
         return False, str(e)
 
-def on_convert():
-    filepaths = selected_files_text.get('1.0', tk.END).strip().split('\n')
-    if not filepaths or filepaths == ['']:  # 检查是否选择了文件
-        messagebox.showerror("错误", "请先选择需要转换的字幕文件。")
-        return
-    # 表单检查
-    if not source_framerate_combo.get() or not target_framerate_combo.get():
-        messagebox.showerror("错误", "源帧率和目标帧率不能为空。")
-        return
-    try:
-        source_rate = float(source_framerate_combo.get())
-    except ValueError:
-        messagebox.showerror("错误", "源帧率必须是有效的数字。")
-        return
-    try:
-        target_rate = float(target_framerate_combo.get())
-    except ValueError:
-        messagebox.showerror("错误", "目标帧率必须是有效的数字。")
-        return
-
-    result_queue = queue.Queue()
-
-    def process_files():
-        total_files = len(filepaths)
-        success_count = 0
-        failure_count = 0
-        failure_reasons = []
+def convert_files(filepaths, source_rate, target_rate, jobs=None, output_dir=None, event_filter=None, report=None,
+                  progress=None, cancel=None, roots=()):
+    """
+    使用进程池并行转换多个字幕文件，返回 (文件总数, 成功数, [(文件, 失败原因)], 内容未变化而未重写的文件数)。
+    filepaths 为列表时大文件优先调度；为惰性迭代器（例如递归遍历目录）时边遍历边处理。
+    roots 为展开的输入目录，其中的文件在 output_dir 下保留子目录结构（见 discovery.output_directory）。
+    report、progress、cancel 的含义见 batch.run_batch。落盘策略为 batch 时，全部完成后统一 fsync 写入过的文件。
+    """
+    def make_task(filepath):
+        return filepath, source_rate, target_rate, output_directory(filepath, output_dir, roots), event_filter
 
-        for filepath in filepaths:
-            success, reason = process_file(filepath, source_rate, target_rate)
-            if success:
-                success_count += 1
-            else:
-                failure_count += 1
-                failure_reasons.append(f"{filepath}: {reason}")
-
-        result_message = (
-            f"运行完毕。\n"
-            f"共处理 {total_files} 个文件。\n"
-            f"成功处理 {success_count} 个文件。\n"
-            f"失败处理 {failure_count} 个文件。\n"
-        )
-
-        if failure_count > 0:
-            result_message += "\n失败原因:\n" + "\n".join(failure_reasons)
-            result_queue.put(result_message)
+    if isinstance(filepaths, list):
+        tasks = [make_task(filepath) for filepath in largest_first(filepaths)]
+    else:
+        tasks = (make_task(filepath) for filepath in filepaths)
+
+    total_files = 0
+    success_count = skipped_count = 0
+    failures = []
+    written = []
+    for (filepath, _, _, directory, _), success, reason in run_batch(process_file, tasks, jobs, report, progress,
+                                                                      cancel, initializer=set_fsync_policy,
+                                                                      initargs=(fsync_policy(),)):
+        total_files += 1
+        if not success:
+            failures.append((filepath, reason))
+            continue
+        success_count += 1
+        if reason == UNCHANGED:
+            skipped_count += 1
         else:
-            result_queue.put(result_message)
+            written.append(output_path(filepath, target_rate, directory))
+    if fsync_policy() == FSYNC_BATCH:
+        sync_files(written)
+    return total_files, success_count, failures, skipped_count
 
-    def check_queue():
-        try:
-            result_message = result_queue.get_nowait()
-            if result_message:
-                if "失败原因" in result_message:
-                    display_errors(root, result_message)
-                else:
-                    custom_messagebox(root, result_message)
-        except queue.Empty:
-            root.after(100, check_queue)
+def convert_stdio(source_rate, target_rate, fmt=None, event_filter=None):
+    """
+    从标准输入读取字幕、转换帧率后写到标准输出，返回是否成功。
+    """
+    try:
+        data = convert_text(sys.stdin.buffer, source_rate, target_rate, fmt, event_filter)
+        with stage('write'):
+            sys.stdout.buffer.write(data)
+            sys.stdout.buffer.flush()
+        record = current()
+        if record is not None:
+            record.bytes_out += len(data)
+        return True
+    except Exception as e:
+        logger.error(f"错误处理标准输入: {str(e)}")
+        return False
+
+def format_result(total_files, success_count, failures, skipped_count=0, cancelled=False):
+    result_message = (
+        f"运行完毕。\n"
+        f"共处理 {total_files} 个文件。\n"
+        f"成功处理 {success_count} 个文件。\n"
+        f"失败处理 {len(failures)} 个文件。\n"
+    )
+    if skipped_count:
+        result_message += f"其中 {skipped_count} 个文件的输出内容未变化，未重写。\n"
+    if cancelled:
+        result_message += "处理已取消，其余文件未处理。\n"
+
+    if failures:
+        result_message += "\n失败原因:\n" + "\n".join(f"{filepath}: {reason}" for filepath, reason in failures)
+    return result_message
+
+def parse_rate(value, name):
+    """
+    解析帧率，返回精确的 Fraction（见 sub_core.parse_framerate）。
+    """
+    try:
+        return parse_framerate(value)
+    except ValueError:
+        raise ValueError(f"{name}必须是大于 0 的数字或分数（例如 24000/1001）。") from None
 
-    threading.Thread(target=process_files, daemon=True).start()
-    root.after(100, check_queue)
+def load_timecodes(filepath, name):
+    try:
+        return Timecodes.load(filepath)
+    except OSError as e:
+        raise ValueError(f"无法读取{name}时间码文件: {e}") from None
+    except ValueError as e:
+        raise ValueError(f"{name}时间码文件 {filepath} 无效: {e}") from None
 
 def open_mail(event=None):
+    import webbrowser
     webbrowser.open("https://github.com/thelastfantasy/sub-adjust/issues")
 
 def show_usage(root):
+    import tkinter as tk
+    from tkinter import scrolledtext
+    from utils import center_window
+
     usage_window = tk.Toplevel(root)
     usage_window.title("命令行帮助")
 
@@ -170,54 +248,220 @@ def show_usage(root):
     center_window(usage_window)
 
 # GUI
-root = tk.Tk()
-root.title(f"{__version__} - 时间码转换工具")
-
-# Program explanation
-tk.Label(root, text="字幕帧率转换工具，支持ASS/SSA/SRT格式。", wraplength=400, justify=tk.LEFT).grid(row=0, column=0, columnspan=3, padx=10, pady=10)
-
-# File selection
-file_selection_label = tk.Label(root, text="选择字幕文件:")
-file_selection_label.grid(row=1, column=0, padx=10, pady=5, sticky=tk.E)
-
-def select_files():
-    filepaths = filedialog.askopenfilenames(title="选择需要转换的字幕文件", filetypes=[("Subtitle Files", "*.ass *.ssa *.srt")])
-    if filepaths:
-        selected_files_text.delete(1.0, tk.END)
-        selected_files_text.insert(tk.END, '\n'.join(filepaths))
-
-file_selection_button = tk.Button(root, text="选择文件", command=select_files)
-file_selection_button.grid(row=1, column=1, padx=10, pady=5, sticky=tk.W)
-
-# Selected files display
-selected_files_text = scrolledtext.ScrolledText(root, height=5, wrap=tk.WORD)
-selected_files_text.grid(row=2, column=0, columnspan=4, padx=10, pady=5, sticky=tk.W)
-
-# Source framerate
-source_framerate_combo = ttk.Combobox(root, values=COMMON_FRAMERATES)
-source_framerate_combo.set("23.976")
-tk.Label(root, text="源帧率:").grid(row=3, column=0, padx=10, pady=5, sticky=tk.E)
-source_framerate_combo.grid(row=3, column=1, padx=10, pady=5)
-
-# Target framerate
-target_framerate_combo = ttk.Combobox(root, values=COMMON_FRAMERATES)
-target_framerate_combo.set("")
-tk.Label(root, text="目标帧率:").grid(row=3, column=2, padx=10, pady=5, sticky=tk.E)
-target_framerate_combo.grid(row=3, column=3, padx=10, pady=5)
-
-# Convert button
-tk.Button(root, text="转换", command=on_convert).grid(row=4, columnspan=4, pady=10)
-
-# Contact author
-contact_label = tk.Label(root, text="反馈", fg="blue", cursor="hand2")
-contact_label.grid(row=5, column=0, columnspan=2, padx=10, pady=10, sticky=tk.W)
-contact_label.bind("<Button-1>", open_mail)
-contact_label.bind("<Enter>", lambda e: contact_label.config(fg="red"))
-contact_label.bind("<Leave>", lambda e: contact_label.config(fg="blue"))
-
-# Usage button
-# usage_button = tk.Button(root, text="命令行帮助", command=lambda: show_usage(root))
-# usage_button.grid(row=5, column=3, padx=10, pady=10, sticky=tk.E)
-
-center_window(root)
-root.mainloop()
+def start_ui():
+    import threading
+    import tkinter as tk
+    from tkinter import filedialog, messagebox, scrolledtext
+    from tkinter import ttk
+    from utils import (PROGRESS_BATCH_SIZE, PROGRESS_QUEUE_SIZE, ProgressPanel, center_window, custom_messagebox,
+                       display_errors, drain_queue)
+
+    root = tk.Tk()
+    root.title(f"{__version__} - 时间码转换工具")
+
+    # 一次转换中的进度事件队列与取消标记
+    running = {}
+
+    def on_convert():
+        if running:
+            return  # 上一次转换尚未结束
+        filepaths = selected_files_text.get('1.0', tk.END).strip().split('\n')
+        if not filepaths or filepaths == ['']:  # 检查是否选择了文件
+            messagebox.showerror("错误", "请先选择需要转换的字幕文件。")
+            return
+        # 表单检查
+        if not source_framerate_combo.get() or not target_framerate_combo.get():
+            messagebox.showerror("错误", "源帧率和目标帧率不能为空。")
+            return
+        try:
+            source_rate = parse_rate(source_framerate_combo.get(), "源帧率")
+            target_rate = parse_rate(target_framerate_combo.get(), "目标帧率")
+        except ValueError as e:
+            messagebox.showerror("错误", str(e))
+            return
+
+        result_queue = queue.Queue()
+        # 有界队列：界面来不及显示时工作线程在 put 处等待，避免事件无限堆积
+        events = queue.Queue(maxsize=PROGRESS_QUEUE_SIZE)
+        cancel = CancelToken()
+        running.update(events=events, cancel=cancel)
+        convert_button.config(state=tk.DISABLED)
+        cancel_button.config(state=tk.NORMAL)
+        progress_panel.start()
+
+        def process_files():
+            result = convert_files(filepaths, source_rate, target_rate, progress=events.put, cancel=cancel)
+            result_queue.put(format_result(*result, cancelled=cancel.cancelled()))
+
+        def check_queue():
+            # 每次只取一批进度事件，大批量转换时不会占满界面线程
+            progress_panel.update(drain_queue(events, PROGRESS_BATCH_SIZE))
+            if not events.empty():
+                root.after(100, check_queue)
+                return
+            try:
+                result_message = result_queue.get_nowait()
+            except queue.Empty:
+                root.after(100, check_queue)
+                return
+            running.clear()
+            convert_button.config(state=tk.NORMAL)
+            cancel_button.config(state=tk.DISABLED)
+            progress_panel.finish("已取消" if cancel.cancelled() else None)
+            if result_message:
+                if "失败原因" in result_message:
+                    display_errors(root, result_message)
+                else:
+                    custom_messagebox(root, result_message)
+
+        threading.Thread(target=process_files, daemon=True).start()
+        root.after(100, check_queue)
+
+    def on_cancel():
+        if running:
+            running['cancel'].cancel()
+            cancel_button.config(state=tk.DISABLED)
+
+    # Program explanation
+    tk.Label(root, text="字幕帧率转换工具，支持ASS/SSA/SRT格式。", wraplength=400, justify=tk.LEFT).grid(row=0, column=0, columnspan=3, padx=10, pady=10)
+
+    # File selection
+    file_selection_label = tk.Label(root, text="选择字幕文件:")
+    file_selection_label.grid(row=1, column=0, padx=10, pady=5, sticky=tk.E)
+
+    def select_files():
+        filepaths = filedialog.askopenfilenames(title="选择需要转换的字幕文件", filetypes=[("Subtitle Files", "*.ass *.ssa *.srt")])
+        if filepaths:
+            selected_files_text.delete(1.0, tk.END)
+            selected_files_text.insert(tk.END, '\n'.join(filepaths))
+
+    file_selection_button = tk.Button(root, text="选择文件", command=select_files)
+    file_selection_button.grid(row=1, column=1, padx=10, pady=5, sticky=tk.W)
+
+    # Selected files display
+    selected_files_text = scrolledtext.ScrolledText(root, height=5, wrap=tk.WORD)
+    selected_files_text.grid(row=2, column=0, columnspan=4, padx=10, pady=5, sticky=tk.W)
+
+    # Source framerate
+    source_framerate_combo = ttk.Combobox(root, values=COMMON_FRAMERATES)
+    source_framerate_combo.set("23.976")
+    tk.Label(root, text="源帧率:").grid(row=3, column=0, padx=10, pady=5, sticky=tk.E)
+    source_framerate_combo.grid(row=3, column=1, padx=10, pady=5)
+
+    # Target framerate
+    target_framerate_combo = ttk.Combobox(root, values=COMMON_FRAMERATES)
+    target_framerate_combo.set("")
+    tk.Label(root, text="目标帧率:").grid(row=3, column=2, padx=10, pady=5, sticky=tk.E)
+    target_framerate_combo.grid(row=3, column=3, padx=10, pady=5)
+
+    # Convert / cancel buttons
+    button_frame = tk.Frame(root)
+    button_frame.grid(row=4, columnspan=4, pady=10)
+    convert_button = tk.Button(button_frame, text="转换", command=on_convert)
+    convert_button.pack(side=tk.LEFT, padx=5)
+    cancel_button = tk.Button(button_frame, text="取消", command=on_cancel, state=tk.DISABLED)
+    cancel_button.pack(side=tk.LEFT, padx=5)
+
+    # Progress
+    progress_panel = ProgressPanel(root, row=5, columnspan=4)
+
+    # Contact author
+    contact_label = tk.Label(root, text="反馈", fg="blue", cursor="hand2")
+    contact_label.grid(row=7, column=0, columnspan=2, padx=10, pady=10, sticky=tk.W)
+    contact_label.bind("<Button-1>", open_mail)
+    contact_label.bind("<Enter>", lambda e: contact_label.config(fg="red"))
+    contact_label.bind("<Leave>", lambda e: contact_label.config(fg="blue"))
+
+    # Usage button
+    usage_button = tk.Button(root, text="命令行帮助", command=lambda: show_usage(root))
+    usage_button.grid(row=7, column=3, padx=10, pady=10, sticky=tk.E)
+
+    center_window(root)
+    root.mainloop()
+
+def main():
+    # 使用 options_first=True 确保没有参数时不会直接触发 Usage 输出
+    args = docopt(USAGE, version=__version__, options_first=True)
+
+    if args["--version"]:
+        logger.info(__version__)
+        return
+
+    if not args["--from"] and not args["--from-timecodes"]:
+        from utils import hide_console
+        hide_console()
+        logger.info("正在启动GUI...")
+        start_ui()
+        return
+
+    try:
+        if args["--from-timecodes"]:
+            source_rate = load_timecodes(args["--from-timecodes"], "源")
+        else:
+            source_rate = parse_rate(args["--from"], "源帧率")
+        if args["--to-timecodes"]:
+            target_rate = load_timecodes(args["--to-timecodes"], "目标")
+        else:
+            target_rate = parse_rate(args["--to"], "目标帧率")
+        jobs = parse_jobs(args["--jobs"])
+        event_filter = compile_filter(args["--filter"]) if args["--filter"] else None
+        set_fsync_policy(args["--fsync"] or FSYNC_FILE)
+    except ValueError as e:
+        logger.error(str(e))
+        return
+
+    fmt = args["--format"]
+    if fmt not in (None, FORMAT_ASS, FORMAT_SRT):
+        logger.error(f"未知的字幕格式: {fmt}，可选值为 {FORMAT_ASS}, {FORMAT_SRT}")
+        return
+    metrics_format = args["--metrics"]
+    if metrics_format not in (None, *METRICS_FORMATS):
+        logger.error(f"未知的统计输出格式: {metrics_format}，可选值为 {', '.join(METRICS_FORMATS)}")
+        return
+    report = Report() if metrics_format else None
+    if args["--profile"]:
+        # 工作进程中的调用无法被主进程的 cProfile 记录，分析时在当前进程中逐个处理
+        jobs = 1
+
+    filepaths = args["INPUTS"]
+    is_stdio = '-' in filepaths
+    if is_stdio and len(filepaths) > 1:
+        logger.error("- 表示标准输入/输出，只能单独使用")
+        return
+
+    with profiling(args["--profile"]):
+        if is_stdio:
+            if report is None:
+                convert_stdio(source_rate, target_rate, fmt, event_filter)
+            else:
+                with recording('-') as record:
+                    record.ok = convert_stdio(source_rate, target_rate, fmt, event_filter)
+                report.add(record)
+        else:
+            output_dir = args["--output-dir"]
+            if output_dir:
+                os.makedirs(output_dir, exist_ok=True)
+
+            roots = [path for path in filepaths if os.path.isdir(path)]
+            if roots:
+                filepaths = expand_inputs(filepaths, recursive=args["--recursive"],
+                                          include=args["--include"], exclude=args["--exclude"])
+            progress = ProgressBar() if args["--progress"] else None
+            total_files, success_count, failures, skipped_count = convert_files(
+                filepaths, source_rate, target_rate, jobs, output_dir, event_filter, report, progress, roots=roots)
+            if progress is not None:
+                progress.close()
+
+            log_result_fn = logger.info if success_count > 0 else logger.error
+            log_result_fn(f"\n\n{format_result(total_files, success_count, failures, skipped_count)}")
+    if args["--profile"]:
+        logger.info(f"性能分析结果已保存到 {args['--profile']}，可使用 python -m pstats {args['--profile']} 查看")
+    if report is not None:
+        # 标准输出被字幕内容占用时，JSON 统计写到标准错误
+        emit(report, metrics_format, logger.info, sys.stderr if is_stdio else sys.stdout)
+
+if __name__ == "__main__":
+    import multiprocessing
+    # 打包为可执行文件后，进程池的子进程需要此调用才能正常启动
+    multiprocessing.freeze_support()
+    main()
@@ -1,10 +1,7 @@
 
 import platform
-import winsound
-import tkinter as tk
-from tkinter import scrolledtext
-import chardet
 import sys
+from sub_core import detect_encoding
 
 def hide_console():
     """在 Windows 下隐藏控制台窗口"""
@@ -15,12 +12,6 @@ def hide_console():
             ctypes.windll.user32.ShowWindow(whnd, 0)
             ctypes.windll.kernel32.CloseHandle(whnd)
 
-def detect_encoding(file_path):
-    with open(file_path, 'rb') as f:
-        raw_data = f.read()
-    result = chardet.detect(raw_data)
-    return result['encoding']
-
 def center_window(window):
     window.update_idletasks()
     screen_width = window.winfo_screenwidth()
@@ -33,6 +24,7 @@ def center_window(window):
 def play_system_sound():
     system = platform.system()
     if system == "Windows":
+        import winsound
         winsound.MessageBeep(winsound.MB_OK)
     elif system == "Linux":
         pass  # Linux sound handling can be added if needed
@@ -40,6 +32,7 @@ def play_system_sound():
         pass  # macOS sound handling can be added if needed
 
 def custom_messagebox(root, message):
+    import tkinter as tk
     play_system_sound()
     custom_box = tk.Toplevel(root)
     custom_box.title("处理结果")
@@ -54,6 +47,8 @@ def custom_messagebox(root, message):
     root.wait_window(custom_box)
 
 def display_errors(root, infos):
+    import tkinter as tk
+    from tkinter import scrolledtext
     play_system_sound()
     error_window = tk.Toplevel(root)
     error_window.title("错误信息")
@@ -62,4 +57,65 @@ def display_errors(root, infos):
     error_text.config(state='normal')
     error_text.insert(tk.END, infos)
     error_text.config(state='disabled')
-    center_window(error_window)
\ No newline at end of file
+    center_window(error_window)
+
+# 界面进度事件队列的容量，以及每次刷新界面时最多处理的事件数
+PROGRESS_QUEUE_SIZE = 1000
+PROGRESS_BATCH_SIZE = 200
+
+def drain_queue(q, limit):
+    """从队列中一次取出最多 limit 个元素，不阻塞。"""
+    import queue
+    items = []
+    while len(items) < limit:
+        try:
+            items.append(q.get_nowait())
+        except queue.Empty:
+            break
+    return items
+
+class ProgressPanel:
+    """
+    界面中的进度条与状态文字，由 progress.ProgressEvent 驱动。
+    文件总数已知时显示确定进度，边遍历边处理时显示来回滚动的不确定进度。
+    """
+
+    def __init__(self, root, row, columnspan):
+        import tkinter as tk
+        from tkinter import ttk
+        self.bar = ttk.Progressbar(root, mode='determinate', maximum=1.0)
+        self.bar.grid(row=row, column=0, columnspan=columnspan, padx=10, pady=(5, 0), sticky='ew')
+        self.status = tk.StringVar(value="")
+        tk.Label(root, textvariable=self.status, anchor='w').grid(row=row + 1, column=0, columnspan=columnspan,
+                                                                   padx=10, sticky='w')
+        self.tracker = None
+
+    def start(self):
+        from progress import ProgressTracker
+        self.tracker = ProgressTracker()
+        self.bar.stop()
+        self.bar.config(mode='determinate', value=0)
+        self.status.set("正在处理…")
+
+    def update(self, events):
+        if not events or self.tracker is None:
+            return
+        for event in events:
+            self.tracker.update(event)
+        fraction = self.tracker.fraction()
+        if fraction is None:
+            if str(self.bar.cget('mode')) != 'indeterminate':
+                self.bar.config(mode='indeterminate')
+                self.bar.start(20)
+        else:
+            self.bar.config(value=fraction)
+        self.status.set(self.tracker.describe())
+
+    def finish(self, message=None):
+        self.bar.stop()
+        self.bar.config(mode='determinate', value=1.0 if self.tracker and self.tracker.done else 0)
+        if message is not None:
+            self.status.set(message)
+        elif self.tracker is not None:
+            self.status.set(self.tracker.describe())
+        self.tracker = None
@@ -0,0 +1,290 @@
+import os
+import struct
+import sys
+import time
+from discovery import is_excluded, is_output, is_selected
+from sub_core import SUBTITLE_EXTENSIONS
+
+# 监视后端：Linux 下使用 inotify（通过 ctypes 调用 libc，无需额外依赖），其他系统或 inotify 不可用时定时轮询
+BACKEND_INOTIFY = 'inotify'
+BACKEND_POLL = 'poll'
+
+# 文件在这段时间（秒）内大小与修改时间都没有变化才视为写入完成，避免处理复制或下载到一半的文件
+WATCH_SETTLE = 0.3
+# 轮询后端的扫描间隔（秒）
+WATCH_POLL_INTERVAL = 0.25
+
+# inotify 事件掩码（见 <sys/inotify.h>）
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ONLYDIR = 0x01000000
+_IN_ISDIR = 0x40000000
+_WATCH_MASK = _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE | _IN_ONLYDIR
+# struct inotify_event：wd、mask、cookie、len，其后为以 NUL 补齐的文件名
+_EVENT = struct.Struct('iIII')
+_READ_SIZE = 64 * 1024
+
+
+def _signature(path):
+    # 文件替换（os.replace）后 inode 会变化，即使大小与修改时间恰好相同也能识别
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns, st.st_ino
+
+
+class _Inotify:
+    """
+    通过 ctypes 调用 inotify，只监视目录（非递归，子目录需分别添加）。
+    """
+
+    def __init__(self, libc, fd):
+        self.libc = libc
+        self.fd = fd
+
+    @classmethod
+    def create(cls):
+        """
+        不支持 inotify 时返回 None。
+        """
+        if not sys.platform.startswith('linux'):
+            return None
+        try:
+            import ctypes
+            libc = ctypes.CDLL(None, use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        except (OSError, AttributeError):
+            return None
+        return cls(libc, fd) if fd >= 0 else None
+
+    def add(self, directory):
+        """
+        添加目录监视，返回监视描述符；失败（例如超出 max_user_watches）时返回 None。
+        """
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), _WATCH_MASK)
+        return wd if wd >= 0 else None
+
+    def read(self, timeout):
+        """
+        等待最多 timeout 秒，返回 [(监视描述符, 事件掩码, 文件名)]。
+        """
+        import select
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self.fd, _READ_SIZE)
+        except BlockingIOError:
+            return []
+        events = []
+        pos = 0
+        while pos + _EVENT.size <= len(data):
+            wd, mask, _cookie, length = _EVENT.unpack_from(data, pos)
+            pos += _EVENT.size
+            name = os.fsdecode(data[pos:pos + length].rstrip(b'\0'))
+            pos += length
+            events.append((wd, mask, name))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class Watcher:
+    """
+    监视目录（recursive 为 True 时包括子目录）中新增或修改的文件，选择规则同 discovery.iter_subtitle_files，
+    并跳过 discovery.OUTPUT_MARKERS 标记的输出文件。启动时已存在的文件视为已处理。
+
+    inotify 可用时只在收到事件后检查对应的文件，无需反复扫描目录；否则每隔 poll_interval 秒用 os.scandir 扫描，
+    与缓存的 (大小, 修改时间, inode) 比较找出变化的文件。文件需保持 settle 秒不变才会由 changes() 返回。
+    """
+
+    def __init__(self, directories, extensions=SUBTITLE_EXTENSIONS, recursive=False, include=None, exclude=None,
+                 settle=WATCH_SETTLE, poll_interval=WATCH_POLL_INTERVAL, use_inotify=True):
+        self.roots = [os.path.abspath(directory) for directory in directories]
+        for root in self.roots:
+            if not os.path.isdir(root):
+                raise ValueError(f"监视的路径不是目录: {root}")
+        self.extensions = tuple(ext.lower() for ext in extensions)
+        self.recursive = recursive
+        self.include = list(include or [])
+        self.exclude = list(exclude or [])
+        self.settle = settle
+        self.poll_interval = poll_interval
+        # 文件路径 -> 最近一次处理（或启动时）的签名
+        self.known = {}
+        # 文件路径 -> (最近一次看到的签名, 最近一次变化的时间)
+        self.pending = {}
+        # 监视描述符 -> (监视的根目录, 目录)
+        self.watches = {}
+        self.inotify = _Inotify.create() if use_inotify else None
+        self.next_poll = 0.0
+        for root in self.roots:
+            self._add_tree(root, root, prime=True)
+
+    @property
+    def backend(self):
+        return BACKEND_INOTIFY if self.inotify is not None else BACKEND_POLL
+
+    def _relpath(self, root, path):
+        return os.path.relpath(path, root).replace(os.sep, '/')
+
+    def _walk(self, root, directory, before=None):
+        # 产出 (目录, [目录中选中的文件])：directory 本身以及（递归时）其中未被排除的子目录。
+        # before(目录) 在扫描每个目录之前调用，先添加监视再扫描，不会漏掉两者之间写入的文件
+        visited = set()
+        stack = [directory]
+        while stack:
+            current = stack.pop()
+            try:
+                st = os.stat(current)
+                if (st.st_dev, st.st_ino) in visited:
+                    continue
+                visited.add((st.st_dev, st.st_ino))
+                if before is not None:
+                    before(current)
+                files = []
+                with os.scandir(current) as entries:
+                    for entry in entries:
+                        relpath = self._relpath(root, entry.path)
+                        if entry.is_dir():
+                            if self.recursive and not is_excluded(relpath, self.exclude):
+                                stack.append(entry.path)
+                        elif self._selected(relpath):
+                            files.append(entry.path)
+            except OSError:
+                continue
+            yield current, files
+
+    def _selected(self, relpath):
+        if not self.recursive and '/' in relpath:
+            return False
+        return is_selected(relpath, self.extensions, self.include, self.exclude) and not is_output(relpath)
+
+    def _add_tree(self, root, directory, prime=False):
+        """
+        监视 directory（递归时包括子目录）。prime 为 True 时其中已有的文件视为已处理，否则作为新文件等待处理。
+        """
+        def add_watch(current):
+            if self.inotify is None:
+                return
+            wd = self.inotify.add(current)
+            if wd is None:
+                # 无法继续添加监视时改为轮询，此后不再依赖 inotify 事件
+                self.inotify.close()
+                self.inotify = None
+                self.watches.clear()
+            else:
+                self.watches[wd] = (root, current)
+
+        for _current, files in self._walk(root, directory, add_watch):
+            for path in files:
+                if prime:
+                    self.known[path] = _signature(path)
+                else:
+                    self._touch(path)
+
+    def _touch(self, path, now=None):
+        signature = _signature(path)
+        if signature is None:
+            return
+        entry = self.pending.get(path)
+        if entry is not None:
+            if entry[0] != signature:
+                self.pending[path] = (signature, time.monotonic() if now is None else now)
+        elif signature != self.known.get(path):
+            self.pending[path] = (signature, time.monotonic() if now is None else now)
+
+    def _poll(self):
+        now = time.monotonic()
+        for root in self.roots:
+            for _directory, files in self._walk(root, root):
+                for path in files:
+                    self._touch(path, now)
+
+    def _read_events(self, timeout):
+        for wd, mask, name in self.inotify.read(timeout):
+            if mask & _IN_Q_OVERFLOW:
+                # 事件队列溢出，丢失的事件只能通过一次完整扫描找回
+                self._poll()
+                continue
+            if mask & _IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+            watch = self.watches.get(wd)
+            if watch is None or not name:
+                continue
+            root, directory = watch
+            path = os.path.join(directory, name)
+            relpath = self._relpath(root, path)
+            if mask & _IN_ISDIR:
+                if mask & (_IN_CREATE | _IN_MOVED_TO) and self.recursive and not is_excluded(relpath, self.exclude):
+                    # 新目录中可能在添加监视之前就已写入了文件，一并检查
+                    self._add_tree(root, path)
+                    if self.inotify is None:
+                        return
+            elif self._selected(relpath):
+                self._touch(path)
+
+    def changes(self, timeout):
+        """
+        等待最多 timeout 秒（有即将稳定的文件时提前返回），返回已稳定的新增或修改文件的路径。
+        """
+        now = time.monotonic()
+        if self.pending:
+            due = min(since for _signature, since in self.pending.values()) + self.settle
+            timeout = min(timeout, max(0.0, due - now))
+        if self.inotify is not None:
+            self._read_events(timeout)
+        else:
+            if now < self.next_poll:
+                time.sleep(min(timeout, self.next_poll - now))
+            if time.monotonic() >= self.next_poll:
+                self._poll()
+                self.next_poll = time.monotonic() + self.poll_interval
+        return self._settled()
+
+    def _settled(self):
+        now = time.monotonic()
+        ready = []
+        for path, (signature, since) in list(self.pending.items()):
+            if now - since < self.settle:
+                continue
+            current = _signature(path)
+            if current != signature:
+                # 仍在写入，或已被删除、移走
+                if current is None:
+                    del self.pending[path]
+                else:
+                    self.pending[path] = (current, now)
+                continue
+            del self.pending[path]
+            # 与处理后的结果相同（例如处理时自己写回的文件）时不再处理
+            if current != self.known.get(path):
+                self.known[path] = current
+                ready.append(path)
+        return ready
+
+    def defer(self, path):
+        """
+        文件仍在处理中时推迟到下一个稳定周期再检查。
+        """
+        self.pending[path] = (_signature(path), time.monotonic())
+
+    def processed(self, path):
+        """
+        处理完成后记录文件的当前签名：处理时写回原文件产生的变化不会再次触发处理。
+        """
+        signature = _signature(path)
+        if signature is not None:
+            self.known[path] = signature
+
+    def close(self):
+        if self.inotify is not None:
+            self.inotify.close()
+            self.inotify = None